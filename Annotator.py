@@ -0,0 +1,189 @@
+'''
+Annotates recorded games with the engine's opinion of every move. Requires
+NumPy for the output file.
+    python Annotator.py games.txt annotations.npz [--depth 4] [--workers <n>] [--blunder 50]
+        Reads the games of a records file like the one of Tuning.py, one
+        game per line, the moves written like in Engine.py (see
+        Board.opCodeHistory / Engine.playedMoves), optionally preceded by
+        the result. The games are annotated in parallel, one game per task
+        of a process pool. All processes share one cache (see
+        SharedCache.py). The positions of a game are searched one after
+        the other in the same process, so each search starts with the
+        results of the previous ones.
+The output file holds one column per value (see columns), with one row
+per move, in the order of the games and moves. Read it with
+readAnnotations. The scores are from the view of the player, who made the
+move. loss is the difference between the score of the best move and the
+one of the played move, moves losing at least blunderLoss are flagged as
+blunders.
+'''
+import argparse
+from array import array
+from collections import deque
+import os
+import time
+
+from Engine import moveToText, textToMove
+from GameBoard import Board, invertPieceType
+import MinMax
+from PositionCache import PositionCache
+
+
+# results at the beginning of a record (see Tuning.results)
+resultTexts = ("1-0", "0-1", "1/2-1/2")
+
+# moves losing at least that much against the best move are blunders
+# (about a muehle or two pieces in the move phase)
+blunderLoss = 50
+
+# name, type code of the array collecting it and NumPy type of the columns
+columns = [
+    ("game", "l", "int32"),
+    ("ply", "l", "int16"),
+    ("player", "b", "int8"),
+    ("move", "l", "uint16"),
+    ("bestMove", "l", "uint16"),
+    ("score", "q", "int64"),
+    ("bestScore", "q", "int64"),
+    ("loss", "q", "int64"),
+    ("blunder", "b", "bool"),
+    ("depth", "b", "int8"),
+    ("nodes", "l", "int32"),
+]
+
+def readGames (path):
+    '''
+    Yields the moves of every game of the records file
+    '''
+    with open(path) as recordsFile:
+        for line in recordsFile:
+            tokens = line.split()
+            if len(tokens) > 0 and tokens[0] in resultTexts:
+                tokens = tokens[1:]
+            if len(tokens) > 0:
+                yield [textToMove(text) for text in tokens]
+
+def annotateGame (moves, depth, cache=None, lossThreshold=None):
+    '''
+    Searches the position before every move. Returns one row per move:
+    (ply, player, move, best move, score, best score, loss, blunder, depth, nodes).
+    Runs in a worker process of annotate.
+    '''
+    if lossThreshold == None:
+        lossThreshold = blunderLoss
+    if cache == None:
+        cache = PositionCache()
+    board = Board()
+    pieceType = Board.White
+    rows = []
+    for ply in range(len(moves)):
+        move = moves[ply]
+        search = MinMax.Search()
+        lines = MinMax.analyse(board, pieceType, depth, 1, search, cache)
+        if len(lines) == 0:
+            raise ValueError("No move possible before " + moveToText(move))
+        bestMove = lines[0]["move"]
+        bestScore = lines[0]["score"]
+        if move == bestMove:
+            score = bestScore
+        else:
+            score = MinMax.moveScore(board, pieceType, move, depth, cache, search)
+        # The selective search may score the played move a bit
+        # higher than the best one
+        loss = max(0, bestScore - score)
+        rows.append((ply, pieceType, move, bestMove, score, bestScore, loss,
+                     loss >= lossThreshold, depth, search.nodes))
+
+        if (move >> 4) & 3 != pieceType or not board.executeMove(move):
+            raise ValueError("Illegal move " + moveToText(move))
+        # A turn ends, when no piece has to be removed
+        if not MinMax.isRemovePhase(board):
+            board.checkBoardState(invertPieceType(pieceType), False)
+            pieceType = invertPieceType(pieceType)
+    return rows
+
+class Annotations (object):
+    '''
+    Collects the rows of the annotated games column by column
+    '''
+
+    def __init__ (self):
+        self.columns = [array(typeCode) for name, typeCode, numpyType in columns]
+
+    def add (self, game, rows):
+        for row in rows:
+            self.columns[0].append(game)
+            for i in range(len(row)):
+                self.columns[i + 1].append(row[i])
+
+    def __len__ (self):
+        return len(self.columns[0])
+
+    def column (self, name):
+        return self.columns[[column[0] for column in columns].index(name)]
+
+    def write (self, path):
+        import numpy as np
+        np.savez_compressed(path, **{columns[i][0]: np.array(self.columns[i], dtype=columns[i][2])
+                                     for i in range(len(columns))})
+
+def readAnnotations (path):
+    '''
+    Returns a dict: column name -> NumPy array
+    '''
+    import numpy as np
+    with np.load(path) as annotations:
+        return {name: annotations[name] for name, typeCode, numpyType in columns}
+
+def annotate (recordsPath, outPath, depth, workers=None, cacheEntries=1 << 21, lossThreshold=None):
+    '''
+    Annotates all games of the records file and writes the output file.
+    Only a few games per process are read ahead, so the records file
+    may be larger than the memory. Returns the annotations.
+    '''
+    from SharedCache import SharedPositionCache
+    if workers == None:
+        workers = os.cpu_count() or 1
+    annotations = Annotations()
+    cache = SharedPositionCache(maxEntries=cacheEntries)
+    try:
+        if workers <= 1:
+            for game, moves in enumerate(readGames(recordsPath)):
+                annotations.add(game, annotateGame(moves, depth, cache, lossThreshold))
+        else:
+            with MinMax.processPool(workers) as executor:
+                pending = deque()
+                for game, moves in enumerate(readGames(recordsPath)):
+                    pending.append((game, executor.submit(annotateGame, moves, depth, cache, lossThreshold)))
+                    if len(pending) >= 2 * workers:
+                        game, result = pending.popleft()
+                        annotations.add(game, result.result())
+                while len(pending) > 0:
+                    game, result = pending.popleft()
+                    annotations.add(game, result.result())
+    finally:
+        cache.close()
+    annotations.write(outPath)
+    return annotations
+
+def main ():
+    parser = argparse.ArgumentParser(description="Annotates recorded games with the engine's opinion")
+    parser.add_argument("records")
+    parser.add_argument("out", help="output file (NumPy .npz)")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    parser.add_argument("--blunder", type=int, default=blunderLoss, help="score loss of a blunder")
+    parser.add_argument("--cacheEntries", type=int, default=1 << 21, help="entries of the shared cache")
+    parser.add_argument("--weights", default=MinMax.defaultWeightsPath,
+                        help="file of evaluation weights written by Tuning.py, used if it exists")
+    args = parser.parse_args()
+
+    if os.path.exists(args.weights):
+        MinMax.loadEvaluationWeights(args.weights)
+    startTime = time.time()
+    annotations = annotate(args.records, args.out, args.depth, args.workers, args.cacheEntries, args.blunder)
+    blunders = sum(annotations.column("blunder"))
+    print("%d moves annotated in %.1f seconds, %d blunders" % (len(annotations), time.time() - startTime, blunders))
+
+if __name__ == "__main__":
+    main()
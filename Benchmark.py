@@ -0,0 +1,708 @@
+'''
+Benchmarks for the engine and its services. Run them with
+    python Benchmark.py [name ...] [--json results.json]
+Without names, all benchmarks are run. Every benchmark returns a dict of
+measurements, which is printed and optionally written to a JSON file, so
+results of different versions can be compared.
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from GameBoard import Board, invertPieceType
+
+
+benchmarks = {}
+
+def benchmark (function):
+    '''
+    Registers a benchmark under the name of the function
+    '''
+    benchmarks[function.__name__] = function
+    return function
+
+def percentile (values, fraction):
+    if len(values) == 0:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+@benchmark
+def service (games=16, workers=4, depth=3, deadline=2000, maxTurns=120):
+    '''
+    Plays games against itself through the EngineService. Measures the
+    throughput in games per second and the latency of single moves.
+    '''
+    import asyncio
+    from Engine import textToMove
+    from EngineService import EngineService, ServiceClient
+
+    latencies = []
+    errors = []
+
+    async def playGame (client, game):
+        board = Board()
+        pieceType = Board.White
+        moves = []
+        turns = 0
+        while (board.gamePhase in (Board.PieceSetPhase, Board.PieceMovePhase,
+                                   Board.PieceSetRemovePhase, Board.PieceMoveRemovePhase)
+               and turns < maxTurns):
+            startTime = time.time()
+            answer = await client.bestMove(game, moves, depth, deadline)
+            latencies.append(time.time() - startTime)
+            if "error" in answer or answer["move"] == None:
+                errors.append(answer.get("error"))
+                return
+
+            move = textToMove(answer["move"])
+            board.executeMove(move)
+            moves.append(move)
+            if (board.gamePhase != Board.PieceSetRemovePhase
+                and board.gamePhase != Board.PieceMoveRemovePhase):
+                board.checkBoardState(invertPieceType(pieceType), False)
+                pieceType = invertPieceType(pieceType)
+                turns += 1
+
+    async def run ():
+        engineService = EngineService(workers)
+        port = await engineService.start()
+        client = ServiceClient()
+        await client.connect("127.0.0.1", port)
+
+        startTime = time.time()
+        await asyncio.gather(*[playGame(client, "game" + str(i)) for i in range(games)])
+        duration = time.time() - startTime
+
+        await client.close()
+        await engineService.close()
+        return duration
+
+    duration = asyncio.run(run())
+    return {
+        "games": games,
+        "workers": workers,
+        "gamesPerSecond": games / duration,
+        "moves": len(latencies),
+        "latencyP50": percentile(latencies, 0.5),
+        "latencyP99": percentile(latencies, 0.99),
+        "errors": len(errors),
+    }
+
+@benchmark
+def imports (modules=("GameBoard", "MinMax", "PositionCache", "Player", "Engine", "HeadlessGame"),
+             heavyModules=("PyQt5", "asyncio", "sqlite3", "argparse", "subprocess"), repeats=5):
+    '''
+    Imports each module in a fresh interpreter. Measures the import time
+    (best of repeats, as reported by python -X importtime) and lists the
+    heavy modules, which got imported along.
+    '''
+    path = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in modules:
+        code = ("import sys, %s; print(' '.join(name for name in %r if name in sys.modules))"
+                % (module, heavyModules))
+        bestTime = None
+        for i in range(repeats):
+            process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=path,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     universal_newlines=True)
+            # Lines look like: import time: self [us] | cumulative | imported package
+            cumulative = 0
+            for line in process.stderr.splitlines():
+                fields = line.split("|")
+                if len(fields) == 3 and fields[2].strip() == module:
+                    cumulative = int(fields[1])
+            if bestTime == None or cumulative < bestTime:
+                bestTime = cumulative
+        results[module + "Ms"] = bestTime / 1000
+        results[module + "Loads"] = process.stdout.split()
+    return results
+
+def selfPlayMoves (depth, maxTurns):
+    '''
+    Moves of a game the engine plays against itself
+    '''
+    import MinMax
+    board = Board()
+    pieceType = Board.White
+    turns = 0
+    while (board.gamePhase in (Board.PieceSetPhase, Board.PieceMovePhase,
+                               Board.PieceSetRemovePhase, Board.PieceMoveRemovePhase)
+           and turns < maxTurns):
+        board.executeMove(MinMax.bestNextMove(board, pieceType, depth))
+        if (board.gamePhase != Board.PieceSetRemovePhase
+            and board.gamePhase != Board.PieceMoveRemovePhase):
+            board.checkBoardState(invertPieceType(pieceType), False)
+            pieceType = invertPieceType(pieceType)
+            turns += 1
+    return [move for move in board.opCodeHistory if (move & 15) <= Board.OpRemove]
+
+def randomPositions (count, minTurns=4, maxTurns=40, seed=0):
+    '''
+    Positions after random games of different lengths,
+    as (board, player to move)
+    '''
+    import random
+    import MinMax
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = Board()
+        pieceType = Board.White
+        turns = rng.randint(minTurns, maxTurns)
+        while turns > 0 and board.gamePhase in (Board.PieceSetPhase, Board.PieceMovePhase,
+                                                Board.PieceSetRemovePhase, Board.PieceMoveRemovePhase):
+            board.executeMove(rng.choice(list(MinMax.nextPossibleMoves(board, pieceType))))
+            if (board.gamePhase != Board.PieceSetRemovePhase
+                and board.gamePhase != Board.PieceMoveRemovePhase):
+                board.checkBoardState(invertPieceType(pieceType), False)
+                pieceType = invertPieceType(pieceType)
+                turns -= 1
+        if board.gamePhase in (Board.PieceSetPhase, Board.PieceMovePhase):
+            positions.append((board, pieceType))
+    return positions
+
+def searchPositions (depth, positions):
+    '''
+    Iterative deepening search of random positions. Returns the search
+    counters summed up over all positions and the best moves.
+    '''
+    import MinMax
+    counters = ["nodes", "failHighs", "failLows", "reSearches", "reductions",
+                "reductionReSearches", "futilityPrunes", "quiescenceNodes"]
+    results = {"positions": positions, "depth": depth}
+    for name in counters:
+        results[name] = 0
+    bestMoves = []
+    startTime = time.time()
+    for board, pieceType in randomPositions(positions):
+        currentSearch = MinMax.Search()
+        bestMoves.append(MinMax.iterativeBestNextMove(board, pieceType, depth, currentSearch))
+        for name in counters:
+            results[name] += getattr(currentSearch, name)
+    duration = time.time() - startTime
+    results["seconds"] = duration
+    results["nodesPerSecond"] = int(results["nodes"] / duration)
+    return results, bestMoves
+
+@benchmark
+def search (depth=5, positions=20):
+    '''
+    Iterative deepening search of random positions. Counts the nodes,
+    the re-searches of aspiration and null windows and the work saved
+    by the selective search.
+    '''
+    return searchPositions(depth, positions)[0]
+
+@benchmark
+def memory (depth=4, positions=10, top=5):
+    '''
+    Memory of the search of random positions under tracemalloc (see
+    MemoryProfile.py): peak and retained bytes, also per node, the top
+    allocation sites and object count changes summed up over all positions
+    '''
+    import MemoryProfile
+    import ProofSearch
+    from PositionCache import PositionCache
+    results = {"positions": positions, "depth": depth, "nodes": 0, "maxPeakBytes": 0,
+               "retainedBytes": 0, "retainedBlocks": 0}
+    peakBytes = []
+    sites = {}
+    counts = {}
+    for board, pieceType in randomPositions(positions):
+        ProofSearch.provenWins.clear()
+        bestMove, report = MemoryProfile.profileBestNextMove(board, pieceType, depth, PositionCache(), top)
+        results["nodes"] += report["nodes"]
+        results["maxPeakBytes"] = max(results["maxPeakBytes"], report["peakBytes"])
+        results["retainedBytes"] += report["retainedBytes"]
+        results["retainedBlocks"] += report["retainedBlocks"]
+        peakBytes.append(report["peakBytes"])
+        for site, size, blocks in report["retainedSites"]:
+            sites[site] = sites.get(site, 0) + size
+        for name, change in report["objectCounts"]:
+            counts[name] = counts.get(name, 0) + change
+    nodes = max(1, results["nodes"])
+    results["peakBytesPerNode"] = sum(peakBytes) / nodes
+    results["p50PeakBytes"] = percentile(peakBytes, 0.5)
+    results["retainedBytesPerNode"] = results["retainedBytes"] / nodes
+    results["retainedBlocksPerNode"] = results["retainedBlocks"] / nodes
+    results["retainedSites"] = sorted(sites.items(), key=lambda entry: -entry[1])[:top]
+    results["objectCounts"] = sorted(counts.items(), key=lambda entry: -abs(entry[1]))[:top]
+    return results
+
+def applySettings (settings):
+    '''
+    Sets the search parameters of MinMax given as name -> value.
+    Returns the depth, if it's part of the settings.
+    '''
+    import MinMax
+    for name, value in settings.items():
+        if name != "depth":
+            setattr(MinMax, name, value)
+    return settings.get("depth")
+
+def playMatchGame (whiteSettings, blackSettings, seed, randomTurns=4, maxTurns=150):
+    '''
+    Plays one game between two settings of the search (see applySettings),
+    starting with a few random turns. Returns the final game phase.
+    '''
+    import random
+    import MinMax
+    rng = random.Random(seed)
+    board = Board()
+    pieceType = Board.White
+    turns = 0
+    while (board.gamePhase in (Board.PieceSetPhase, Board.PieceMovePhase,
+                               Board.PieceSetRemovePhase, Board.PieceMoveRemovePhase)
+           and turns < maxTurns):
+        if turns < randomTurns:
+            move = rng.choice(list(MinMax.nextPossibleMoves(board, pieceType)))
+        else:
+            depth = applySettings(whiteSettings if pieceType == Board.White else blackSettings)
+            move = MinMax.bestNextMove(board, pieceType, depth)
+        board.executeMove(move)
+        if (board.gamePhase != Board.PieceSetRemovePhase
+            and board.gamePhase != Board.PieceMoveRemovePhase):
+            board.checkBoardState(invertPieceType(pieceType), False)
+            pieceType = invertPieceType(pieceType)
+            turns += 1
+    return board.gamePhase
+
+def playMatch (settings, opponentSettings, games):
+    '''
+    Plays games between two settings, every opening with both colors.
+    Returns the wins, losses and draws of settings.
+    '''
+    import MinMax
+    saved = {name: getattr(MinMax, name) for name in list(settings) + list(opponentSettings) if name != "depth"}
+    wins, losses, draws = 0, 0, 0
+    try:
+        for game in range(games):
+            if game % 2 == 0:
+                gamePhase = playMatchGame(settings, opponentSettings, game // 2)
+                won, lost = Board.WhiteWins, Board.BlackWins
+            else:
+                gamePhase = playMatchGame(opponentSettings, settings, game // 2)
+                won, lost = Board.BlackWins, Board.WhiteWins
+            if gamePhase == won:
+                wins += 1
+            elif gamePhase == lost:
+                losses += 1
+            else:
+                draws += 1
+    finally:
+        applySettings(saved)
+    return wins, losses, draws
+
+def compareSettings (configurations, positions, results):
+    '''
+    Searches the same positions with every configuration (name -> settings).
+    Adds the nodes, the time and the number of best moves differing from
+    the first configuration to results.
+    '''
+    import MinMax
+    names = set(name for settings in configurations.values() for name in settings if name != "depth")
+    saved = {name: getattr(MinMax, name) for name in names}
+    try:
+        firstMoves = None
+        for name, settings in configurations.items():
+            applySettings(dict(saved, **settings))
+            measured, bestMoves = searchPositions(settings["depth"], positions)
+            if firstMoves == None:
+                firstMoves = bestMoves
+            results[name + "Nodes"] = measured["nodes"]
+            results[name + "Seconds"] = measured["seconds"]
+            results[name + "ChangedMoves"] = sum(1 for a, b in zip(bestMoves, firstMoves) if a != b)
+    finally:
+        applySettings(saved)
+    return results
+
+@benchmark
+def selectiveSearch (depth=5, positions=20, matchDepth=4, matchGames=10):
+    '''
+    Compares the nodes of the search with every selective feature
+    switched on and off, how often the best move changes, and the
+    results of games between the full selective and the plain search.
+    '''
+    configurations = {
+        "none": {"depth": depth, "lateMoveReductions": False, "futilityPruning": False},
+        "reductions": {"depth": depth, "lateMoveReductions": True, "futilityPruning": False},
+        "futility": {"depth": depth, "lateMoveReductions": False, "futilityPruning": True},
+        "all": {"depth": depth, "lateMoveReductions": True, "futilityPruning": True},
+    }
+    results = compareSettings(configurations, positions, {})
+    results["matchWins"], results["matchLosses"], results["matchDraws"] = playMatch(
+        dict(configurations["all"], depth=matchDepth), dict(configurations["none"], depth=matchDepth), matchGames)
+    return results
+
+@benchmark
+def quiescence (depth=4, referenceDepth=6, positions=20, matchGames=10):
+    '''
+    Compares the search with quiescence search at depth with the
+    search without it at referenceDepth: nodes on random positions
+    and the results of games between both.
+    '''
+    configurations = {
+        "reference": {"depth": referenceDepth, "quiescenceSearch": False},
+        "quiescence": {"depth": depth, "quiescenceSearch": True},
+        "plain": {"depth": depth, "quiescenceSearch": False},
+    }
+    results = compareSettings(configurations, positions, {})
+    results["matchWins"], results["matchLosses"], results["matchDraws"] = playMatch(
+        configurations["quiescence"], configurations["reference"], matchGames)
+    return results
+
+@benchmark
+def proofSearch (positions=100, depth=5):
+    '''
+    Looks for forced wins in random move phase positions with the proof
+    number search, and compares it with the alpha beta search of the
+    positions it proved.
+    '''
+    import MinMax
+    import ProofSearch
+    saved = MinMax.proofSearch
+    results = {"positions": 0, "proven": 0, "proofNodes": 0, "proofSeconds": 0.0,
+               "provenNodes": 0, "provenSeconds": 0.0, "alphaBetaWins": 0,
+               "alphaBetaNodes": 0, "alphaBetaSeconds": 0.0}
+    try:
+        for board, pieceType in randomPositions(positions, 40, 140, seed=1):
+            if board.gamePhase != Board.PieceMovePhase:
+                continue
+            results["positions"] += 1
+            ProofSearch.provenWins.clear()
+            proofSearch = MinMax.Search()
+            startTime = time.time()
+            winningMove = ProofSearch.winningMove(board, pieceType, MinMax.proofNodeBudget, proofSearch)
+            duration = time.time() - startTime
+            results["proofNodes"] += proofSearch.nodes
+            results["proofSeconds"] += duration
+            if winningMove == None:
+                continue
+            results["proven"] += 1
+            results["provenNodes"] += proofSearch.nodes
+            results["provenSeconds"] += duration
+
+            MinMax.proofSearch = False
+            alphaBetaSearch = MinMax.Search()
+            startTime = time.time()
+            move, score = MinMax.searchRoot(board, pieceType, depth, search=alphaBetaSearch)
+            results["alphaBetaSeconds"] += time.time() - startTime
+            results["alphaBetaNodes"] += alphaBetaSearch.nodes
+            if score >= MinMax.infinity:
+                results["alphaBetaWins"] += 1
+            MinMax.proofSearch = saved
+    finally:
+        MinMax.proofSearch = saved
+    return results
+
+def playProfileGame (depth, nodeLimit, seed, randomTurns=4, maxTurns=80):
+    '''
+    Plays a game of the engine against itself, searching at most depth
+    plies and nodeLimit positions per move. Returns the moves, the nodes
+    and the reached depth of every searched move.
+    '''
+    import random
+    import MinMax
+    import ProofSearch
+    # Proven wins of earlier games would save the nodes
+    ProofSearch.provenWins.clear()
+    rng = random.Random(seed)
+    board = Board()
+    pieceType = Board.White
+    turns = 0
+    moves = []
+    nodes = []
+    depths = []
+    while (board.gamePhase in (Board.PieceSetPhase, Board.PieceMovePhase,
+                               Board.PieceSetRemovePhase, Board.PieceMoveRemovePhase)
+           and turns < maxTurns):
+        if turns < randomTurns:
+            move = rng.choice(list(MinMax.nextPossibleMoves(board, pieceType)))
+        else:
+            search = MinMax.Search(nodeLimit=nodeLimit)
+            reachedDepth = [0]
+            move = MinMax.iterativeBestNextMove(board, pieceType, depth, search,
+                                                infoReceiver=lambda depth, score, search, pv: reachedDepth.append(depth))
+            nodes.append(search.nodes)
+            depths.append(max(reachedDepth))
+        board.executeMove(move)
+        moves.append(move)
+        if not MinMax.isRemovePhase(board):
+            board.checkBoardState(invertPieceType(pieceType), False)
+            pieceType = invertPieceType(pieceType)
+            turns += 1
+    return moves, nodes, depths
+
+@benchmark
+def difficulty (games=2, maxTurns=80):
+    '''
+    Nodes per move of the difficulty profiles of AIPlayer in games against
+    themselves, the depth they reached and if the same game is played again
+    '''
+    from Player import AIPlayer
+    results = {}
+    for difficulty in range(len(AIPlayer.difficultyProfiles)):
+        depth, nodeLimit = AIPlayer.difficultyProfiles[difficulty]
+        nodes = []
+        depths = []
+        reproducible = True
+        startTime = time.time()
+        for seed in range(games):
+            moves, gameNodes, gameDepths = playProfileGame(depth, nodeLimit, seed, maxTurns=maxTurns)
+            nodes += gameNodes
+            depths += gameDepths
+            if seed == 0:
+                reproducible = playProfileGame(depth, nodeLimit, seed, maxTurns=maxTurns)[0] == moves
+        prefix = "difficulty" + str(difficulty)
+        results[prefix + "Moves"] = len(nodes)
+        results[prefix + "NodesMean"] = sum(nodes) // max(1, len(nodes))
+        results[prefix + "NodesP50"] = percentile(nodes, 0.5)
+        results[prefix + "NodesP90"] = percentile(nodes, 0.9)
+        results[prefix + "NodesP99"] = percentile(nodes, 0.99)
+        results[prefix + "NodesMax"] = max(nodes, default=0)
+        results[prefix + "DepthMean"] = sum(depths) / max(1, len(depths))
+        results[prefix + "FullDepth"] = sum(1 for reached in depths if reached >= depth) / max(1, len(depths))
+        results[prefix + "Reproducible"] = reproducible
+        results[prefix + "Seconds"] = time.time() - startTime
+    return results
+
+@benchmark
+def multiPV (depth=4, positions=20, count=3):
+    '''
+    Nodes and time of the multi principal variation analysis of random
+    positions, compared with a single search and with scoring every
+    move by a search of its own
+    '''
+    import MinMax
+    from PositionCache import PositionCache
+    results = {"positions": positions, "depth": depth, "count": count}
+    for name in ("analyse", "single", "separate"):
+        results[name + "Nodes"] = 0
+        results[name + "Seconds"] = 0.0
+    for board, pieceType in randomPositions(positions):
+        search = MinMax.Search()
+        startTime = time.time()
+        MinMax.analyse(board, pieceType, depth, count, search)
+        results["analyseSeconds"] += time.time() - startTime
+        results["analyseNodes"] += search.nodes
+
+        search = MinMax.Search()
+        startTime = time.time()
+        MinMax.iterativeBestNextMove(board, pieceType, depth, search)
+        results["singleSeconds"] += time.time() - startTime
+        results["singleNodes"] += search.nodes
+
+        startTime = time.time()
+        for move in MinMax.nextPossibleMoves(board, pieceType):
+            search = MinMax.Search()
+            childBoard = Board(board)
+            childBoard.applyMove(move)
+            MinMax.childScore(childBoard, depth - 1, pieceType, pieceType, -MinMax.infinity,
+                              MinMax.infinity, PositionCache(), search)
+            results["separateNodes"] += search.nodes
+        results["separateSeconds"] += time.time() - startTime
+    return results
+
+@benchmark
+def vectorGame (games=1024, steps=300, boardGames=50, seed=0):
+    '''
+    Positions per second of random self-play games, all games at once
+    with VectorGame (finished games start again) and one after the other
+    with Board
+    '''
+    import random
+    import numpy as np
+    import MinMax
+    from VectorGame import VectorGame
+
+    environment = VectorGame(games)
+    rng = np.random.default_rng(seed)
+    positions = 0
+    finishedGames = 0
+    startTime = time.time()
+    for i in range(steps):
+        positions += int(environment.running().sum())
+        legal = environment.legalMoves()
+        finished = environment.step(environment.randomActions(rng, legal), legal)
+        finishedGames += int(finished.sum())
+        environment.reset(finished)
+    vectorSeconds = time.time() - startTime
+
+    rng = random.Random(seed)
+    boardPositions = 0
+    startTime = time.time()
+    for i in range(boardGames):
+        board = Board()
+        pieceType = Board.White
+        while board.gamePhase in (Board.PieceSetPhase, Board.PieceMovePhase,
+                                  Board.PieceSetRemovePhase, Board.PieceMoveRemovePhase):
+            moves = list(MinMax.nextPossibleMoves(board, pieceType))
+            if len(moves) == 0:
+                break
+            boardPositions += 1
+            board.executeMove(rng.choice(moves))
+            if not MinMax.isRemovePhase(board):
+                board.checkBoardState(invertPieceType(pieceType), False)
+                pieceType = invertPieceType(pieceType)
+    boardSeconds = time.time() - startTime
+    return {
+        "games": games,
+        "positions": positions,
+        "finishedGames": finishedGames,
+        "positionsPerSecond": int(positions / vectorSeconds),
+        "boardGames": boardGames,
+        "boardPositions": boardPositions,
+        "boardPositionsPerSecond": int(boardPositions / boardSeconds),
+    }
+
+@benchmark
+def vectorGameRules (games=200, maxSteps=1000, seed=0):
+    '''
+    Plays random games with VectorGame and Board side by side and
+    compares the legal moves, the positions (including the phase and
+    the result) and the player to move after every step. A game is
+    only compared until its first mismatch, mismatches should be 0.
+    Games, in which the player to move can't do anything, end there,
+    Board has no rule for that (see VectorGame.py).
+    '''
+    import numpy as np
+    import MinMax
+    from VectorGame import VectorGame, actionToMove, moveToAction
+
+    environment = VectorGame(games)
+    rng = np.random.default_rng(seed)
+    boards = [Board() for i in range(games)]
+    pieceTypes = [Board.White] * games
+    active = set(range(games))
+    results = {"games": games, "positions": 0, "finishedGames": 0, "stuckGames": 0,
+               "legalMismatches": 0, "stateMismatches": 0}
+    for step in range(maxSteps):
+        if len(active) == 0:
+            break
+        legal = environment.legalMoves()
+        actions = environment.randomActions(rng, legal)
+        for game in list(active):
+            moves = MinMax.nextPossibleMoves(boards[game], pieceTypes[game])
+            if set(np.flatnonzero(legal[game])) != set(moveToAction(move) for move in moves):
+                results["legalMismatches"] += 1
+                active.discard(game)
+        environment.step(actions, legal)
+        snapshots = environment.snapshots()
+        running = environment.running()
+        for game in list(active):
+            if actions[game] < 0:
+                results["stuckGames"] += 1
+                active.discard(game)
+                continue
+            board = boards[game]
+            board.executeMove(actionToMove(int(actions[game]), pieceTypes[game]))
+            if not MinMax.isRemovePhase(board):
+                board.checkBoardState(invertPieceType(pieceTypes[game]), False)
+                pieceTypes[game] = invertPieceType(pieceTypes[game])
+            results["positions"] += 1
+            if snapshots[game] != board.snapshot() or environment.player[game] != pieceTypes[game]:
+                results["stateMismatches"] += 1
+                active.discard(game)
+            elif not running[game]:
+                results["finishedGames"] += 1
+                active.discard(game)
+    results["unfinishedGames"] = len(active)
+    return results
+
+@benchmark
+def parallelSearch (depth=6, positions=10, workerCounts=(1, 2, 4)):
+    '''
+    Lazy SMP: time to search random positions with different numbers of
+    processes sharing one cache, and the nodes of all processes together
+    '''
+    import MinMax
+    results = {}
+    for workers in workerCounts:
+        parallel = MinMax.ParallelSearch(workers)
+        try:
+            # Starts the processes, before the time is taken
+            parallel.search(Board(), Board.White, 1)
+            nodes = 0
+            startTime = time.time()
+            for board, pieceType in randomPositions(positions):
+                parallel.cache.clear()
+                currentSearch = MinMax.Search()
+                parallel.search(board, pieceType, depth, currentSearch)
+                nodes += currentSearch.nodes
+            results["seconds%d" % workers] = time.time() - startTime
+            results["nodes%d" % workers] = nodes
+        finally:
+            parallel.close()
+    return results
+
+@benchmark
+def rendering (depth=2, maxTurns=300, animate=False):
+    '''
+    Replays a long game in the UI on the offscreen platform. Every move is
+    one frame: updating the scene after the turn and rendering the board.
+    '''
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QWidget
+    from HeadlessGame import HeadlessGame
+    from Player import HumanPlayer
+    from UI import QMainMuehleUI
+
+    moves = selfPlayMoves(depth, maxTurns)
+
+    ui = QMainMuehleUI()
+    ui.game.abort()
+    ui.game.wait()
+    ui.animatePieces = animate
+    ui.show()
+    boardView = ui.findChild(QWidget, "boardWidget")
+
+    # The UI only reads the game, the moves are played here
+    game = HeadlessGame(HumanPlayer("White", Board.White), HumanPlayer("Black", Board.Black))
+    ui.game = game
+    ui.playerFinishedTurn()
+
+    frameTimes = []
+    for move in moves:
+        startTime = time.perf_counter()
+        game.board.executeMove(move)
+        if (game.board.gamePhase != Board.PieceSetRemovePhase
+            and game.board.gamePhase != Board.PieceMoveRemovePhase):
+            game.board.checkBoardState(invertPieceType(game.getCurrentPlayer().pieceType), False)
+            game.turnCounter += 1
+        ui.playerFinishedTurn()
+        ui.app.processEvents()
+        boardView.viewport().grab()
+        frameTimes.append(time.perf_counter() - startTime)
+
+    ui.close()
+    return {
+        "frames": len(frameTimes),
+        "frameMsMean": 1000 * sum(frameTimes) / max(1, len(frameTimes)),
+        "frameMsP50": 1000 * percentile(frameTimes, 0.5),
+        "frameMsP99": 1000 * percentile(frameTimes, 0.99),
+    }
+
+def main ():
+    parser = argparse.ArgumentParser(description="Muehle benchmarks")
+    parser.add_argument("names", nargs="*", help="benchmarks to run: " + ", ".join(benchmarks))
+    parser.add_argument("--json", help="file the results are written to")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.names or list(benchmarks):
+        print(name)
+        results[name] = benchmarks[name]()
+        for key, value in results[name].items():
+            print("    %s: %s" % (key, value))
+
+    if args.json != None:
+        with open(args.json, "w") as resultFile:
+            json.dump(results, resultFile, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+'''
+Runs the MinMax search (or the MCTS search, see MCTS.py and --algorithm)
+in a separate worker process, so the search doesn't compete with the UI for
+the interpreter.
+The worker reads commands from stdin and answers on stdout, one per line:
+    position startpos [moves <move> ...]
+        Replays the moves from the start position. The player to move
+        follows from the moves.
+    go [depth <n>] [movetime <milliseconds>] [nodes <iterations>] [multipv <n>]
+        Starts searching the current position. nodes limits the iterations
+        of MCTS and the positions visited by the alpha beta search (checked
+        at every position, so the result doesn't depend on the speed of the
+        machine, as long as there is no movetime). With multipv, the alpha
+        beta search analyses the n best moves (see MinMax.analyse) and
+        prints
+            info multipv <i> depth <n> score <score> nodes <n> nps <n> time <ms> pv <move> ...
+                for each of them (i = 1 for the best one) after every
+                completed depth instead of the info depth lines below.
+        While searching, the worker prints
+            info progress <percentage> depth <n> nodes <n> nps <n> best <move>
+                at most every progressInterval seconds, while searching
+                the given depth
+            info depth <n> score <score> nodes <n> nps <n> time <ms>
+                 failhigh <n> faillow <n> researches <n> pv <move> ...
+                after every completed depth, with the number of aspiration
+                windows failed high and low and of re-searched null windows
+                (MCTS: once at the end, score is the expected result in
+                percent from -100 to 100)
+        and finally
+            bestmove <move>
+    stop
+        Stops the running search, which still answers with bestmove.
+    isready
+        Answered by readyok, as soon as all previous commands are done.
+    quit
+Moves are written as s<color><index> (set), m<color><from>-<to> (move) and
+x<color><index> (remove), with the color being w or b and the indices
+following the board index notation (see GameBoard.py), e.g. sw5, mb3-4, xw12.
+With --workers, the alpha beta search runs in that many processes sharing
+one cache in shared memory (see MinMax.ParallelSearch). --sharedCache names
+that cache, so all engines started with the same name share it.
+'''
+import os
+import sys
+import threading
+import time
+
+from GameBoard import Board, invertPieceType, encodeMove
+import MCTS
+import MinMax
+from PositionCache import PositionCache
+import Trace
+
+
+# path pointing to project folder in which Engine.py is located
+path = os.path.dirname(os.path.abspath(__file__))
+
+# default depth, if a go command has neither depth nor movetime
+defaultDepth = 4
+
+# default MCTS iterations, if a go command has neither nodes nor movetime
+defaultIterations = 2000
+
+# minimum time between two progress infos (seconds)
+progressInterval = 0.1
+
+def defaultEngineCommand ():
+    '''
+    Command line starting the engine worker of this project. While
+    this process is traced, the engine traces its searches as well.
+    '''
+    command = [sys.executable, os.path.join(path, "Engine.py")]
+    if Trace.enabled:
+        command += ["--trace", Trace.childPath()]
+    return command
+
+def moveToText (move):
+    op = move & 15
+    color = "b" if (move >> 4) & 3 == Board.Black else "w"
+    if op == Board.OpSet:
+        return "s" + color + str((move >> 6) & 31)
+    if op == Board.OpRemove:
+        return "x" + color + str((move >> 6) & 31)
+    return "m" + color + str((move >> 6) & 31) + "-" + str((move >> 11) & 31)
+
+def textToMove (text):
+    ops = {"s": Board.OpSet, "m": Board.OpMove, "x": Board.OpRemove}
+    colors = {"w": Board.White, "b": Board.Black}
+    if len(text) < 3 or text[0] not in ops or text[1] not in colors:
+        raise ValueError("Invalid move " + text)
+
+    indices = [int(index) for index in text[2:].split("-")]
+    if len(indices) != (2 if text[0] == "m" else 1):
+        raise ValueError("Invalid move " + text)
+    return encodeMove(ops[text[0]], colors[text[1]], *indices)
+
+def playedMoves (board):
+    '''
+    Returns all moves played on the board, without internal op codes
+    '''
+    return [move for move in board.opCodeHistory if (move & 15) <= Board.OpRemove]
+
+def replayMoves (moves):
+    '''
+    Plays the moves from the start position, the same way Game does.
+    Returns the board and the piece type of the player to move.
+    '''
+    board = Board()
+    pieceType = Board.White
+    for move in moves:
+        if (move >> 4) & 3 != pieceType or not board.executeMove(move):
+            raise ValueError("Illegal move " + moveToText(move))
+        # A turn ends, when no piece has to be removed
+        if (board.gamePhase != Board.PieceSetRemovePhase
+            and board.gamePhase != Board.PieceMoveRemovePhase):
+            board.checkBoardState(invertPieceType(pieceType), False)
+            pieceType = invertPieceType(pieceType)
+    return board, pieceType
+
+class EngineWorker (object):
+    '''
+    The worker side of the protocol. Searches run in their own thread,
+    so stop can be read while searching.
+    '''
+
+    def __init__ (self, output, cache, algorithm="alphabeta", workers=1):
+        self.output = output
+        self.outputLock = threading.Lock()
+        self.cache = cache
+        self.algorithm = algorithm
+        # The tree is kept between the searches of a game
+        self.mcts = MCTS.MCTSEngine(workers) if algorithm == "mcts" else None
+        self.parallelSearch = None
+        if algorithm == "alphabeta" and workers > 1:
+            self.parallelSearch = MinMax.ParallelSearch(workers, cache)
+        self.board = Board()
+        self.pieceType = Board.White
+        self.search = None
+        self.searchThread = None
+
+    def send (self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run (self, input):
+        for line in input:
+            tokens = line.split()
+            if len(tokens) == 0:
+                continue
+
+            if tokens[0] == "quit":
+                break
+            try:
+                self.handleCommand(tokens)
+            except ValueError as e:
+                self.send("info error " + str(e))
+        self.stopSearch()
+
+    def handleCommand (self, tokens):
+        command = tokens[0]
+        if command == "position":
+            self.stopSearch()
+            if len(tokens) < 2 or tokens[1] != "startpos":
+                raise ValueError("Only startpos is supported")
+            moves = []
+            if len(tokens) > 2 and tokens[2] == "moves":
+                moves = [textToMove(text) for text in tokens[3:]]
+            self.board, self.pieceType = replayMoves(moves)
+
+        elif command == "go":
+            self.stopSearch()
+            depth = None
+            moveTime = None
+            iterations = None
+            multiPV = None
+            for i in range(1, len(tokens) - 1, 2):
+                if tokens[i] == "depth":
+                    depth = int(tokens[i + 1])
+                elif tokens[i] == "movetime":
+                    moveTime = int(tokens[i + 1])
+                elif tokens[i] == "nodes":
+                    iterations = int(tokens[i + 1])
+                elif tokens[i] == "multipv":
+                    multiPV = int(tokens[i + 1])
+            self.startSearch(depth, moveTime, iterations, multiPV)
+
+        elif command == "stop":
+            self.stopSearch()
+
+        elif command == "isready":
+            if self.searchThread != None:
+                self.searchThread.join()
+            self.send("readyok")
+
+        else:
+            raise ValueError("Unknown command " + command)
+
+    def startSearch (self, depth, moveTime, iterations=None, multiPV=None):
+        deadline = None
+        if moveTime != None:
+            deadline = time.time() + moveTime / 1000
+            if depth == None:
+                depth = 100
+        # The alpha beta search counts positions instead of iterations
+        nodeLimit = iterations if self.mcts == None else None
+        if nodeLimit != None and depth == None:
+            depth = 100
+        if depth == None:
+            depth = defaultDepth
+        if iterations == None and moveTime == None:
+            iterations = defaultIterations
+
+        self.search = MinMax.Search(deadline, nodeLimit=nodeLimit)
+        self.searchThread = threading.Thread(target=self.searchPosition, name="search",
+                                             args=(Board(self.board), self.pieceType, depth, self.search,
+                                                   iterations, multiPV))
+        self.searchThread.start()
+
+    def stopSearch (self):
+        if self.searchThread == None:
+            return
+        self.search.stop()
+        self.searchThread.join()
+        self.searchThread = None
+
+    def searchPosition (self, board, pieceType, depth, search, iterations=None, multiPV=None):
+        if board.gamePhase not in (Board.PieceSetPhase, Board.PieceMovePhase,
+                                   Board.PieceSetRemovePhase, Board.PieceMoveRemovePhase):
+            self.send("bestmove none")
+            return
+
+        lastProgress = [0]
+        def progressChange (depth, searchedMoves, moveCount, bestMove):
+            # Throttled, so neither the pipe nor the UI gets flooded
+            if time.time() - lastProgress[0] < progressInterval:
+                return
+            lastProgress[0] = time.time()
+            self.sendProgress(search, depth, 100 * searchedMoves / moveCount, bestMove)
+
+        if self.mcts != None:
+            bestMove = self.mcts.search(board, pieceType, iterations, search, progressChange)
+            self.sendInfo(len(self.mcts.principalVariation()), int(200 * self.mcts.winRate() - 100),
+                          search, self.mcts.principalVariation())
+        elif multiPV != None:
+            lines = MinMax.analyse(board, pieceType, depth, multiPV, search, self.cache, self.sendLines)
+            bestMove = lines[0]["move"] if len(lines) > 0 else None
+            self.cache.flush()
+        elif self.parallelSearch != None:
+            bestMove = self.parallelSearch.search(board, pieceType, depth, search, self.sendInfo, progressChange)
+        else:
+            bestMove = MinMax.iterativeBestNextMove(board, pieceType, depth, search, self.cache,
+                                                    self.sendInfo, progressChange)
+            self.cache.flush()
+        self.send("bestmove " + (moveToText(bestMove) if bestMove != None else "none"))
+
+    def sendInfo (self, depth, score, search, principalVariation):
+        self.send("info depth %d score %d nodes %d nps %d time %d failhigh %d faillow %d researches %d pv %s" %
+                  (depth, score, search.nodes, search.nodesPerSecond(), int(search.elapsedTime() * 1000),
+                   search.failHighs, search.failLows, search.reSearches,
+                   " ".join(moveToText(move) for move in principalVariation)))
+
+    def sendLines (self, depth, lines, search):
+        for i in range(len(lines)):
+            self.send("info multipv %d depth %d score %d nodes %d nps %d time %d pv %s" %
+                      (i + 1, depth, lines[i]["score"], search.nodes, search.nodesPerSecond(),
+                       int(search.elapsedTime() * 1000),
+                       " ".join(moveToText(move) for move in lines[i]["pv"])))
+
+    def sendProgress (self, search, depth, percentage, bestMove):
+        line = "info progress %.2f depth %d nodes %d nps %d" % (percentage, depth, search.nodes,
+                                                                 search.nodesPerSecond())
+        if bestMove != None:
+            line += " best " + moveToText(bestMove)
+        self.send(line)
+
+class EngineClient (object):
+    '''
+    Starts an engine worker process and talks to it.
+    stop() may be called from any thread, everything else from
+    one thread only. If the worker process dies, search raises a
+    RuntimeError. The next search starts a new one.
+    '''
+
+    def __init__ (self, command=None):
+        if command == None:
+            command = defaultEngineCommand()
+        self.command = command
+        self.process = None
+        self.sendLock = threading.Lock()
+        self.stopRequested = False
+
+    def start (self):
+        if self.process != None and self.process.poll() == None:
+            return
+        import subprocess
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True, bufsize=1)
+
+    def send (self, line):
+        with self.sendLock:
+            try:
+                self.process.stdin.write(line + "\n")
+                self.process.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                # ValueError: the pipe was closed already
+                raise RuntimeError(self.diedMessage())
+
+    def diedMessage (self):
+        self.process.poll()
+        return "The engine process died (%s, exit code %s)" % (" ".join(self.command), self.process.returncode)
+
+    def search (self, board, depth=None, moveTime=None, infoReceiver=None, iterations=None, multiPV=None):
+        '''
+        Searches the best move for the player to move on the board.
+        Every info line is passed to infoReceiver as a dict.
+        Returns the best move or None, if there is no move.
+        Raises a RuntimeError, if the engine process died.
+        '''
+        self.start()
+        self.stopRequested = False
+        moves = " ".join(moveToText(move) for move in playedMoves(board))
+        self.send("position startpos moves " + moves if moves else "position startpos")
+
+        goCommand = "go"
+        if depth != None:
+            goCommand += " depth " + str(depth)
+        if moveTime != None:
+            goCommand += " movetime " + str(moveTime)
+        if iterations != None:
+            goCommand += " nodes " + str(iterations)
+        if multiPV != None:
+            goCommand += " multipv " + str(multiPV)
+        self.send(goCommand)
+        # stop() was called, before the search started
+        if self.stopRequested:
+            self.send("stop")
+
+        for line in self.process.stdout:
+            tokens = line.split()
+            if len(tokens) == 0:
+                continue
+            if tokens[0] == "bestmove":
+                return textToMove(tokens[1]) if tokens[1] != "none" else None
+            if tokens[0] == "info" and infoReceiver != None:
+                infoReceiver(parseInfo(tokens))
+        self.process.wait()
+        raise RuntimeError(self.diedMessage())
+
+    def analyse (self, board, count, depth=None, moveTime=None):
+        '''
+        Returns the count best moves for the player to move like
+        MinMax.analyse: dicts with move, score, depth and pv, best first.
+        '''
+        lines = {}
+        def infoReceiver (info):
+            if "multipv" in info and len(info.get("pv", [])) > 0:
+                lines[info["multipv"]] = {"move": info["pv"][0], "score": info["score"],
+                                          "depth": info["depth"], "pv": info["pv"]}
+        self.search(board, depth, moveTime, infoReceiver, multiPV=count)
+        return [lines[i] for i in sorted(lines)]
+
+    def stop (self):
+        self.stopRequested = True
+        if self.process != None and self.process.poll() == None:
+            try:
+                self.send("stop")
+            except RuntimeError:
+                # Died in the meantime, search reports it
+                pass
+
+    def close (self):
+        '''
+        Ends the worker process, a later search starts a new one
+        '''
+        if self.process == None:
+            return
+        if self.process.poll() == None:
+            try:
+                self.send("quit")
+            except RuntimeError:
+                pass
+            self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process = None
+
+def parseInfo (tokens):
+    '''
+    Converts the tokens of an info line into a dict
+    '''
+    info = {}
+    i = 1
+    while i < len(tokens):
+        if tokens[i] == "pv":
+            info["pv"] = [textToMove(text) for text in tokens[i + 1:]]
+            break
+        if tokens[i] == "error":
+            info["error"] = " ".join(tokens[i + 1:])
+            break
+        if i + 1 < len(tokens):
+            value = tokens[i + 1]
+            if tokens[i] == "progress":
+                value = float(value)
+            elif tokens[i] == "best":
+                value = textToMove(value)
+            else:
+                value = int(value)
+            info[tokens[i]] = value
+        i += 2
+    return info
+
+def main ():
+    import argparse
+    parser = argparse.ArgumentParser(description="Muehle engine worker")
+    parser.add_argument("--cache", help="file of a persistent PositionCache")
+    parser.add_argument("--algorithm", choices=["alphabeta", "mcts"], default="alphabeta")
+    parser.add_argument("--workers", type=int, default=1, help="processes searching in parallel")
+    parser.add_argument("--sharedCache", help="name of a cache in shared memory, used by all engines with that name")
+    parser.add_argument("--weights", default=MinMax.defaultWeightsPath,
+                        help="file of evaluation weights written by Tuning.py, used if it exists")
+    parser.add_argument("--trace", help="file the timeline of the searches is written to (see Trace.py)")
+    args = parser.parse_args()
+    if os.path.exists(args.weights):
+        MinMax.loadEvaluationWeights(args.weights)
+    if args.trace != None:
+        Trace.start(args.trace)
+
+    # stdout belongs to the protocol, everything else printed goes to stderr
+    output = sys.stdout
+    sys.stdout = sys.stderr
+
+    if args.sharedCache != None:
+        from SharedCache import openSharedCache
+        try:
+            cache = openSharedCache(args.sharedCache)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.workers > 1 and args.algorithm == "alphabeta":
+        from SharedCache import SharedPositionCache
+        cache = SharedPositionCache()
+    else:
+        cache = PositionCache(args.cache)
+
+    worker = EngineWorker(output, cache, args.algorithm, args.workers)
+    worker.run(sys.stdin)
+    if worker.mcts != None:
+        worker.mcts.close()
+    if worker.parallelSearch != None:
+        worker.parallelSearch.close()
+    worker.cache.close()
+    if args.trace != None:
+        Trace.write()
+
+if __name__ == "__main__":
+    main()
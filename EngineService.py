@@ -0,0 +1,268 @@
+'''
+Serves engine searches for many games at once, without any UI.
+Clients connect over a local socket and send one JSON request per line:
+    {"id": 1, "game": "some game", "moves": ["sw0", "sb8"], "depth": 4, "deadline": 2000}
+moves are the moves played so far (see Engine.py for the notation),
+deadline is the time in milliseconds the client is willing to wait.
+Every request is answered by one JSON line with the same id:
+    {"id": 1, "move": "sw2", "depth": 4, "nodes": 1234}
+or {"id": 1, "error": "..."}. Answers may come in a different order,
+than the requests were sent.
+The searches run on a bounded pool of worker processes. Requests are
+queued per game and the games take turns, so a game sending many requests
+can't hold back the others. All workers share one cache in shared memory
+(see SharedCache.py), so a position searched for one game is known to
+every worker.
+'''
+import argparse
+import asyncio
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import time
+
+from Engine import replayMoves, textToMove, moveToText
+from GameBoard import Board
+import MinMax
+from SharedCache import SharedPositionCache
+
+
+# Time kept back from a deadline for queueing and sending the answer (seconds)
+deadlineMargin = 0.05
+
+# Cache of the worker process, shared by all workers and games
+workerCache = None
+
+def startWorker (cache, weights):
+    global workerCache
+    workerCache = cache
+    for phase in weights:
+        MinMax.evaluationWeights[phase][:] = weights[phase]
+
+def searchPosition (moveTexts, depth, deadline):
+    '''
+    Runs in a worker process. Returns (best move, reached depth, nodes)
+    '''
+    board, pieceType = replayMoves([textToMove(text) for text in moveTexts])
+    if board.gamePhase in (Board.WhiteWins, Board.BlackWins, Board.Remis):
+        return None, 0, 0
+
+    search = MinMax.Search(deadline)
+    reachedDepth = []
+    bestMove = MinMax.iterativeBestNextMove(board, pieceType, depth, search, workerCache,
+                                            lambda depth, score, search, pv: reachedDepth.append(depth))
+    if bestMove == None:
+        return None, 0, search.nodes
+    return moveToText(bestMove), max(reachedDepth, default=0), search.nodes
+
+def checkRequest (request, defaultGame):
+    '''
+    Returns moves, depth, deadline and game of the request or raises
+    a ValueError, if one of them has the wrong type
+    '''
+    moves = request.get("moves", [])
+    depth = request.get("depth", 4)
+    deadline = request.get("deadline", 5000)
+    game = request.get("game", defaultGame)
+    if type(moves) != list or any(type(move) != str for move in moves):
+        raise ValueError("moves has to be a list of strings")
+    if type(depth) != int:
+        raise ValueError("depth has to be an integer")
+    if type(deadline) != int:
+        raise ValueError("deadline has to be an integer")
+    if type(game) != str and type(game) != int:
+        raise ValueError("game has to be a string or an integer")
+    return moves, depth, deadline, game
+
+class EngineService (object):
+
+    def __init__ (self, workers=None, weightsPath=MinMax.defaultWeightsPath, cacheEntries=1 << 21):
+        if workers == None:
+            workers = os.cpu_count()
+        self.workers = workers
+        # The workers search with the weights of the file or those of this process
+        weights = MinMax.evaluationWeights
+        if weightsPath != None and os.path.exists(weightsPath):
+            weights = MinMax.readEvaluationWeights(weightsPath)
+        self.cache = SharedPositionCache(maxEntries=cacheEntries, fingerprint=MinMax.evaluationFingerprint(weights))
+        # Started fresh instead of forked from the running event loop (see
+        # MinMax.processPool), the cache is passed on by its name
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=startWorker, initargs=(self.cache, weights))
+
+        # game -> queued jobs of that game
+        self.queues = {}
+        # games with queued jobs, in the order they are served
+        self.gameOrder = collections.deque()
+        self.jobAdded = asyncio.Event()
+        self.dispatchers = []
+        self.server = None
+
+    async def start (self, host="127.0.0.1", port=0):
+        '''
+        Starts listening. Returns the port, which is useful if port 0
+        lets the system choose one.
+        '''
+        self.dispatchers = [asyncio.ensure_future(self.dispatch()) for i in range(self.workers)]
+        self.server = await asyncio.start_server(self.handleConnection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close (self):
+        self.server.close()
+        await self.server.wait_closed()
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        self.executor.shutdown()
+        self.cache.close()
+
+    async def handleConnection (self, reader, writer):
+        requests = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = asyncio.ensure_future(self.handleRequest(line, writer))
+                requests.add(request)
+                request.add_done_callback(requests.discard)
+        except (asyncio.CancelledError, ConnectionError):
+            # The service is closed or the client is gone
+            pass
+
+        for request in list(requests):
+            request.cancel()
+        writer.close()
+
+    async def handleRequest (self, line, writer):
+        requestId = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request has to be a JSON object")
+            requestId = request.get("id")
+            moves, depth, deadline, game = checkRequest(request, id(writer))
+            job = (moves, depth, time.time() + deadline / 1000, asyncio.get_event_loop().create_future())
+            self.submit(game, job)
+            answer = await job[3]
+        except ValueError as e:
+            answer = {"error": str(e)}
+
+        answer["id"] = requestId
+        writer.write((json.dumps(answer) + "\n").encode())
+        await writer.drain()
+
+    def submit (self, game, job):
+        if game not in self.queues:
+            self.queues[game] = collections.deque()
+            self.gameOrder.append(game)
+        self.queues[game].append(job)
+        self.jobAdded.set()
+
+    async def nextJob (self):
+        '''
+        Takes the next job of the game, which waited the longest
+        '''
+        while len(self.gameOrder) == 0:
+            self.jobAdded.clear()
+            await self.jobAdded.wait()
+
+        game = self.gameOrder.popleft()
+        queue = self.queues[game]
+        job = queue.popleft()
+        if len(queue) > 0:
+            self.gameOrder.append(game)
+        else:
+            del self.queues[game]
+        return job
+
+    async def dispatch (self):
+        '''
+        Each dispatcher runs one search at a time, so there are never more
+        searches running, than there are worker processes.
+        '''
+        loop = asyncio.get_event_loop()
+        while True:
+            moves, depth, deadline, answer = await self.nextJob()
+            if answer.cancelled():
+                continue
+
+            remaining = deadline - time.time()
+            if remaining <= deadlineMargin:
+                answer.set_result({"error": "deadline exceeded"})
+                continue
+
+            try:
+                search = loop.run_in_executor(self.executor, searchPosition, moves, depth, deadline - deadlineMargin)
+                move, reachedDepth, nodes = await asyncio.wait_for(search, remaining)
+                result = {"move": move, "depth": reachedDepth, "nodes": nodes}
+            except asyncio.TimeoutError:
+                result = {"error": "deadline exceeded"}
+            except Exception as e:
+                # Every request gets an answer, and the dispatcher keeps going
+                result = {"error": str(e) or type(e).__name__}
+            if not answer.cancelled():
+                answer.set_result(result)
+
+class ServiceClient (object):
+    '''
+    Client for the EngineService, multiple requests may be pending at once.
+    '''
+
+    def __init__ (self):
+        self.reader = None
+        self.writer = None
+        self.nextId = 0
+        self.pending = {}
+        self.readTask = None
+
+    async def connect (self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.readTask = asyncio.ensure_future(self.readAnswers())
+
+    async def readAnswers (self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            answer = json.loads(line)
+            future = self.pending.pop(answer["id"], None)
+            if future != None and not future.done():
+                future.set_result(answer)
+
+    async def bestMove (self, game, moves, depth, deadline):
+        '''
+        Returns the answer of the service as dict
+        '''
+        self.nextId += 1
+        future = asyncio.get_event_loop().create_future()
+        self.pending[self.nextId] = future
+        request = {"id": self.nextId, "game": game, "moves": [moveToText(move) for move in moves],
+                   "depth": depth, "deadline": deadline}
+        self.writer.write((json.dumps(request) + "\n").encode())
+        await self.writer.drain()
+        return await future
+
+    async def close (self):
+        self.readTask.cancel()
+        self.writer.close()
+
+async def serve (host, port, workers, weightsPath):
+    service = EngineService(workers, weightsPath)
+    port = await service.start(host, port)
+    print("Serving on " + host + ":" + str(port))
+    await service.server.serve_forever()
+
+def main ():
+    parser = argparse.ArgumentParser(description="Muehle engine service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7373)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--weights", default=MinMax.defaultWeightsPath,
+                        help="file of evaluation weights written by Tuning.py, used if it exists")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.workers, args.weights))
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,36 @@
 from time import sleep
-import time
 
 from PyQt5.Qt import QThread, pyqtSignal
 
-from GameBoard import Board, invertPieceType
+from HeadlessGame import HeadlessGame
+import Trace
 
 
-class Game(QThread):
+class Game(HeadlessGame, QThread):
     '''
     Runs in it's own thread, independent from the UI Thread.
     High level manager for the GameBoard. Decides which players,
-    turn it is.
+    turn it is (see HeadlessGame).
     '''
 
     playerFinishedTurn = pyqtSignal()
     gameEnded = pyqtSignal()
     
-    # Flag to abort this thread as soon as possible
-    aborted = False
+    # The game can't go on (e.g. the engine process of an AI player died),
+    # with the reason
+    gameFailed = pyqtSignal(str)
+    
+    # Progress of an AI player's search (see AIPlayer.moveCalcProgressChanged).
+    # Emitted from the game thread, so it's queued for the UI thread.
+    progressChanged = pyqtSignal(object)
     
     def __init__ (self, player1, player2):
         QThread.__init__(self)
+        HeadlessGame.__init__(self, player1, player2)
         
-        self.board = Board()
-        self.player1 = player1
-        self.player2 = player2
-        player1.board = self.board
-        player2.board = self.board
-        self.turnCounter = 0
+        for player in (player1, player2):
+            if player.hasProgressSignal():
+                player.progressChangedReciever = self.progressChanged.emit
         
     def __del__ (self):
         self.wait()
@@ -38,6 +41,7 @@ class Game(QThread):
         QThread.start(self)
         
     def run(self):
+        Trace.nameThread("game")
         # Delayed start happens after one undo, so if the next player is an AI
         # it doesn't start calculating it's moves right away. So if the player
         # hits undo multiple times, there is less delay, cause we don't have
@@ -51,34 +55,14 @@ class Game(QThread):
         if self.aborted:
             return
         
-        while not self.aborted and (self.board.gamePhase == Board.PieceMovePhase or
-               self.board.gamePhase == Board.PieceSetPhase or
-               self.board.gamePhase == Board.PieceSetRemovePhase or
-               self.board.gamePhase == Board.PieceMoveRemovePhase):
-            self.nextTurn()
-            
-        if not self.aborted:
-            self.gameEnded.emit()
-    
-    def nextTurn (self):
-        player = self.getCurrentPlayer()
-        if player.doTurn():
-            self.playerFinishedTurn.emit()
+        try:
+            if self.play():
+                self.gameEnded.emit()
+        except RuntimeError as e:
+            self.gameFailed.emit(str(e))
             
-            if (self.board.gamePhase == Board.PieceSetRemovePhase
-                or self.board.gamePhase == Board.PieceMoveRemovePhase):
-                player.doTurn()
-                self.playerFinishedTurn.emit()
-             
-            self.board.checkBoardState(invertPieceType(player.pieceType))
-            self.turnCounter += 1
-        
-    def undo (self):
-        if self.turnCounter == 0:
-            return
-        
-        self.turnCounter -= 1
-        self.board.undo()
+    def turnFinished (self):
+        self.playerFinishedTurn.emit()
         
     def abort (self):
         if not self.isRunning():
@@ -87,15 +71,6 @@ class Game(QThread):
         self.aborted = True
         self.getCurrentPlayer().abort()
         
-    def doesCurrentPlayerUseMouse (self):
-        return self.getCurrentPlayer().usesMouse()
-        
-    def getCurrentPlayer (self):
-        if self.turnCounter % 2 == 0:
-            return self.player1
-        else:
-            return self.player2
-        
         
         
     
@@ -1,4 +1,6 @@
 import copy
+import struct
+import threading
 
 
 def invertPieceType (pieceType):
@@ -23,6 +25,81 @@ def convRingNotationToIndex (ringIndex, nodeIndex):
     nodeIndex = nodeIndex % 8
     return ringIndex * 8 + nodeIndex
 
+# Moves are packed into a single integer:
+#   bits 0-3: op code
+#   bits 4-5: piece type of the player
+#   bits 6-10: board index of the set or removed piece, or the origin of a move
+#   bits 11-15: board index of the destination of a move
+# Internal op codes (see Board) are stored without any further information.
+# The tuple notation of Board.executeOpCode is only used at the boundary
+# to the players.
+
+def encodeMove (op, pieceType=0, fromIndex=0, toIndex=0):
+    return op | (pieceType << 4) | (fromIndex << 6) | (toIndex << 11)
+
+def moveOp (move):
+    return move & 15
+
+def movePieceType (move):
+    return (move >> 4) & 3
+
+def moveFrom (move):
+    return (move >> 6) & 31
+
+def moveTo (move):
+    return (move >> 11) & 31
+
+def opCodeToMove (opCode):
+    '''
+    Converts an op code tuple into a packed move
+    '''
+    if len(opCode) == 1:
+        return opCode[0]
+    if opCode[0] == Board.OpMove:
+        return encodeMove(opCode[0], opCode[1], opCode[2], opCode[3])
+    return encodeMove(opCode[0], opCode[1], opCode[2])
+
+def moveToOpCode (move):
+    '''
+    Converts a packed move into an op code tuple
+    '''
+    op = move & 15
+    if op == Board.OpMove:
+        return (op, (move >> 4) & 3, (move >> 6) & 31, (move >> 11) & 31)
+    if op == Board.OpSet or op == Board.OpRemove:
+        return (op, (move >> 4) & 3, (move >> 6) & 31)
+    return (op,)
+
+# Set while debugCheckApply applies and reverts a move itself, which
+# mustn't be checked again. Per thread, other threads keep checking.
+debugCheckGuard = threading.local()
+
+class BoardSnapshot (int):
+    '''
+    Immutable snapshot of the position of a board (see Board.snapshot),
+    without its history. It's the position key, so it's hashable, compares
+    and pickles like an integer and takes no more memory than one.
+    '''
+    __slots__ = ()
+    
+    def board (self):
+        '''
+        Returns a new board in the position of the snapshot
+        '''
+        board = Board()
+        key = int(self)
+        board.gamePhase = key & 7
+        key >>= 3
+        board.neverPlacedBlackPieces = key & 15
+        board.neverPlacedWhitePieces = (key >> 4) & 15
+        board.unplacedBlackPieces = (key >> 8) & 15
+        board.unplacedWhitePieces = (key >> 12) & 15
+        key >>= 16
+        values = board.values
+        for i in range(len(values) - 1, -1, -1):
+            key, values[i] = divmod(key, 3)
+        return board
+
 class Board (object):
     '''
     Designed to hold a the information about the game's current status,
@@ -66,13 +143,30 @@ class Board (object):
         05-----04-----03
     '''
     
+    # The attributes are slots, that saves the dict of every board
+    __slots__ = ("gamePhase", "unplacedWhitePieces", "unplacedBlackPieces",
+                 "neverPlacedWhitePieces", "neverPlacedBlackPieces", "opCodeHistory",
+                 "appliedPhases", "positionHistory", "values", "debugStates")
+    
     # gamePhases
     PieceSetPhase, PieceMovePhase, PieceMoveRemovePhase, PieceSetRemovePhase, BlackWins, WhiteWins, Remis = range(7)
     
     # pieceTypes
     White, Black, Empty = range(3)
     
-    # opCodes (Those starting with "Internal" shouldn't be used outside this class
+    # A position reached this often in the move phase ends the game in a remis
+    repetitionLimit = 3
+    
+    # Number of turns (of both players together) in the move phase without
+    # a removed piece, after which the game ends in a remis. None disables the rule.
+    noProgressLimit = 50
+    
+    # If True, every applyMove is cross-checked against the validated
+    # executeMove and every revertMove against the state before the move.
+    debugChecks = False
+    
+    # opCodes (Those starting with "Internal" shouldn't be used outside this class)
+    # The opCodeHistory contains them packed by encodeMove.
     OpMove, OpSet, OpRemove, InternalChangePhaseFromSetToMove, InternalChangePhaseFromMoveToEnd, InternalChangePhaseFromSetToRemove, InternalChangePhaseFromMoveToRemove, InternalChangePhaseFromRemoveToMove, InternalChangePhaseFromRemoveToSet = range(9)
     
     def __init__(self, otherBoard=None):
@@ -84,6 +178,12 @@ class Board (object):
             self.neverPlacedBlackPieces = 9
             self.opCodeHistory = []
             
+            # game phases before each applyMove, so revertMove can restore them
+            self.appliedPhases = []
+            
+            # positions reached in the move phase, see recordPosition()
+            self.positionHistory = []
+            
             # array containing the occupation of all board positions
             self.values = [Board.Empty] * 8 * 3
             
@@ -95,6 +195,8 @@ class Board (object):
             self.neverPlacedBlackPieces = otherBoard.neverPlacedBlackPieces
             self.values = copy.copy(otherBoard.values)
             self.opCodeHistory = copy.copy(otherBoard.opCodeHistory)
+            self.appliedPhases = copy.copy(otherBoard.appliedPhases)
+            self.positionHistory = copy.copy(otherBoard.positionHistory)
         
     def getOccupationAt (self, ringIndex, nodeIndex):
         ringIndex = ringIndex % 3
@@ -177,6 +279,58 @@ class Board (object):
         elif pieceType == self.White:
             return self.neverPlacedWhitePieces
         
+    def positionKey (self):
+        '''
+        Returns an integer, which uniquely identifies the current position.
+        The occupation is encoded in base 3, followed by the piece counters
+        and the game phase. The key doesn't depend on the process, so it
+        can be used for caches, that are shared between processes.
+        '''
+        key = 0
+        for val in self.values:
+            key = key * 3 + val
+        key = (key << 4) | self.unplacedWhitePieces
+        key = (key << 4) | self.unplacedBlackPieces
+        key = (key << 4) | self.neverPlacedWhitePieces
+        key = (key << 4) | self.neverPlacedBlackPieces
+        return (key << 3) | self.gamePhase
+    
+    def snapshot (self):
+        '''
+        Returns the current position as BoardSnapshot
+        '''
+        return BoardSnapshot(self.positionKey())
+    
+    # Boards are pickled (e.g. for worker processes) as bytes: a header,
+    # the values, the op codes, the applied phases and the positionHistory
+    pickleHeader = struct.Struct("<5B3I")
+    pickledPosition = struct.Struct("<QBIII")
+    
+    def __getstate__ (self):
+        header = self.pickleHeader.pack(self.gamePhase, self.unplacedWhitePieces, self.unplacedBlackPieces,
+                                        self.neverPlacedWhitePieces, self.neverPlacedBlackPieces,
+                                        len(self.opCodeHistory), len(self.appliedPhases),
+                                        len(self.positionHistory))
+        positions = b"".join(self.pickledPosition.pack(*entry) for entry in self.positionHistory)
+        return b"".join((header, bytes(self.values),
+                         struct.pack("<%dH" % len(self.opCodeHistory), *self.opCodeHistory),
+                         bytes(self.appliedPhases), positions))
+    
+    def __setstate__ (self, state):
+        (self.gamePhase, self.unplacedWhitePieces, self.unplacedBlackPieces,
+         self.neverPlacedWhitePieces, self.neverPlacedBlackPieces,
+         opCodes, appliedPhases, positions) = self.pickleHeader.unpack_from(state)
+        offset = self.pickleHeader.size
+        self.values = list(state[offset:offset + 3 * 8])
+        offset += 3 * 8
+        self.opCodeHistory = list(struct.unpack_from("<%dH" % opCodes, state, offset))
+        offset += 2 * opCodes
+        self.appliedPhases = list(state[offset:offset + appliedPhases])
+        offset += appliedPhases
+        self.positionHistory = list(self.pickledPosition.iter_unpack(state[offset:]))
+        if len(self.positionHistory) != positions:
+            raise ValueError("Invalid pickled board")
+
     def setPieceAt (self, valIndex, pieceType):
         if self.getNeverPlacedPieceCounter(pieceType) <= 0:
             return False
@@ -251,42 +405,177 @@ class Board (object):
         if  opCode[1] != self.Black and  opCode[1] != self.White:
             print ("Invalid Op Code (1) " + str(opCode))
             return False
+        for valIndex in opCode[2:]:
+            if valIndex < 0 or valIndex >= len(self.values):
+                print ("Invalid Op Code (5) " + str(opCode))
+                return False
+        
+        return self.executeMove(opCodeToMove(opCode))
+    
+    def executeMove (self, move):
+        '''
+        Same as executeOpCode, but takes a move packed by encodeMove.
+        '''
+        op = move & 15
+        pieceType = (move >> 4) & 3
+        if pieceType != self.Black and pieceType != self.White:
+            print ("Invalid Op Code (1) " + str(moveToOpCode(move)))
+            return False
         
-        if opCode[0] == self.OpSet:
-            if self.setPieceAt(opCode[2], opCode[1]):
-                self.opCodeHistory.append(opCode)
+        if op == self.OpSet:
+            valIndex = (move >> 6) & 31
+            if self.setPieceAt(valIndex, pieceType):
+                self.opCodeHistory.append(move)
                 # Check if moving created a new Muehle
-                toRing, toNode = convIndexToRingNotation(opCode[2])
+                toRing, toNode = convIndexToRingNotation(valIndex)
                 if self.checkForMuehle(toRing, toNode):
                     self.gamePhase = self.PieceSetRemovePhase
-                    self.opCodeHistory.append((self.InternalChangePhaseFromSetToRemove,))
+                    self.opCodeHistory.append(self.InternalChangePhaseFromSetToRemove)
                 return True
-            print ("Invalid Op Code (2)" + str(opCode))
+            print ("Invalid Op Code (2)" + str(moveToOpCode(move)))
             return False
-        elif opCode[0] == self.OpMove:
-            if self.movePiece(opCode[2], opCode[3], opCode[1]):
-                self.opCodeHistory.append(opCode)
+        elif op == self.OpMove:
+            toValIndex = (move >> 11) & 31
+            if self.movePiece((move >> 6) & 31, toValIndex, pieceType):
+                self.opCodeHistory.append(move)
                 # Check if moving created a new Muehle
-                toRing, toNode = convIndexToRingNotation(opCode[3])
+                toRing, toNode = convIndexToRingNotation(toValIndex)
                 if self.checkForMuehle(toRing, toNode):
                     self.gamePhase = self.PieceMoveRemovePhase
-                    self.opCodeHistory.append((self.InternalChangePhaseFromMoveToRemove,))
+                    self.opCodeHistory.append(self.InternalChangePhaseFromMoveToRemove)
                 return True
-            print ("Invalid Op Code (3)" + str(opCode))
+            print ("Invalid Op Code (3)" + str(moveToOpCode(move)))
             return False
-        elif opCode[0] == self.OpRemove:
-            if self.removePieceAt(opCode[2], opCode[1]):
-                self.opCodeHistory.append(opCode)
+        elif op == self.OpRemove:
+            if self.removePieceAt((move >> 6) & 31, pieceType):
+                self.opCodeHistory.append(move)
                 if self.gamePhase == self.PieceMoveRemovePhase:
-                    self.opCodeHistory.append((self.InternalChangePhaseFromRemoveToMove,))
+                    self.opCodeHistory.append(self.InternalChangePhaseFromRemoveToMove)
                     self.gamePhase = self.PieceMovePhase
                 elif self.gamePhase == self.PieceSetRemovePhase:
-                    self.opCodeHistory.append((self.InternalChangePhaseFromRemoveToSet,))
+                    self.opCodeHistory.append(self.InternalChangePhaseFromRemoveToSet)
                     self.gamePhase = self.PieceSetPhase 
                 return True
-            print ("Invalid Op Code (4)" + str(opCode))
+            print ("Invalid Op Code (4)" + str(moveToOpCode(move)))
             return False
         
+    def applyMove (self, move):
+        '''
+        Fast version of executeMove for the engine. The move is not
+        validated and nothing is logged, so it has to come from
+        nextPossibleMoves (see MinMax.py) for the current board.
+        Every applyMove has to be reverted by revertMove, before
+        the board is changed in any other way.
+        '''
+        if self.debugChecks and not getattr(debugCheckGuard, "active", False):
+            self.debugCheckApply(move)
+        
+        op = move & 15
+        pieceType = (move >> 4) & 3
+        values = self.values
+        self.appliedPhases.append(self.gamePhase)
+        
+        if op == self.OpSet:
+            valIndex = (move >> 6) & 31
+            values[valIndex] = pieceType
+            if pieceType == self.Black:
+                self.neverPlacedBlackPieces -= 1
+            else:
+                self.neverPlacedWhitePieces -= 1
+            self.opCodeHistory.append(move)
+            if self.checkForMuehle(valIndex >> 3, valIndex & 7):
+                self.gamePhase = self.PieceSetRemovePhase
+                self.opCodeHistory.append(self.InternalChangePhaseFromSetToRemove)
+                
+        elif op == self.OpMove:
+            toValIndex = (move >> 11) & 31
+            values[toValIndex] = pieceType
+            values[(move >> 6) & 31] = self.Empty
+            self.opCodeHistory.append(move)
+            if self.checkForMuehle(toValIndex >> 3, toValIndex & 7):
+                self.gamePhase = self.PieceMoveRemovePhase
+                self.opCodeHistory.append(self.InternalChangePhaseFromMoveToRemove)
+                
+        else:  # OpRemove
+            values[(move >> 6) & 31] = self.Empty
+            if pieceType == self.Black:
+                self.unplacedWhitePieces += 1
+            else:
+                self.unplacedBlackPieces += 1
+            self.opCodeHistory.append(move)
+            if self.gamePhase == self.PieceMoveRemovePhase:
+                self.opCodeHistory.append(self.InternalChangePhaseFromRemoveToMove)
+                self.gamePhase = self.PieceMovePhase
+            elif self.gamePhase == self.PieceSetRemovePhase:
+                self.opCodeHistory.append(self.InternalChangePhaseFromRemoveToSet)
+                self.gamePhase = self.PieceSetPhase
+                
+    def revertMove (self):
+        '''
+        Reverts the last applyMove, including all internal op codes
+        added after it (e.g. by checkBoardState).
+        '''
+        history = self.opCodeHistory
+        move = history.pop()
+        while (move & 15) > self.OpRemove:
+            move = history.pop()
+        
+        op = move & 15
+        pieceType = (move >> 4) & 3
+        if op == self.OpSet:
+            self.values[(move >> 6) & 31] = self.Empty
+            if pieceType == self.Black:
+                self.neverPlacedBlackPieces += 1
+            else:
+                self.neverPlacedWhitePieces += 1
+        elif op == self.OpMove:
+            self.values[(move >> 6) & 31] = pieceType
+            self.values[(move >> 11) & 31] = self.Empty
+        else:  # OpRemove
+            if pieceType == self.Black:
+                self.values[(move >> 6) & 31] = self.White
+                self.unplacedWhitePieces -= 1
+            else:
+                self.values[(move >> 6) & 31] = self.Black
+                self.unplacedBlackPieces -= 1
+        self.gamePhase = self.appliedPhases.pop()
+        self.dropUndonePositions()
+        
+        if self.debugChecks and not getattr(debugCheckGuard, "active", False):
+            self.debugCheckRevert()
+            
+    def debugState (self):
+        return (self.gamePhase, self.unplacedWhitePieces, self.unplacedBlackPieces,
+                self.neverPlacedWhitePieces, self.neverPlacedBlackPieces,
+                tuple(self.values), tuple(self.opCodeHistory), tuple(self.positionHistory))
+        
+    def debugCheckApply (self, move):
+        '''
+        Applies the move with the validated executeMove to a copy of
+        the board and compares the result with applyMove.
+        '''
+        if not hasattr(self, "debugStates"):
+            self.debugStates = []
+        self.debugStates.append(self.debugState())
+        
+        validatedBoard = Board(self)
+        if not validatedBoard.executeMove(move):
+            raise AssertionError("applyMove got an invalid move " + str(moveToOpCode(move)))
+        
+        debugCheckGuard.active = True
+        try:
+            self.applyMove(move)
+            state = self.debugState()
+            self.revertMove()
+        finally:
+            debugCheckGuard.active = False
+        if state != validatedBoard.debugState():
+            raise AssertionError("applyMove differs from executeMove for " + str(moveToOpCode(move)))
+        
+    def debugCheckRevert (self):
+        if self.debugStates.pop() != self.debugState():
+            raise AssertionError("revertMove didn't restore the board")
+            
     def undo (self):
         '''
         Reverse applies a turn
@@ -295,83 +584,149 @@ class Board (object):
             op = self.opCodeHistory.pop()
             if self.invertExecuteOpCode(op):
                 break
+        self.dropUndonePositions()
     
-    removeSetFlag = False
-    
-    def invertExecuteOpCode (self, opCode):
+    def invertExecuteOpCode (self, move):
         '''
         As one turn can consist of an internal op code and
         a normal op code, this method returns True, if a normal
         op code has been reverse applied. This signals the
         end of a turn.
         '''
+        op = move & 15
         
-        if opCode[0] == self.InternalChangePhaseFromMoveToEnd:
+        if op == self.InternalChangePhaseFromMoveToEnd:
             self.gamePhase = self.PieceMovePhase
             return False
-        elif opCode[0] == self.InternalChangePhaseFromSetToMove:
+        elif op == self.InternalChangePhaseFromSetToMove:
             self.gamePhase = self.PieceSetPhase 
             return False
-        elif opCode[0] == self.InternalChangePhaseFromMoveToRemove:
+        elif op == self.InternalChangePhaseFromMoveToRemove:
             self.gamePhase = self.PieceMovePhase 
             return False
-        elif opCode[0] == self.InternalChangePhaseFromRemoveToMove:
+        elif op == self.InternalChangePhaseFromRemoveToMove:
             self.gamePhase = self.PieceMoveRemovePhase
-            self.removeSetFlag = False
             return False
-        elif opCode[0] == self.InternalChangePhaseFromRemoveToSet:
+        elif op == self.InternalChangePhaseFromRemoveToSet:
             self.gamePhase = self.PieceSetRemovePhase
-            self.removeSetFlag = True
             return False
-        elif opCode[0] == self.InternalChangePhaseFromSetToRemove:
+        elif op == self.InternalChangePhaseFromSetToRemove:
             self.gamePhase = self.PieceSetPhase
             return False
         
-        if opCode[0] == self.OpRemove:
-            self.values[opCode[2]] = invertPieceType(opCode[1])
-            if self.removeSetFlag:
-                self.changeUnplacedPieceCounter(invertPieceType(opCode[1]), -1)
+        pieceType = (move >> 4) & 3
+        if op == self.OpRemove:
+            self.values[(move >> 6) & 31] = invertPieceType(pieceType)
+            self.changeUnplacedPieceCounter(invertPieceType(pieceType), -1)
             return False
-        if opCode[0] == self.OpSet:
-            self.values[opCode[2]] = self.Empty  
-            self.changeNeverPlacedPieceCounter(opCode[1], 1)
+        if op == self.OpSet:
+            self.values[(move >> 6) & 31] = self.Empty  
+            self.changeNeverPlacedPieceCounter(pieceType, 1)
             return True
-        if opCode[0] == self.OpMove:
-            self.movePiece(opCode[3], opCode[2], opCode[1])
+        if op == self.OpMove:
+            self.movePiece((move >> 11) & 31, (move >> 6) & 31, pieceType)
             return True
           
-    def checkBoardState (self, nextPlayerPieceType):
+    def checkBoardState (self, nextPlayerPieceType, log=True):
         '''
-        Should be called after the a call to executeOpCode().1
+        Should be called after the a call to executeOpCode().
         Checks the board for terminal states (one party one, or remis) and
-        gamePhase changes.
+        gamePhase changes. The engine passes log=False.
         '''
         if self.gamePhase == Board.PieceSetPhase:
             if self.neverPlacedBlackPieces == 0 and self.neverPlacedWhitePieces == 0:
-                self.opCodeHistory.append((self.InternalChangePhaseFromSetToMove,))
+                self.opCodeHistory.append(self.InternalChangePhaseFromSetToMove)
                 
                 if not self.anyUnblockedPieceLeft(nextPlayerPieceType):
-                    self.opCodeHistory.append((self.InternalChangePhaseFromMoveToEnd,))
+                    self.opCodeHistory.append(self.InternalChangePhaseFromMoveToEnd)
                     self.letPieceTypeWin(invertPieceType(nextPlayerPieceType))
-                    print ("Win 0")
+                    if log:
+                        print ("Win 0")
                     
                 else:
                     self.gamePhase = Board.PieceMovePhase
+                    self.checkForRemis(log)
         else:
             if not self.anyUnblockedPieceLeft(nextPlayerPieceType):
-                self.opCodeHistory.append((self.InternalChangePhaseFromMoveToEnd,))
+                self.opCodeHistory.append(self.InternalChangePhaseFromMoveToEnd)
                 self.letPieceTypeWin(invertPieceType(nextPlayerPieceType))
-                print ("Win 1")
+                if log:
+                    print ("Win 1")
                 
             if self.unplacedBlackPieces >= 9 - 2:
-                self.opCodeHistory.append((self.InternalChangePhaseFromMoveToEnd,))
+                self.opCodeHistory.append(self.InternalChangePhaseFromMoveToEnd)
                 self.gamePhase = Board.WhiteWins
-                print ("Win 2")
+                if log:
+                    print ("Win 2")
                 
             elif self.unplacedWhitePieces >= 9 - 2:
-                self.opCodeHistory.append((self.InternalChangePhaseFromMoveToEnd,))
+                self.opCodeHistory.append(self.InternalChangePhaseFromMoveToEnd)
                 self.gamePhase = Board.BlackWins 
-                print ("Win 3")
+                if log:
+                    print ("Win 3")
+                    
+            if self.gamePhase == Board.PieceMovePhase:
+                self.checkForRemis(log)
+                
+    def checkForRemis (self, log=True):
+        '''
+        Records the current position and ends the game in a remis, if it
+        was repeated too often or nothing was removed for too long.
+        '''
+        repetitions, noProgressCounter = self.recordPosition()
+        if (repetitions + 1 >= self.repetitionLimit or
+            (self.noProgressLimit != None and noProgressCounter >= self.noProgressLimit)):
+            self.opCodeHistory.append(self.InternalChangePhaseFromMoveToEnd)
+            self.gamePhase = Board.Remis
+            if log:
+                print ("Remis")
+    
+    def recordPosition (self):
+        '''
+        Pushes the current position onto the positionHistory. Each entry
+        consists of (position key including the player who just finished
+        his turn, number of removed pieces, turns since the last removal,
+        number of earlier occurrences, length of the opCodeHistory).
+        Returns the number of earlier occurrences and the turns since
+        the last removal.
+        '''
+        key = self.positionKey() << 1
+        for op in reversed(self.opCodeHistory):
+            if (op & 15) <= self.OpRemove:
+                key |= (op >> 4) & 1
+                break
+        removedPieces = self.unplacedWhitePieces + self.unplacedBlackPieces
+        
+        noProgressCounter = 0
+        repetitions = 0
+        if len(self.positionHistory) > 0 and self.positionHistory[-1][1] == removedPieces:
+            noProgressCounter = self.positionHistory[-1][2] + 1
+            # Positions before the last removal can't be the same
+            for i in range(1, noProgressCounter + 1):
+                if self.positionHistory[-i][0] == key:
+                    repetitions += 1
+        
+        self.positionHistory.append((key, removedPieces, noProgressCounter, repetitions, len(self.opCodeHistory)))
+        return repetitions, noProgressCounter
+    
+    def currentRepetitions (self):
+        '''
+        Returns how often the current position was reached before,
+        if it was recorded by checkBoardState, otherwise 0.
+        '''
+        if len(self.positionHistory) == 0:
+            return 0
+        entry = self.positionHistory[-1]
+        if entry[4] != len(self.opCodeHistory):
+            return 0
+        return entry[3]
+    
+    def dropUndonePositions (self):
+        '''
+        Removes the positions, whose turns were undone.
+        '''
+        while len(self.positionHistory) > 0 and self.positionHistory[-1][4] > len(self.opCodeHistory):
+            self.positionHistory.pop()
     
     def letPieceTypeWin (self, pieceType):
         if pieceType == self.Black:
@@ -0,0 +1,82 @@
+from GameBoard import Board, invertPieceType
+import Trace
+
+
+class HeadlessGame(object):
+    '''
+    High level manager for the GameBoard without any UI. Decides which
+    player's turn it is. Game (see Game.py) runs the same game in its own
+    thread for the UI, this one can be driven directly, e.g. by batch workers.
+    '''
+    
+    # Flag to abort the game as soon as possible
+    aborted = False
+    
+    def __init__ (self, player1, player2, turnFinishedReceiver=None):
+        self.board = Board()
+        self.player1 = player1
+        self.player2 = player2
+        player1.board = self.board
+        player2.board = self.board
+        self.turnCounter = 0
+        
+        # Called after every finished turn
+        self.turnFinishedReceiver = turnFinishedReceiver
+        
+    def isOver (self):
+        return not (self.board.gamePhase == Board.PieceMovePhase or
+                    self.board.gamePhase == Board.PieceSetPhase or
+                    self.board.gamePhase == Board.PieceSetRemovePhase or
+                    self.board.gamePhase == Board.PieceMoveRemovePhase)
+        
+    def play (self):
+        '''
+        Plays turns, until the game is over or aborted.
+        Returns True, if the game is over. Raises a RuntimeError, if the
+        engine of an AI player died.
+        '''
+        while not self.aborted and not self.isOver():
+            self.nextTurn()
+        return not self.aborted
+    
+    def nextTurn (self):
+        player = self.getCurrentPlayer()
+        with Trace.span("turn", "game", {"turn": self.turnCounter, "player": player.pieceType}):
+            if player.doTurn():
+                self.turnFinished()
+                
+                if (self.board.gamePhase == Board.PieceSetRemovePhase
+                    or self.board.gamePhase == Board.PieceMoveRemovePhase):
+                    player.doTurn()
+                    self.turnFinished()
+                 
+                self.board.checkBoardState(invertPieceType(player.pieceType))
+                self.turnCounter += 1
+            
+    def turnFinished (self):
+        if self.turnFinishedReceiver != None:
+            self.turnFinishedReceiver()
+            
+    def close (self):
+        '''
+        Releases the players (e.g. their engine processes). The game
+        mustn't be running anymore.
+        '''
+        self.player1.close()
+        self.player2.close()
+        
+    def undo (self):
+        if self.turnCounter == 0:
+            return
+        
+        self.turnCounter -= 1
+        self.board.undo()
+        
+    def doesCurrentPlayerUseMouse (self):
+        return self.getCurrentPlayer().usesMouse()
+        
+    def getCurrentPlayer (self):
+        if self.turnCounter % 2 == 0:
+            return self.player1
+        else:
+            return self.player2
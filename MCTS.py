@@ -0,0 +1,292 @@
+'''
+Monte Carlo tree search as an alternative to the alpha beta search in
+MinMax.py. It uses the same Board and nextPossibleMoves, has a best move
+after the first few iterations and gets better the longer it runs.
+Every iteration selects a path through the tree by UCT, adds one new node,
+plays a random game from there (cut off after rolloutTurns turns and
+scored by the evaluation) and adds the result to all nodes of the path.
+'''
+import math
+import random
+
+from GameBoard import Board, invertPieceType
+import MinMax
+import Trace
+
+
+# exploration constant of UCT
+exploration = 1.4
+
+# turns a rollout is played, before the position is scored by the evaluation
+rolloutTurns = 30
+
+# scales the evaluation, before it's squashed into a result between 0 and 1
+evaluationScale = 0.01
+
+# how often (in iterations) progressChange gets called
+progressIterations = 64
+
+def isOver (board):
+    return (board.gamePhase == Board.WhiteWins or
+            board.gamePhase == Board.BlackWins or
+            board.gamePhase == Board.Remis)
+
+def playMove (board, move, pieceType):
+    '''
+    Applies the move and ends the turn, if no piece has to be removed.
+    Returns the player to move next. Reverted by board.revertMove().
+    '''
+    board.applyMove(move)
+    if (board.gamePhase == Board.PieceSetRemovePhase
+        or board.gamePhase == Board.PieceMoveRemovePhase):
+        return pieceType
+    board.checkBoardState(invertPieceType(pieceType), False)
+    return invertPieceType(pieceType)
+
+def positionResult (board, player):
+    '''
+    Result for white: 1 if white won, 0 if black won, 0.5 for remis.
+    Unfinished games are scored by the evaluation.
+    '''
+    if board.gamePhase == Board.WhiteWins:
+        return 1.0
+    if board.gamePhase == Board.BlackWins:
+        return 0.0
+    if board.gamePhase == Board.Remis:
+        return 0.5
+    score = MinMax.evaluateBoardState(board, Board.White, player)
+    return 1 / (1 + math.exp(-evaluationScale * score))
+
+class Node (object):
+    '''
+    A position in the tree, reached by move from the parent's position
+    '''
+
+    def __init__ (self, move, parent, player):
+        self.move = move
+        self.parent = parent
+        # player to move in the position of this node
+        self.player = player
+        self.children = []
+        # moves without a child yet, generated on the first visit
+        self.untriedMoves = None
+        self.visits = 0
+        # sum of the results for the player who made the move (win 1, remis 0.5)
+        self.score = 0.0
+
+    def child (self, move):
+        for child in self.children:
+            if child.move == move:
+                return child
+        return None
+
+    def mostVisitedChild (self):
+        bestChild = None
+        for child in self.children:
+            if bestChild == None or child.visits > bestChild.visits:
+                bestChild = child
+        return bestChild
+
+    def selectChild (self):
+        '''
+        Returns the child with the best upper confidence bound (UCT)
+        '''
+        logVisits = math.log(self.visits)
+        bestChild = None
+        bestValue = None
+        for child in self.children:
+            value = child.score / child.visits + exploration * math.sqrt(logVisits / child.visits)
+            if bestValue == None or value > bestValue:
+                bestChild = child
+                bestValue = value
+        return bestChild
+
+class MCTSEngine (object):
+    '''
+    Keeps the tree between searches: if the next position follows from the
+    searched one, the matching subtree is searched further.
+    With workers > 1, as many trees are searched in parallel (the other
+    ones in separate processes) and their root statistics are merged.
+    '''
+
+    def __init__ (self, workers=1, seed=None):
+        self.workers = workers
+        self.rng = random.Random(seed)
+        self.root = None
+        # moves leading to the root
+        self.rootMoves = []
+        self.executor = None
+
+    def close (self):
+        if self.executor != None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def reuseTree (self, moves, pieceType):
+        '''
+        Makes the node of the position after moves the root,
+        if it is part of the tree. Otherwise a new tree is started.
+        '''
+        root = None
+        if self.root != None and moves[:len(self.rootMoves)] == self.rootMoves:
+            root = self.root
+            for move in moves[len(self.rootMoves):]:
+                root = root.child(move)
+                if root == None:
+                    break
+        if root == None or root.player != pieceType:
+            root = Node(None, None, pieceType)
+        root.parent = None
+        self.root = root
+        self.rootMoves = moves
+
+    def search (self, board, pieceType, iterations=None, search=None, progressChange=None):
+        '''
+        Runs iterations (or until search is stopped / its deadline passed),
+        returns the best move. progressChange (if supplied) gets
+        (depth of the principal variation, iterations done,
+        expected iterations, best move so far).
+        '''
+        if search == None:
+            search = MinMax.Search()
+        # The moves are applied and reverted in place
+        board = Board(board)
+        self.reuseTree([move for move in board.opCodeHistory if (move & 15) <= Board.OpRemove], pieceType)
+
+        workerResults = []
+        if self.workers > 1:
+            if self.executor == None:
+                self.executor = MinMax.processPool(self.workers - 1)
+            # The board is pickled in the background, give it a copy nobody changes
+            workerBoard = Board(board)
+            workerResults = [self.executor.submit(searchInWorker, workerBoard, pieceType, iterations,
+                                                  search.deadline, self.rng.random())
+                             for i in range(self.workers - 1)]
+
+        iteration = 0
+        while not search.stopped and (iterations == None or iteration < iterations):
+            # Traced in batches, a span per iteration would slow it down
+            with Trace.span("rollouts", "search", {"first": iteration}):
+                batchEnd = iteration + progressIterations
+                while (iteration < batchEnd and not search.stopped
+                       and (iterations == None or iteration < iterations)):
+                    self.iterate(board, search)
+                    iteration += 1
+            if progressChange != None and iteration % progressIterations == 0:
+                progressChange(len(self.principalVariation()), iteration,
+                               self.expectedIterations(iteration, iterations, search), self.bestMove())
+
+        if len(workerResults) == 0:
+            return self.bestMove()
+
+        # Root parallelisation: sum up the statistics of all trees
+        visits = {}
+        for child in self.root.children:
+            visits[child.move] = child.visits
+        for result in workerResults:
+            for move, (childVisits, childScore) in result.result().items():
+                visits[move] = visits.get(move, 0) + childVisits
+        if len(visits) == 0:
+            return None
+        return max(visits, key=visits.get)
+
+    def expectedIterations (self, iteration, iterations, search):
+        if iterations != None:
+            return iterations
+        if search.deadline == None:
+            return iteration
+        elapsed = search.elapsedTime()
+        if elapsed <= 0:
+            return iteration
+        return max(iteration, int(iteration * (search.deadline - search.startTime) / elapsed))
+
+    def iterate (self, board, search):
+        '''
+        One iteration: selection, expansion, rollout and backpropagation
+        '''
+        node = self.root
+        applied = 0
+        while not isOver(board):
+            if node.untriedMoves == None:
+                node.untriedMoves = list(MinMax.nextPossibleMoves(board, node.player))
+                self.rng.shuffle(node.untriedMoves)
+
+            if len(node.untriedMoves) > 0:
+                move = node.untriedMoves.pop()
+                child = Node(move, node, playMove(board, move, node.player))
+                applied += 1
+                search.visitNode()
+                node.children.append(child)
+                node = child
+                break
+
+            if len(node.children) == 0:
+                break
+            node = node.selectChild()
+            playMove(board, node.move, node.parent.player)
+            applied += 1
+            search.visitNode()
+
+        result = self.rollout(board, node.player, search)
+        for i in range(applied):
+            board.revertMove()
+
+        while node != None:
+            node.visits += 1
+            if node.parent != None:
+                node.score += result if node.parent.player == Board.White else 1 - result
+            node = node.parent
+
+    def rollout (self, board, player, search):
+        '''
+        Plays random moves from the position. Returns the result for white.
+        '''
+        applied = 0
+        turns = 0
+        while not isOver(board) and turns < rolloutTurns:
+            moves = list(MinMax.nextPossibleMoves(board, player))
+            if len(moves) == 0:
+                break
+            nextPlayer = playMove(board, self.rng.choice(moves), player)
+            applied += 1
+            search.visitNode()
+            if nextPlayer != player:
+                turns += 1
+            player = nextPlayer
+
+        result = positionResult(board, player)
+        for i in range(applied):
+            board.revertMove()
+        return result
+
+    def bestMove (self):
+        child = self.root.mostVisitedChild()
+        if child == None:
+            return None
+        return child.move
+
+    def winRate (self):
+        '''
+        Expected result of the best move for the player to move
+        '''
+        child = self.root.mostVisitedChild()
+        if child == None or child.visits == 0:
+            return 0.5
+        return child.score / child.visits
+
+    def principalVariation (self):
+        moves = []
+        node = self.root.mostVisitedChild()
+        while node != None:
+            moves.append(node.move)
+            node = node.mostVisitedChild()
+        return moves
+
+def searchInWorker (board, pieceType, iterations, deadline, seed):
+    '''
+    Runs in a worker process. Searches a tree of its own and returns the
+    statistics of the root's children: move -> (visits, score)
+    '''
+    engine = MCTSEngine(seed=seed)
+    engine.search(board, pieceType, iterations, MinMax.Search(deadline))
+    return {child.move: (child.visits, child.score) for child in engine.root.children}
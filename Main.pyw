@@ -1,6 +1,15 @@
+import sys
+
+import Trace
 from UI import QMainMuehleUI
 
 
 if __name__ == "__main__":
+    # python Main.pyw --trace trace.json records a timeline (see Trace.py)
+    if len(sys.argv) > 2 and sys.argv[1] == "--trace":
+        Trace.start(sys.argv[2])
+        del sys.argv[1:3]
     qt = QMainMuehleUI()
     qt.start()
+    if Trace.enabled:
+        Trace.write()
@@ -0,0 +1,139 @@
+'''
+Opt-in memory instrumentation of the search (see Benchmark.py memory).
+profileBestNextMove runs MinMax.bestNextMove under tracemalloc and
+reports, how much memory the search needed at its peak and kept
+afterwards, per search and per visited node, where it was allocated
+and which objects were left over.
+tracemalloc only knows the blocks alive at a time, not how many were
+allocated and freed again in between, so the allocations are counted
+as the blocks alive at the peak and after the search. Tracing makes the
+search several times slower, it's only meant for measuring.
+'''
+import gc
+import tracemalloc
+
+import MinMax
+# imported by the search on first use, would count as its allocations otherwise
+import ProofSearch
+
+
+# the allocations of the tracing itself and of imports aren't reported
+traceFilters = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    tracemalloc.Filter(False, __file__),
+]
+
+# the search samples the traced memory every 1024 nodes (see
+# MinMax.Search.visitNode) and takes a snapshot, if it grew by more
+# than this fraction since the last one
+snapshotGrowth = 0.1
+
+def objectCounts ():
+    '''
+    Number of objects tracked by the garbage collector (containers,
+    e.g. lists, tuples, dicts and instances) by type name
+    '''
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def siteStatistics (snapshot, baseline, top):
+    '''
+    The top allocation sites (file:line), which grew the most since the
+    baseline, as (site, bytes, blocks)
+    '''
+    sites = []
+    for stat in snapshot.compare_to(baseline, "lineno")[:top]:
+        frame = stat.traceback[0]
+        sites.append(("%s:%d" % (frame.filename.split("/")[-1].split("\\")[-1], frame.lineno),
+                      stat.size_diff, stat.count_diff))
+    return sites
+
+class MemoryProfile (object):
+    '''
+    Used as stop condition of the search, to take snapshots near the
+    peak. Never stops the search.
+    '''
+
+    def __init__ (self, top):
+        self.top = top
+        self.baseline = None
+        self.baselineSize = 0
+        self.peak = 0
+        self.peakSites = []
+        self.snapshotSize = 0
+
+    def start (self):
+        gc.collect()
+        tracemalloc.start()
+        self.baseline = tracemalloc.take_snapshot().filter_traces(traceFilters)
+        self.baselineSize = tracemalloc.get_traced_memory()[0]
+        self.peak = self.baselineSize
+        self.snapshotSize = self.baselineSize
+
+    def __call__ (self):
+        size, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        if size > self.snapshotSize * (1 + snapshotGrowth):
+            self.peakSites = siteStatistics(tracemalloc.take_snapshot().filter_traces(traceFilters),
+                                            self.baseline, self.top)
+            self.snapshotSize = size
+            # Taking the snapshot needed memory as well, the peak
+            # of the search is measured without it
+            tracemalloc.reset_peak()
+        return False
+
+    def stop (self):
+        '''
+        Returns the bytes alive now and the peak, both above the baseline
+        '''
+        size, peak = tracemalloc.get_traced_memory()
+        return size - self.baselineSize, max(self.peak, peak) - self.baselineSize
+
+def profileBestNextMove (board, pieceType, depth, cache=None, top=10):
+    '''
+    Runs bestNextMove with tracing. Returns the best move and a dict:
+    nodes, peak bytes (above the memory before the search) and the bytes
+    and blocks still alive after the search, each also per node, the top
+    allocation sites near the peak and after the search
+    ((file:line, bytes, blocks)) and the top changes of the object counts.
+    '''
+    profile = MemoryProfile(top)
+    countsBefore = objectCounts()
+    profile.start()
+    try:
+        search = MinMax.Search(stopCondition=profile)
+        bestMove = MinMax.bestNextMove(board, pieceType, depth, cache=cache, search=search)
+        retainedBytes, peakBytes = profile.stop()
+        snapshot = tracemalloc.take_snapshot().filter_traces(traceFilters)
+    finally:
+        tracemalloc.stop()
+    retainedSites = siteStatistics(snapshot, profile.baseline, top)
+    retainedBlocks = sum(stat.count_diff for stat in snapshot.compare_to(profile.baseline, "filename"))
+    # The snapshots and the search counters aren't left over by the search
+    snapshot = None
+    profile.baseline = None
+    visitedNodes = search.nodes
+    search = None
+    countsAfter = objectCounts()
+
+    nodes = max(1, visitedNodes)
+    changes = {name: countsAfter.get(name, 0) - countsBefore.get(name, 0)
+               for name in set(countsBefore) | set(countsAfter)}
+    changes = sorted(((name, change) for name, change in changes.items() if change != 0),
+                     key=lambda entry: -abs(entry[1]))
+    return bestMove, {
+        "nodes": visitedNodes,
+        "peakBytes": peakBytes,
+        "peakBytesPerNode": peakBytes / nodes,
+        "retainedBytes": retainedBytes,
+        "retainedBytesPerNode": retainedBytes / nodes,
+        "retainedBlocks": retainedBlocks,
+        "retainedBlocksPerNode": retainedBlocks / nodes,
+        "peakSites": profile.peakSites,
+        "retainedSites": retainedSites,
+        "objectCounts": changes[:top],
+    }
@@ -1,53 +1,95 @@
-from asyncio.tasks import sleep
+import os
+import time
 
-from GameBoard import Board, invertPieceType, convRingNotationToIndex, convIndexToRingNotation
+from GameBoard import Board, invertPieceType, convRingNotationToIndex, convIndexToRingNotation, encodeMove
+from PositionCache import PositionCache, searchKey
+import Trace
 
 
 infinity = 10000000000
 
+# half width of the window around the score of the previous iteration,
+# the next iteration starts with (see iterativeBestNextMove)
+aspirationWindow = 100
+
+# Selective search, every feature can be switched off separately, so the
+# saved nodes can be compared with the playing strength (see Benchmark.py).
+# Quiet moves are those, which neither close a muehle nor remove a piece.
+
+# Late move reductions: quiet moves after the first lateMoveReductionMoves
+# of a node are searched one ply less, if at least lateMoveReductionDepth
+# plies are left. If one of them beats alpha, it's searched again at full depth.
+lateMoveReductions = True
+lateMoveReductionMoves = 3
+lateMoveReductionDepth = 3
+
+# Futility pruning: with depth plies left, quiet moves are skipped, if the
+# evaluation of the position plus futilityMargins[depth] doesn't reach alpha.
+futilityPruning = True
+futilityMargins = [0, 20, 50]
+
+# Quiescence search: positions at the end of the search aren't evaluated
+# right away, if a piece has to be removed or the player to move can close
+# a muehle. Those moves are searched further, until the position is quiet
+# or quiescenceNodeLimit nodes were searched from that position.
+quiescenceSearch = True
+quiescenceNodeLimit = 8
+
+# Proof number search (see ProofSearch.py): in the move phase, the search
+# first looks for a forced win within proofNodeBudget positions
+proofSearch = True
+proofNodeBudget = 2000
+
 def nextPossibleMoves (board, pieceType):
     '''
-    Returns all possible next board moves for the given board.
+    Returns all possible next board moves for the given board,
+    packed by encodeMove.
     '''
     
     if board.gamePhase == Board.PieceSetPhase:  # Set moves
+        if board.getNeverPlacedPieceCounter(pieceType) <= 0:
+            return
+        setMove = encodeMove(Board.OpSet, pieceType)
         for iVal in range(len(board.values)):
             if board.values[iVal] == Board.Empty:
-                yield (Board.OpSet, pieceType, iVal)
+                yield setMove | (iVal << 6)
     elif board.gamePhase == Board.PieceMovePhase:  # move moves
+        moveMove = encodeMove(Board.OpMove, pieceType)
         for iRing in range(3):
             for iNode in range(8):
                 nodeVal = iRing * 8 + iNode
                 if board.values[nodeVal] != pieceType:
                     continue
                 
+                fromMove = moveMove | (nodeVal << 6)
                 if board.getUnplacedPieceCounter(pieceType) >= 9 - 3:
                     index = 0
                     for iVal in board.values:
                         if iVal == Board.Empty:
-                            yield (Board.OpMove, pieceType, nodeVal, index)
+                            yield fromMove | (index << 11)
                         index += 1
                     continue
                 if board.getOccupationAt(iRing, iNode + 1) == Board.Empty:
-                    yield (Board.OpMove, pieceType, nodeVal, convRingNotationToIndex(iRing, iNode + 1))
+                    yield fromMove | (convRingNotationToIndex(iRing, iNode + 1) << 11)
                 if board.getOccupationAt(iRing, iNode - 1) == Board.Empty:
-                    yield (Board.OpMove, pieceType, nodeVal, convRingNotationToIndex(iRing, iNode - 1))             
+                    yield fromMove | (convRingNotationToIndex(iRing, iNode - 1) << 11)
                 if iNode % 2 == 0:  # edge node
                     if iRing <= 1 and board.getOccupationAt(iRing + 1, iNode) == Board.Empty:
-                        yield (Board.OpMove, pieceType, nodeVal, convRingNotationToIndex(iRing + 1, iNode))  
+                        yield fromMove | (convRingNotationToIndex(iRing + 1, iNode) << 11)
                     if iRing >= 1 and board.getOccupationAt(iRing - 1, iNode) == Board.Empty:
-                        yield (Board.OpMove, pieceType, nodeVal, convRingNotationToIndex(iRing - 1, iNode))
+                        yield fromMove | (convRingNotationToIndex(iRing - 1, iNode) << 11)
     elif (board.gamePhase == Board.PieceSetRemovePhase
           or board.gamePhase == Board.PieceMoveRemovePhase):
         opponentPieceType = invertPieceType(pieceType)
+        removeMove = encodeMove(Board.OpRemove, pieceType)
         for iVal in range(len(board.values)):
             if board.values[iVal] == opponentPieceType:
                 iRing, iNode = convIndexToRingNotation(iVal)
                 if board.checkForMuehle(iRing, iNode):
                     if not board.anyUnsafePieceLeft(invertPieceType(pieceType)):
-                        yield (Board.OpRemove, pieceType, iVal)
+                        yield removeMove | (iVal << 6)
                     continue
-                yield (Board.OpRemove, pieceType, iVal)
+                yield removeMove | (iVal << 6)
 
 def nextBoardStates (board, pieceType):
     '''
@@ -56,14 +98,28 @@ def nextBoardStates (board, pieceType):
     
     for move in nextPossibleMoves(board, pieceType):
         cpyBoard = Board(board)
-        cpyBoard.executeOpCode(move)
+        cpyBoard.executeMove(move)
         yield cpyBoard, move
+
+def orderedMoves (board, pieceType, firstMove):
+    '''
+    Like nextPossibleMoves, but starts with firstMove (usually the best
+    move found by an earlier search), if it is a possible move.
+    '''
+    if firstMove == None:
+        return nextPossibleMoves(board, pieceType)
+    
+    moves = list(nextPossibleMoves(board, pieceType))
+    if firstMove in moves:
+        moves.remove(firstMove)
+        moves.insert(0, firstMove)
+    return moves
                 
 def isTerminal (board, nextPlayerPieceType):
     '''
     Checks if the game is over
     '''
-    board.checkBoardState(nextPlayerPieceType)
+    board.checkBoardState(nextPlayerPieceType, False)
     return (board.gamePhase == Board.WhiteWins or
             board.gamePhase == Board.BlackWins or
             board.gamePhase == Board.Remis)
@@ -85,64 +141,766 @@ def evaluateTerminalState(board, pieceType):
     if board.gamePhase == Board.Remis:
         return 0
     
-def bestNextMove(board, pieceType, depth, progressChange=None):
+class Search (object):
     '''
-    Returns best next move for Agent, using Alpha Beta Min Max search
+    Keeps track of a running search. Counts the visited nodes and
+    tells the search to stop, when stop() was called (e.g. from another
+    thread), the deadline (see time.time()) has passed or nodeLimit nodes
+    were visited. Unlike the deadline, the node limit is checked at every
+    node, so a search limited by nodes only has the same result on
+    every machine.
     '''
     
-    alpha = -infinity 
+    def __init__ (self, deadline=None, stopCondition=None, nodeLimit=None):
+        self.nodes = 0
+        self.startTime = time.time()
+        self.deadline = deadline
+        self.nodeLimit = nodeLimit
+        self.stopped = False
+        # Called together with the check of the deadline, the search
+        # stops when it returns True (e.g. a flag set by another process)
+        self.stopCondition = stopCondition
+        
+        # Iterations, whose score fell outside of the aspiration window
+        # and had to be searched again
+        self.failHighs = 0
+        self.failLows = 0
+        # Null window probes, which found a better move and were searched again
+        self.reSearches = 0
+        # Selective search: reduced moves, reduced moves searched again
+        # at full depth and moves skipped by futility pruning
+        self.reductions = 0
+        self.reductionReSearches = 0
+        self.futilityPrunes = 0
+        # Nodes of the quiescence search (including the positions at the
+        # end of the regular search) and nodes left for the current position
+        self.quiescenceNodes = 0
+        self.quiescenceBudget = 0
+        # Scores, which depend on the positions played before (repetitions
+        # and remis), counted by historyCutoff. Results searched below them
+        # are only valid for this search, they are kept in historyCache
+        # instead of the cache, which is shared and saved (see resultCache).
+        self.historyCutoffs = 0
+        self.historyCache = PositionCache()
+        
+    def stop (self):
+        self.stopped = True
+        
+    def visitNode (self):
+        '''
+        Returns True, if the search should stop
+        '''
+        self.nodes += 1
+        if self.stopped:
+            return True
+        if self.nodeLimit != None and self.nodes >= self.nodeLimit:
+            self.stopped = True
+            return True
+        # Only look at the clock every 1024 nodes
+        if self.nodes & 1023 == 0:
+            if self.deadline != None and time.time() >= self.deadline:
+                self.stopped = True
+            if self.stopCondition != None and self.stopCondition():
+                self.stopped = True
+        return self.stopped
+    
+    def elapsedTime (self):
+        return time.time() - self.startTime
+    
+    def nodesPerSecond (self):
+        elapsed = self.elapsedTime()
+        if elapsed <= 0:
+            return 0
+        return int(self.nodes / elapsed)
+    
+def bestNextMove(board, pieceType, depth, progressChange=None, cache=None, search=None):
+    '''
+    Returns best next move for Agent (packed by encodeMove), using Alpha Beta Min Max search.
+    If a PositionCache is supplied, already searched positions are looked up
+    in it and the results of this search are stored in it.
+    After every searched move progressChange (if supplied) gets
+    (depth, searched moves, number of moves, best move so far).
+    A forced win found by the proof number search is played right away.
+    '''
+    winningMove = provenWinningMove(board, pieceType, search)
+    if winningMove != None:
+        return winningMove
+    return searchRoot(board, pieceType, depth, progressChange, cache, search)[0]
+
+def provenWinningMove (board, pieceType, search=None):
+    '''
+    Returns a move forcing a win for pieceType, if the proof number search
+    finds one within proofNodeBudget positions, otherwise None
+    '''
+    if (not proofSearch
+        or (board.gamePhase != Board.PieceMovePhase and board.gamePhase != Board.PieceMoveRemovePhase)):
+        return None
+    nodeBudget = proofNodeBudget
+    if search != None and search.nodeLimit != None:
+        # Most of the nodes are left for the alpha beta search
+        nodeBudget = min(nodeBudget, (search.nodeLimit - search.nodes) // 4)
+    import ProofSearch
+    with Trace.span("proof search", "search", {"budget": nodeBudget}):
+        return ProofSearch.winningMove(board, pieceType, nodeBudget, search)
+
+def searchRoot (board, pieceType, depth, progressChange=None, cache=None, search=None,
+                alpha=-infinity, beta=infinity):
+    '''
+    Searches all moves of the current player to the given depth.
+    Returns the best move and its score. A score <= alpha or >= beta
+    only is a bound (see iterativeBestNextMove). If the search was stopped,
+    the result only covers the moves searched until then.
+    '''
+    
+    # The search applies and reverts the moves in place,
+    # the board of the game stays untouched.
+    board = Board(board)
+    if search == None:
+        search = Search()
+    
+    alphaOrig = alpha
     bestMove = None
     counter = 0
-    topLevelPossibleMoveCount = 100 / countTopLevelPossibleMoves(board, pieceType)
-    for newBoard, opCode in nextBoardStates(board, pieceType):
-        result = minScore(newBoard, depth - 1, pieceType, invertPieceType(pieceType), alpha, infinity)
-        if result > alpha:
+    historyCutoffs = search.historyCutoffs
+    
+    cachedMove = None
+    if cache != None:
+        key = searchKey(board, pieceType, pieceType)
+        entry = cacheEntry(cache, key, search)[0]
+        if entry != None:
+            cachedMove = entry[3]
+            
+    moves = list(orderedMoves(board, pieceType, cachedMove))
+    for move in moves:
+        with Trace.span("root move", "search", {"move": move, "depth": depth}):
+            board.applyMove(move)
+            # Leaves are exact anyway, a null window wouldn't save anything
+            if bestMove == None or depth <= 1:
+                result = childScore(board, depth - 1, pieceType, pieceType, alpha, beta, cache, search)
+            else:
+                result = childScore(board, depth - 1, pieceType, pieceType, alpha, alpha + 1, cache, search)
+                if result > alpha and result < beta and not search.stopped:
+                    search.reSearches += 1
+                    # Checking for the end of the game changed the board, start over
+                    board.revertMove()
+                    board.applyMove(move)
+                    result = childScore(board, depth - 1, pieceType, pieceType, alpha, beta, cache, search)
+            board.revertMove()
+        if search.stopped:
+            break
+        # Even if every move loses, one of them has to be made
+        if result > alpha or bestMove == None:
             alpha = result
-            bestMove = opCode
-        if alpha >= infinity:
+            bestMove = move
+        if alpha >= beta:
             break
-        if progressChange != None:
-            progressChange("%.2f" % (topLevelPossibleMoveCount * counter))
         counter += 1
+        if progressChange != None:
+            progressChange(depth, counter, len(moves), bestMove)
+        
+    if cache != None and not search.stopped:
+        storeCache(resultCache(cache, search, historyCutoffs), key, depth, alphaOrig, beta, alpha, bestMove)
+    return bestMove, alpha
+
+def iterativeBestNextMove (board, pieceType, maxDepth, search=None, cache=None, infoReceiver=None, progressChange=None):
+    '''
+    Searches with increasing depth up to maxDepth, until the search is
+    stopped. Returns the best move of the deepest completed iteration.
+    Every iteration first searches a window of aspirationWindow around the
+    score of the previous one and is searched again, if the score falls
+    outside of it. After every iteration infoReceiver (if supplied) gets
+    (depth, score, search, principal variation).
+    A forced win found by the proof number search is played right away
+    and reported as depth 1.
+    '''
+    if search == None:
+        search = Search()
+    winningMove = provenWinningMove(board, pieceType, search)
+    if winningMove != None:
+        if infoReceiver != None:
+            infoReceiver(1, infinity, search, [winningMove])
+        return winningMove
+    # The cache passes the best moves on to the next iteration
+    if cache == None:
+        cache = PositionCache()
+        
+    bestMove = None
+    score = None
+    for depth in range(1, maxDepth + 1):
+        alpha = -infinity
+        beta = infinity
+        if score != None and abs(score) < infinity:
+            alpha = score - aspirationWindow
+            beta = score + aspirationWindow
+            
+        with Trace.span("iteration", "search", {"depth": depth}):
+            while True:
+                move, score = searchRoot(board, pieceType, depth, progressChange, cache, search, alpha, beta)
+                if search.stopped:
+                    break
+                if score <= alpha and alpha > -infinity:
+                    search.failLows += 1
+                    alpha = -infinity
+                elif score >= beta and beta < infinity:
+                    search.failHighs += 1
+                    beta = infinity
+                else:
+                    break
+            
+        if search.stopped:
+            # Only use an incomplete iteration, if there is nothing else
+            if bestMove == None:
+                bestMove = move
+            if bestMove == None:
+                # Stopped before the first move was searched,
+                # but a move has to be made
+                bestMove = next(iter(nextPossibleMoves(board, pieceType)), None)
+            break
+        
+        bestMove = move
+        if infoReceiver != None:
+            infoReceiver(depth, score, search, principalVariation(board, pieceType, cache, depth, search=search))
+        if abs(score) >= infinity:
+            break
     return bestMove
 
-def countTopLevelPossibleMoves (board, pieceType):
-    counter = 0
-    for m in nextPossibleMoves(board, pieceType):
-        counter += 1
-    return counter
+def analyseRoot (board, pieceType, depth, count, cache, search, firstMoves=[]):
+    '''
+    Like searchRoot, but returns the count best moves as a list of
+    (score, move), best first, each scored with the full window.
+    The first count moves are searched with the full window. All others only
+    have to prove with a null window, that they aren't better than the
+    worst of the best moves so far. If they are, they are searched again
+    with the full window. firstMoves are searched first.
+    Below the root moves the search stays selective (see lateMoveReductions
+    and futilityPruning), so the scores can differ from those of a full
+    width search of the same depth.
+    '''
+    board = Board(board)
+    moves = list(nextPossibleMoves(board, pieceType))
+    moves = [move for move in firstMoves if move in moves] + [move for move in moves if move not in firstMoves]
+    historyCutoffs = search.historyCutoffs
+
+    best = []
+    for move in moves:
+        board.applyMove(move)
+        if len(best) < count:
+            result = childScore(board, depth - 1, pieceType, pieceType, -infinity, infinity, cache, search)
+        else:
+            worst = best[-1][0]
+            result = childScore(board, depth - 1, pieceType, pieceType, worst, worst + 1, cache, search)
+            if result > worst and not search.stopped:
+                search.reSearches += 1
+                # Checking for the end of the game changed the board, start over
+                board.revertMove()
+                board.applyMove(move)
+                result = childScore(board, depth - 1, pieceType, pieceType, worst, infinity, cache, search)
+        board.revertMove()
+        if search.stopped:
+            break
+        if len(best) < count or result > best[-1][0]:
+            best.append((result, move))
+            # Stable, moves searched earlier stay in front on equal scores
+            best.sort(key=lambda entry: -entry[0])
+            del best[count:]
+    if len(best) > 0 and not search.stopped:
+        # The next search of the position starts with the best move
+        resultCache(cache, search, historyCutoffs).store(searchKey(board, pieceType, pieceType), depth,
+                                                         best[0][0], PositionCache.Exact, best[0][1])
+    return best
+
+def moveScore (board, pieceType, move, depth, cache=None, search=None):
+    '''
+    Score of a single move of pieceType, searched to depth with the
+    full window, like the moves of analyseRoot
+    '''
+    if search == None:
+        search = Search()
+    board = Board(board)
+    board.applyMove(move)
+    return childScore(board, depth - 1, pieceType, pieceType, -infinity, infinity, cache, search)
+
+def movePrincipalVariation (board, pieceType, move, cache, maxLength, search=None):
+    '''
+    The principal variation starting with the given move of pieceType
+    '''
+    board = Board(board)
+    board.applyMove(move)
+    if isRemovePhase(board):
+        currentPlayerPieceType = pieceType
+    elif isTerminal(board, pieceType):
+        return [move]
+    else:
+        currentPlayerPieceType = invertPieceType(pieceType)
+    return [move] + principalVariation(board, pieceType, cache, maxLength - 1, currentPlayerPieceType, search)
+
+def analyse (board, pieceType, maxDepth, count=3, search=None, cache=None, infoReceiver=None):
+    '''
+    Multi principal variation analysis: returns the count best moves of
+    pieceType, each as a dict with move, score, depth and pv (principal
+    variation), best first. Searches with increasing depth up to maxDepth
+    like iterativeBestNextMove, all moves share the cache, so the
+    analysis costs little more than a single search. Every iteration starts
+    with the best moves of the previous one. After every iteration
+    infoReceiver (if supplied) gets (depth, lines, search).
+    If the search is stopped, the lines of the deepest completed iteration
+    are returned.
+    '''
+    if search == None:
+        search = Search()
+    if cache == None:
+        cache = PositionCache()
+
+    # Starts with the best move of an earlier search of the position
+    firstMoves = []
+    entry = cache.probe(searchKey(board, pieceType, pieceType))
+    if entry != None and entry[3] != None:
+        firstMoves = [entry[3]]
+    lines = []
+    for depth in range(1, maxDepth + 1):
+        if len(lines) > 0:
+            firstMoves = [line["move"] for line in lines]
+        with Trace.span("iteration", "search", {"depth": depth, "lines": count}):
+            best = analyseRoot(board, pieceType, depth, count, cache, search, firstMoves)
+        if search.stopped and len(lines) > 0:
+            break
+        lines = [{"move": move, "score": score, "depth": depth,
+                  "pv": movePrincipalVariation(board, pieceType, move, cache, depth, search)}
+                 for score, move in best]
+        if search.stopped:
+            break
+        if infoReceiver != None:
+            infoReceiver(depth, lines, search)
+    return lines
+
+class ParallelSearch (object):
+    '''
+    Lazy SMP: the same iterative deepening search runs in workers - 1 helper
+    processes next to the one of the caller. They share nothing but the
+    cache (see SharedCache.py), the helpers fill it with positions the
+    main search finds there later. Every second helper searches one ply
+    deeper, so they don't all search the same positions at the same time.
+    The helpers stop, when the main search is done.
+    '''
+
+    def __init__ (self, workers, cache=None):
+        from SharedCache import SharedPositionCache
+        self.workers = workers
+        self.ownCache = cache == None
+        self.cache = SharedPositionCache() if cache == None else cache
+        self.executor = None
+        self.stopEvent = None
+
+    def close (self):
+        if self.executor != None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.ownCache:
+            self.cache.close()
+
+    def search (self, board, pieceType, maxDepth, search=None, infoReceiver=None, progressChange=None):
+        '''
+        Like iterativeBestNextMove. The nodes of the helpers are added
+        to the search, when they are done.
+        '''
+        if search == None:
+            search = Search()
+        if self.workers <= 1:
+            return iterativeBestNextMove(board, pieceType, maxDepth, search, self.cache, infoReceiver, progressChange)
+
+        if self.executor == None:
+            import multiprocessing
+            # The event can only be passed on when the processes start
+            self.stopEvent = multiprocessing.get_context("spawn").Event()
+            self.executor = processPool(self.workers - 1, self.stopEvent)
+        self.stopEvent.clear()
+        helpers = [self.executor.submit(helperSearch, Board(board), pieceType, maxDepth + i % 2,
+                                        search.deadline, self.cache)
+                   for i in range(1, self.workers)]
+        try:
+            bestMove = iterativeBestNextMove(board, pieceType, maxDepth, search, self.cache,
+                                             infoReceiver, progressChange)
+        finally:
+            self.stopEvent.set()
+        for helper in helpers:
+            search.nodes += helper.result()
+        return bestMove
+
+# Set in the helper processes of ParallelSearch
+helperStopEvent = None
+
+def startWorkerProcess (weights, stopEvent):
+    global helperStopEvent
+    for phase in weights:
+        evaluationWeights[phase][:] = weights[phase]
+    helperStopEvent = stopEvent
+
+def processPool (workers, stopEvent=None):
+    '''
+    Process pool for searching in parallel. The processes are started
+    fresh instead of forked: a forked process would hang, if another thread
+    (e.g. the one of the engine reading stdin) held a lock while forking.
+    They get the evaluation weights of this process.
+    '''
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=startWorkerProcess, initargs=(evaluationWeights, stopEvent))
+
+def helperSearch (board, pieceType, maxDepth, deadline, cache):
+    '''
+    Runs in a helper process of ParallelSearch. Returns the visited nodes.
+    '''
+    search = Search(deadline, helperStopEvent.is_set)
+    iterativeBestNextMove(board, pieceType, maxDepth, search, cache)
+    return search.nodes
+
+def principalVariation (board, pieceType, cache, maxLength, currentPlayerPieceType=None, search=None):
+    '''
+    Follows the best moves stored in the cache (and in the historyCache
+    of the search, if supplied), starting at the current position (with
+    currentPlayerPieceType to move, pieceType by default).
+    Returns the list of moves.
+    '''
+    board = Board(board)
+    if currentPlayerPieceType == None:
+        currentPlayerPieceType = pieceType
+    moves = []
+    while len(moves) < maxLength:
+        entry = cacheEntry(cache, searchKey(board, pieceType, currentPlayerPieceType), search)[0]
+        if entry == None or entry[3] == None:
+            break
+        move = entry[3]
+        if move not in nextPossibleMoves(board, currentPlayerPieceType):
+            break
+        board.applyMove(move)
+        moves.append(move)
+        # Same order as in the search
+        if isRemovePhase(board):
+            continue
+        if isTerminal(board, pieceType):
+            break
+        currentPlayerPieceType = invertPieceType(currentPlayerPieceType)
+    return moves
+
+def cacheEntry (cache, key, search=None):
+    '''
+    Returns the entry of the position (see PositionCache.probe) and
+    whether it's taken from the historyCache of the search, which is
+    preferred, if it is at least as deep
+    '''
+    entry = cache.probe(key)
+    if search != None:
+        historyEntry = search.historyCache.probe(key)
+        if historyEntry != None and (entry == None or historyEntry[0] >= entry[0]):
+            return historyEntry, True
+    return entry, False
+
+def probeCache (cache, key, depth, alpha, beta, search=None):
+    '''
+    Returns the cached score of the position, if it is deep enough and
+    decides the search at the current window. Otherwise None is returned.
+    The second return value is the best move of the earlier search.
+    '''
+    entry, fromHistory = cacheEntry(cache, key, search)
+    if entry == None:
+        return None, None
     
-def minScore (board, depth, pieceType, currentPlayerPieceType, alpha, beta):
-    if isTerminal(board, invertPieceType(currentPlayerPieceType)):
-        return evaluateTerminalState(board, pieceType)
+    entryDepth, score, bound, move = entry
+    if entryDepth < depth:
+        return None, move
+    if bound == PositionCache.Exact:
+        score = max(alpha, min(beta, score))
+    elif bound == PositionCache.LowerBound and score >= beta:
+        score = beta
+    elif bound == PositionCache.UpperBound and score <= alpha:
+        score = alpha
+    else:
+        return None, move
+    if fromHistory:
+        historyCutoff(search)
+    return score, move
+
+def storeCache (cache, key, depth, alpha, beta, result, move):
+    if result <= alpha:
+        bound = PositionCache.UpperBound
+    elif result >= beta:
+        bound = PositionCache.LowerBound
+    else:
+        bound = PositionCache.Exact
+    cache.store(key, depth, result, bound, move)
+
+def resultCache (cache, search, historyCutoffs):
+    '''
+    Returns where to store the result of a position: the cache, unless
+    a score depending on the positions played before was used since the
+    search of the position started (historyCutoffs was the count then).
+    The cache doesn't know the history, an entry could be used in another
+    game or be saved (see PositionCache and SharedCache.py).
+    '''
+    if search != None and search.historyCutoffs != historyCutoffs:
+        return search.historyCache
+    return cache
+
+def historyCutoff (search):
+    '''
+    Counts a score depending on the positions played before
+    (see Search.historyCutoffs), returns the remis score
+    '''
+    if search != None:
+        search.historyCutoffs += 1
+    return 0
+    
+def viewOfPieceType (sign, alpha, beta):
+    '''
+    Converts a window of negamax into the view of the player, who
+    started the search (the view of the cache)
+    '''
+    if sign > 0:
+        return alpha, beta
+    return -beta, -alpha
+
+def isRemovePhase (board):
+    return (board.gamePhase == Board.PieceSetRemovePhase
+            or board.gamePhase == Board.PieceMoveRemovePhase)
+
+def childScore (board, depth, pieceType, currentPlayerPieceType, alpha, beta, cache, search):
+    '''
+    Searches the position after a move of currentPlayerPieceType and
+    returns its score for that player. After closing a muehle the same
+    player removes a piece, otherwise it's the other player's turn.
+    '''
+    if isRemovePhase(board):
+        return negamax(board, depth, pieceType, currentPlayerPieceType, alpha, beta, cache, search)
+    return -negamax(board, depth, pieceType, invertPieceType(currentPlayerPieceType), -beta, -alpha, cache, search)
+
+def isQuietMove (board, move):
+    '''
+    Checks if the move, which was just applied to the board,
+    neither removed a piece nor closed a muehle
+    '''
+    return (move & 15) != Board.OpRemove and not isRemovePhase(board)
+
+def negamax (board, depth, pieceType, currentPlayerPieceType, alpha, beta, cache=None, search=None):
+    '''
+    Scores the position for the player to move (currentPlayerPieceType).
+    The evaluation is done from the view of pieceType (the player who
+    started the search) and negated for the other player.
+    The first move is searched with the full window, all others only with
+    a null window, which proves that they aren't better. If they are,
+    they are searched again with the full window (principal variation search).
+    Late quiet moves are searched with less depth or skipped near the
+    leaves (see lateMoveReductions and futilityPruning).
+    '''
+    if depth <= 0 and quiescenceSearch and search != None:
+        search.quiescenceBudget = quiescenceNodeLimit
+        return quiescence(board, pieceType, currentPlayerPieceType, alpha, beta, search)
+    if search != None and search.visitNode():
+        return 0
+    sign = 1 if currentPlayerPieceType == pieceType else -1
+    if isTerminal(board, pieceType):
+        # A remis is caused by repetitions or turns without removals
+        if board.gamePhase == Board.Remis:
+            return historyCutoff(search)
+        return sign * evaluateTerminalState(board, pieceType)
+    # A repeated position can't lead to anything new, score it as remis
+    if board.currentRepetitions() > 0:
+        return historyCutoff(search)
     
     if depth <= 0:
-        return evaluateBoardState(board, pieceType, currentPlayerPieceType)
+        return sign * evaluateBoardState(board, pieceType, currentPlayerPieceType)
+    
+    cachedMove = None
+    if cache != None:
+        key = searchKey(board, pieceType, currentPlayerPieceType)
+        alphaOrig, betaOrig = viewOfPieceType(sign, alpha, beta)
+        historyCutoffs = search.historyCutoffs if search != None else 0
+        cachedScore, cachedMove = probeCache(cache, key, depth, alphaOrig, betaOrig, search)
+        if cachedScore != None:
+            return sign * cachedScore
     
-    for newBoard, op in nextBoardStates(board, currentPlayerPieceType):
-        result = maxScore(newBoard, depth - 1, pieceType, invertPieceType(currentPlayerPieceType), alpha, beta)
-        beta = min(beta, result)
+    futilityScore = None
+    if futilityPruning and depth < len(futilityMargins):
+        futilityScore = sign * evaluateBoardState(board, pieceType, currentPlayerPieceType) + futilityMargins[depth]
+    
+    bestMove = None
+    moveNumber = 0
+    for move in orderedMoves(board, currentPlayerPieceType, cachedMove):
+        board.applyMove(move)
+        moveNumber += 1
+        quiet = moveNumber > 1 and isQuietMove(board, move)
+        if quiet and futilityScore != None and futilityScore <= alpha:
+            board.revertMove()
+            if search != None:
+                search.futilityPrunes += 1
+            continue
+        
+        # Leaves are exact anyway, a null window wouldn't save anything
+        if moveNumber == 1 or depth <= 1:
+            result = childScore(board, depth - 1, pieceType, currentPlayerPieceType, alpha, beta, cache, search)
+        else:
+            if (lateMoveReductions and quiet and moveNumber > lateMoveReductionMoves
+                and depth >= lateMoveReductionDepth):
+                if search != None:
+                    search.reductions += 1
+                result = childScore(board, depth - 2, pieceType, currentPlayerPieceType, alpha, alpha + 1, cache, search)
+                if result > alpha and not (search != None and search.stopped):
+                    if search != None:
+                        search.reductionReSearches += 1
+                    board.revertMove()
+                    board.applyMove(move)
+                    result = childScore(board, depth - 1, pieceType, currentPlayerPieceType, alpha, alpha + 1, cache, search)
+            else:
+                result = childScore(board, depth - 1, pieceType, currentPlayerPieceType, alpha, alpha + 1, cache, search)
+            if result > alpha and result < beta and not (search != None and search.stopped):
+                if search != None:
+                    search.reSearches += 1
+                # Checking for the end of the game changed the board, start over
+                board.revertMove()
+                board.applyMove(move)
+                result = childScore(board, depth - 1, pieceType, currentPlayerPieceType, alpha, beta, cache, search)
+        board.revertMove()
+        if search != None and search.stopped:
+            return 0
+        if result > alpha:
+            alpha = result
+            bestMove = move
         
         if alpha >= beta:
-            return alpha
-    return beta
+            if cache != None:
+                storeCache(resultCache(cache, search, historyCutoffs), key, depth, alphaOrig, betaOrig,
+                           sign * beta, bestMove)
+            return beta
+        
+    if cache != None:
+        storeCache(resultCache(cache, search, historyCutoffs), key, depth, alphaOrig, betaOrig,
+                   sign * alpha, bestMove)
+    return alpha
 
-def maxScore (board, depth, pieceType, currentPlayerPieceType, alpha, beta):
-    if isTerminal(board, currentPlayerPieceType):
-        return evaluateTerminalState(board, pieceType)
-    if depth <= 0:
-        return evaluateBoardState(board, pieceType, currentPlayerPieceType)
+def quiescence (board, pieceType, currentPlayerPieceType, alpha, beta, search):
+    '''
+    Scores a position at the end of the search like negamax. A pending
+    removal is searched, otherwise the player to move can either take the
+    evaluation or close a muehle. Other moves aren't searched.
+    '''
+    if search.visitNode():
+        return 0
+    search.quiescenceNodes += 1
+    search.quiescenceBudget -= 1
+    sign = 1 if currentPlayerPieceType == pieceType else -1
+    if isTerminal(board, pieceType):
+        if board.gamePhase == Board.Remis:
+            return historyCutoff(search)
+        return sign * evaluateTerminalState(board, pieceType)
+    if board.currentRepetitions() > 0:
+        return historyCutoff(search)
+    
+    score = sign * evaluateBoardState(board, pieceType, currentPlayerPieceType)
+    removing = isRemovePhase(board)
+    if not removing:
+        # A pending removal is always searched, the muehles only
+        # as long as there are nodes left
+        if search.quiescenceBudget <= 0:
+            return score
+        if score >= beta:
+            return beta
+        if score > alpha:
+            alpha = score
     
-    for newBoard, op in nextBoardStates(board, currentPlayerPieceType):
-        result = minScore(newBoard, depth - 1, pieceType, invertPieceType(currentPlayerPieceType), alpha, beta)
-        alpha = max(alpha, result)
-           
+    for move in nextPossibleMoves(board, currentPlayerPieceType):
+        board.applyMove(move)
+        if removing:
+            result = -quiescence(board, pieceType, invertPieceType(currentPlayerPieceType), -beta, -alpha, search)
+        elif isRemovePhase(board):
+            result = quiescence(board, pieceType, currentPlayerPieceType, alpha, beta, search)
+        else:
+            board.revertMove()
+            continue
+        board.revertMove()
+        if search.stopped:
+            return 0
+        if result > alpha:
+            alpha = result
         if alpha >= beta:
             return beta
-    return alpha    
+    return alpha
 
+# Names of the features, the evaluation weighs (see evaluationFeatures)
+featureNames = ["muehleClosed", "muehles", "blockedPieces", "pieces", "twoPiecesSets",
+                "threePieceSets", "doubleMuehles"]
 
-def evaluateBoardState (board, pieceType, currentPlayerPieceType):
+# Weights of the features per phase (see evaluationPhase). Tuned weights
+# are written by Tuning.py and loaded with loadEvaluationWeights.
+evaluationWeights = {
+    "set": [18, 26, 1, 9, 10, 7, 0],
+    "move": [14, 43, 10, 11, 0, 0, 8],
+    "flying": [16, 0, 0, 0, 10, 1, 0],
+}
+
+# File with tuned weights, loaded by the engine at startup if it exists
+defaultWeightsPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights.json")
+
+def readEvaluationWeights (path):
+    '''
+    Returns the weights of the file written by Tuning.py like
+    evaluationWeights. Phases missing in the file get the current weights.
+    '''
+    import json
+    with open(path) as weightsFile:
+        weights = json.load(weightsFile)
+    result = {}
+    for phase in evaluationWeights:
+        if phase in weights:
+            if len(weights[phase]) != len(featureNames):
+                raise ValueError("Expected " + str(len(featureNames)) + " weights for " + phase)
+            result[phase] = list(weights[phase])
+        else:
+            result[phase] = list(evaluationWeights[phase])
+    return result
+
+def loadEvaluationWeights (path):
+    '''
+    Replaces the weights with those of the file written by Tuning.py.
+    Phases missing in the file keep their weights.
+    '''
+    weights = readEvaluationWeights(path)
+    for phase in evaluationWeights:
+        # Changed in place, so everybody holding the lists sees the new weights
+        evaluationWeights[phase][:] = weights[phase]
+
+def evaluationFingerprint (weights=None):
+    '''
+    Identifies the evaluation weights (the current ones by default). Caches
+    outliving the process only hold scores of the same weights (see
+    PositionCache and SharedCache.py).
+    '''
+    import hashlib
+    import json
+    if weights == None:
+        weights = evaluationWeights
+    data = json.dumps([featureNames, weights], sort_keys=True).encode()
+    # 63 bits, so it fits into an integer of SQLite
+    return int.from_bytes(hashlib.sha256(data).digest()[:8], "little") >> 1
+            
+def evaluationPhase (board, currentPlayerPieceType):
+    '''
+    Returns the name of the weights used for the board or None,
+    if the game is over
+    '''
+    if (board.gamePhase == Board.PieceSetPhase or board.gamePhase == Board.PieceSetRemovePhase): 
+        return "set"
+    elif (board.gamePhase == Board.PieceMovePhase
+        or board.gamePhase == Board.PieceMoveRemovePhase): 
+        if board.getUnplacedPieceCounter(currentPlayerPieceType) >= 9 - 3:
+            return "flying"
+        return "move"
+    return None
+    
+def evaluationFeatures (board, pieceType, currentPlayerPieceType):
+    '''
+    Returns the features of the board in the order of featureNames,
+    from the view of pieceType
+    '''
     threePiecesCounter = evaluateNumberOfThreePieceSets(board, pieceType)
     piecesCounter = (9 - board.getUnplacedPieceCounter(pieceType) - board.getNeverPlacedPieceCounter(pieceType))
     piecesCounter -= (9 - board.getUnplacedPieceCounter(invertPieceType(pieceType)) - board.getNeverPlacedPieceCounter(invertPieceType(pieceType)))
@@ -153,20 +911,26 @@ def evaluateBoardState (board, pieceType, currentPlayerPieceType):
     muehleClosedCounter = 0
     if len(board.opCodeHistory) != 0:
         lastOpCode = board.opCodeHistory[len(board.opCodeHistory) - 1]
-        if (lastOpCode[0] == Board.InternalChangePhaseFromRemoveToMove or
-            lastOpCode[0] == Board.InternalChangePhaseFromRemoveToSet):
+        if (lastOpCode == Board.InternalChangePhaseFromRemoveToMove or
+            lastOpCode == Board.InternalChangePhaseFromRemoveToSet):
             if currentPlayerPieceType == pieceType:
                 muehleClosedCounter = -1
             else:
                 muehleClosedCounter = 1
+                
+    return (muehleClosedCounter, muehleCounter, blockedPiecesCounter, piecesCounter,
+            twoPiecesCounter, threePiecesCounter, doubleMuehleCounter)
 
-    if (board.gamePhase == Board.PieceSetPhase or board.gamePhase == Board.PieceSetRemovePhase): 
-        return 18 * muehleClosedCounter + 26 * muehleCounter + 1 * blockedPiecesCounter + 9 * piecesCounter + 10 * twoPiecesCounter + 7 * threePiecesCounter + 0 * doubleMuehleCounter 
-    elif (board.gamePhase == Board.PieceMovePhase
-        or board.gamePhase == Board.PieceMoveRemovePhase): 
-        if board.getUnplacedPieceCounter(currentPlayerPieceType) >= 9 - 3:
-            return 16 * muehleClosedCounter + 0 * muehleCounter + 0 * blockedPiecesCounter + 0 * piecesCounter + 10 * twoPiecesCounter + 1 * threePiecesCounter + 0 * doubleMuehleCounter 
-        return 14 * muehleClosedCounter + 43 * muehleCounter + 10 * blockedPiecesCounter + 11 * piecesCounter + 0 * twoPiecesCounter + 0 * threePiecesCounter + 8 * doubleMuehleCounter 
+def evaluateBoardState (board, pieceType, currentPlayerPieceType):
+    phase = evaluationPhase(board, currentPlayerPieceType)
+    if phase == None:
+        return None
+    
+    weights = evaluationWeights[phase]
+    features = evaluationFeatures(board, pieceType, currentPlayerPieceType)
+    return (weights[0] * features[0] + weights[1] * features[1] + weights[2] * features[2]
+            + weights[3] * features[3] + weights[4] * features[4] + weights[5] * features[5]
+            + weights[6] * features[6])
                
 def evaluateNumberOfBlockedPieces(board, pieceType): 
     counter = 0
@@ -183,95 +947,125 @@ def evaluateNumberOfBlockedPieces(board, pieceType):
                     counter += 1 
     return counter    
             
-def evaluateNumberOfTwoPiecesSets (board, pieceType):
-    counter = 0
-    
+# Lookup tables for the evaluation.
+# The contents of a line of three points are encoded as a base 3 index
+# (a * 9 + b * 3 + c, 27 states). The corner patterns additionally contain
+# the two points next to the corner, which have to be empty (base 3 index
+# over 5 points, 243 states).
+# Every table entry is +1, if the pattern counts for white, -1 if it counts
+# for black and 0 otherwise.
+
+def pieceTypeSign (pieceType):
+    if pieceType == Board.White:
+        return 1
+    elif pieceType == Board.Black:
+        return -1
+    return 0
+
+def lineIndex (values, points):
+    index = 0
+    for point in points:
+        index = index * 3 + values[point]
+    return index
+
+def buildLineTables ():
+    '''
+    Returns the tables for muehles (three pieces of one type) and
+    two piece sets (two pieces of one type and one empty point)
+    '''
+    muehleTable = [0] * 27
+    twoPiecesTable = [0] * 27
+    for index in range(27):
+        line = [index // 9, (index // 3) % 3, index % 3]
+        pieces = [val for val in line if val != Board.Empty]
+        
+        if len(pieces) == 3 and pieces[0] == pieces[1] == pieces[2]:
+            muehleTable[index] = pieceTypeSign(pieces[0])
+        elif len(pieces) == 2 and pieces[0] == pieces[1]:
+            twoPiecesTable[index] = pieceTypeSign(pieces[0])
+    return muehleTable, twoPiecesTable
+
+def buildCornerTable ():
+    cornerTable = [0] * 243
+    for index in range(243):
+        pattern = [(index // 3 ** (4 - i)) % 3 for i in range(5)]
+        if pattern[0] != Board.Empty or pattern[4] != Board.Empty:
+            continue
+        if pattern[1] != Board.Empty and pattern[1] == pattern[2] == pattern[3]:
+            cornerTable[index] = pieceTypeSign(pattern[1])
+    return cornerTable
+
+muehleTable, twoPiecesTable = buildLineTables()
+cornerTable = buildCornerTable()
+
+# Rows of each ring, which can form a muehle: [ring][row] -> points
+muehleRows = [[tuple(convRingNotationToIndex(iRing, iRow * 2 - 1 + offset) for offset in range(3))
+               for iRow in range(4)]
+              for iRing in range(3)]
+
+# Lines crossing the rings
+vRows = [tuple(convRingNotationToIndex(iRing, 2 * iVRow) for iRing in range(3)) for iVRow in range(4)]
+
+# Lines counted by evaluateNumberOfTwoPiecesSets. 
+twoPiecesLines = ([tuple(convRingNotationToIndex(iRing, 7 + iRow * 3 + offset) for offset in range(3))
+                   for iRing in range(3) for iRow in range(4)]
+                  + vRows)
+
+def buildCornerPatterns ():
+    '''
+    Returns the points of all corners as (end, corner, corner, corner, end),
+    first the corners within a ring, then those crossing the rings.
+    '''
+    patterns = []
     for iRing in range(3):
-        for iRow in range(4):   
-            iStartNode = (7 + iRow * 3) % 8
-            
-            firstNodeType = Board.Empty
-            containedOneEmptyField = False
-            
-            for rowOffset in range (3):
-                val = board.getOccupationAt(iRing, iStartNode + rowOffset)
-                
-                if val == Board.Empty:
-                    if containedOneEmptyField:
-                        firstNodeType = Board.Empty
-                        break
-                    containedOneEmptyField = True
-                    continue
-                
-                if firstNodeType == Board.Empty:
-                    firstNodeType = val
-                    
-                elif firstNodeType != val:
-                    firstNodeType = Board.Empty
-                    break
+        for iCorner in range(4):
+            iStartNode = iCorner * 2 + 8
+            patterns.append(tuple(convRingNotationToIndex(iRing, iStartNode + offset) for offset in range(-1, 4)))
             
-            if containedOneEmptyField and firstNodeType != Board.Empty:
-                if firstNodeType == pieceType:
-                    counter += 1
-                else:
-                    counter -= 1
-                    
+    rowOffset = [0, 1, 1, 0, 0, -1, -1, 0]
+    ringOffset = [0, 1, 1, 2, 2, 1, 1, 0]
+    rowOffsetCheck = [0, -1, 0, -1, 0, 1, 0, 1]
+    ringOffsetCheck = [2, 1, 0, 1, 0, 1, 2, 1]
     for iVRow in range(4):
-        iStartNode = 2 * iVRow
-        
-        firstNodeType = Board.Empty
-        containedOneEmptyField = False
-        
-        for iRing in range (3):
-            val = board.getOccupationAt(iRing, iStartNode)
-            
-            if val == Board.Empty:
-                if containedOneEmptyField:
-                        firstNodeType = Board.Empty
-                        break
-                containedOneEmptyField = True
-                continue
+        startNodeIndex = iVRow * 2 + 8
+        for iCorner in range(0, 8, 2):
+            patterns.append((convRingNotationToIndex(ringOffsetCheck[iCorner], rowOffsetCheck[iCorner] + startNodeIndex),
+                             convRingNotationToIndex(1, startNodeIndex),
+                             convRingNotationToIndex(ringOffset[iCorner], rowOffset[iCorner] + startNodeIndex),
+                             convRingNotationToIndex(ringOffset[iCorner + 1], rowOffset[iCorner + 1] + startNodeIndex),
+                             convRingNotationToIndex(ringOffsetCheck[iCorner + 1], rowOffsetCheck[iCorner + 1] + startNodeIndex)))
+    return patterns
+
+cornerPatterns = buildCornerPatterns()
             
-            if firstNodeType == Board.Empty:
-                firstNodeType = val
-                
-            elif firstNodeType != val:
-                firstNodeType = Board.Empty
-                break
-        
-        if containedOneEmptyField and firstNodeType != Board.Empty:
-            if firstNodeType == pieceType:
-                counter += 1
-            else:
-                counter -= 1
-                
-    return counter
+def evaluateNumberOfTwoPiecesSets (board, pieceType):
+    values = board.values
+    counter = 0
+    for a, b, c in twoPiecesLines:
+        counter += twoPiecesTable[values[a] * 9 + values[b] * 3 + values[c]]
+    return counter * pieceTypeSign(pieceType)
             
 def evaluateMuehles(board, pieceType): 
+    values = board.values
+    sign = pieceTypeSign(pieceType)
     counter = 0
     doubleCounter = 0
     
+    vRowMuehles = [muehleTable[values[a] * 9 + values[b] * 3 + values[c]] * sign for a, b, c in vRows]
+    
+    # Both flags are carried over from one ring to the next
     prevRowWasMuehle = False
     firstRowWasMuehle = False
-    for iRing in range(3):
-        for iRow in range(4):   
-            muehleType = checkRowForMuehle(board, iRing, iRow)
+    for rows in muehleRows:
+        for iRow in range(4):
+            a, b, c = rows[iRow]
+            muehle = muehleTable[values[a] * 9 + values[b] * 3 + values[c]]
             
-            if muehleType != Board.Empty:
-                if muehleType == pieceType:
-                    counter += 1
-                else:
-                    counter -= 1
-                
+            if muehle != 0:
+                counter += muehle
                 if prevRowWasMuehle:
                     doubleCounter += 1
-                
-                vPieceType = checkVRowForMuehle(board, iRow)
-                if vPieceType == pieceType:
-                    doubleCounter += 1
-                elif vPieceType != Board.Empty:
-                    doubleCounter -= 1
-                    
+                doubleCounter += vRowMuehles[iRow]
                 if iRow == 0:
                     firstRowWasMuehle = True
                 prevRowWasMuehle = True
@@ -281,90 +1075,24 @@ def evaluateMuehles(board, pieceType):
         if prevRowWasMuehle and firstRowWasMuehle:
             doubleCounter += 1
             
-    return counter, doubleCounter
+    return counter * sign, doubleCounter
 
 def evaluateNumberOfThreePieceSets (board, pieceType):
+    values = board.values
     counter = 0
-    for iRing in range(3):
-        for iCorner in range(4):
-            firstNodeType = Board.Empty
-            iStartNode = iCorner * 2 + 8
-            for conerOffset in range(3):
-                val = board.getOccupationAt(iRing, iStartNode + conerOffset)
-                if val == Board.Empty or (firstNodeType != Board.Empty and firstNodeType != val):
-                    firstNodeType = Board.Empty
-                    break
-                firstNodeType = val
-            if firstNodeType != Board.Empty:
-                # Now check if both ends of the corner connect to a free place
-                if (board.getOccupationAt(iRing, iStartNode - 1) != Board.Empty or
-                    board.getOccupationAt(iRing, iStartNode + 3) != Board.Empty):
-                    continue
-                if firstNodeType == pieceType:
-                    counter += 1
-                else:
-                    counter -= 1
-    
-    for iVRow in range (4):
-        startNodeIndex = iVRow * 2 + 8
-        middleVal = board.getOccupationAt(1, startNodeIndex)
-        if middleVal == Board.Empty:
-            continue
-        
-        rowOffset = [0, 1, 1, 0, 0, -1, -1, 0, -1, 0, 0, 1, -1, 0, 0, 1]
-        ringOffset = [0, 1, 1, 2, 2, 1, 1, 0, 0, 0, 0, 0, 2, 2, 2, 2]
-        
-        rowOffsetCheck = [0, -1, 0, -1, 0, 1, 0, 1, 1, 0, 0, -1, 1, 0, -1, 0]
-        ringOffsetCheck = [2, 1, 0, 1, 0, 1, 2, 1, 0, 2, 2, 0, 2, 0, 2, 0]
-        
-        for iCornor in range (0, 8, 2):
-            outerVal1 = board.getOccupationAt(ringOffset[iCornor], rowOffset[iCornor] + startNodeIndex)
-            outerVal2 = board.getOccupationAt(ringOffset[iCornor + 1], rowOffset[iCornor + 1] + startNodeIndex)
-            
-            if outerVal2 != middleVal or outerVal1 != middleVal:
-                continue
-            
-            # Now check if both ends of the corner connect to a free place
-            if (board.getOccupationAt(ringOffsetCheck[iCornor], rowOffsetCheck[iCornor] + startNodeIndex) != Board.Empty or
-                board.getOccupationAt(ringOffsetCheck[iCornor + 1], rowOffsetCheck[iCornor + 1] + startNodeIndex) != Board.Empty):
-                continue
-            
-            if middleVal == pieceType:
-                counter += 1
-            else:
-                counter -= 1
-                    
-    return counter     
+    for a, b, c, d, e in cornerPatterns:
+        counter += cornerTable[(((values[a] * 3 + values[b]) * 3 + values[c]) * 3 + values[d]) * 3 + values[e]]
+    return counter * pieceTypeSign(pieceType)
           
+def muehleOwner (sign):
+    if sign > 0:
+        return Board.White
+    elif sign < 0:
+        return Board.Black
+    return Board.Empty
+
 def checkRowForMuehle (board, iRing, iRow):
-    iStartNode = (8 + iRow * 2) - 1
-            
-    firstNodeType = Board.Empty
-    
-    for rowOffset in range (3):
-        val = board.getOccupationAt(iRing, iStartNode + rowOffset)
-        
-        if val == Board.Empty or (firstNodeType != Board.Empty and firstNodeType != val):
-            return Board.Empty
-        
-        firstNodeType = val
-    
-    return firstNodeType    
+    return muehleOwner(muehleTable[lineIndex(board.values, muehleRows[iRing % 3][iRow % 4])])
 
 def checkVRowForMuehle (board, iVRow):
-    iStartNode = 2 * iVRow
-        
-    firstNodeType = Board.Empty
-
-    for iRing in range (3):
-        val = board.getOccupationAt(iRing, iStartNode)
-        
-        if val == Board.Empty or (firstNodeType != Board.Empty and firstNodeType != val):
-            return Board.Empty
-        
-        firstNodeType = val
-    return firstNodeType
-            
-            
-            
-            
+    return muehleOwner(muehleTable[lineIndex(board.values, vRows[iVRow % 4])])
@@ -1,8 +1,8 @@
 from time import sleep
 import time
 
+from Engine import EngineClient, defaultEngineCommand
 from GameBoard import Board
-from MinMax import bestNextMove
 
 
 class HumanPlayer(object):
@@ -15,10 +15,16 @@ class HumanPlayer(object):
     aborted = False
     isTurnFinished = True
     
+    # Hints (see findHints): number of moves and depth of the analysis
+    hintCount = 3
+    hintDepth = 4
+    
     def __init__ (self, name, pieceType):
         # PieceType will be either black or white
         self.pieceType = pieceType
         self.name = name
+        # Started with the first hint
+        self.hintEngine = None
         
     def usesMouse (self):
         return True
@@ -79,22 +85,80 @@ class HumanPlayer(object):
     def abort (self):
         self.aborted = True
         
+    def close (self):
+        '''
+        Ends the engine process of the hints, called when the game is dropped
+        '''
+        if self.hintEngine != None:
+            self.hintEngine.close()
+            self.hintEngine = None
+        
+    def findHints (self, board):
+        '''
+        Returns the hintCount best moves on the board (a copy of the game's
+        board, the player has to be the one to move) as dicts with move,
+        score, depth and pv (see MinMax.analyse), best first.
+        Blocks until the analysis is done. Raises a RuntimeError, if the
+        engine process died.
+        '''
+        if self.hintEngine == None:
+            self.hintEngine = EngineClient()
+        return self.hintEngine.analyse(board, self.hintCount, self.hintDepth)
+        
             
 class AIPlayer (object):
     '''
-    Implementation of an AI Player, using MinMax to choose
-    the most advantageous move.
+    Implementation of an AI Player, using MinMax (or MCTS, see
+    algorithm) to choose the most advantageous move. The search runs
+    in a separate engine process (see Engine.py), this is only the client.
     '''
     
     aborted = False
+    
+    # Gets the progress of the search as dict (see moveCalcProgressChanged),
+    # called from the thread doing the turn
     progressChangedReciever = None
-    lookAheadDifficulty = [2, 4, 6]
     
-    def __init__ (self, name, pieceType, difficulty):
+    # (depth, positions) searched at most per turn for each difficulty.
+    # The positions are counted by the search, so a difficulty plays the
+    # same on every machine, even in the flying phase, whose positions
+    # have many more moves.
+    difficultyProfiles = [(2, 1000), (4, 5000), (6, 50000)]
+    
+    # "alphabeta" (MinMax.py) or "mcts" (MCTS.py)
+    algorithm = "alphabeta"
+    
+    # MCTS iterations per turn for each difficulty
+    mctsIterationsDifficulty = [300, 1500, 6000]
+    
+    # Processes searching MCTS trees in parallel
+    mctsWorkers = 1
+    
+    # Command to start the engine process, None for Engine.py of this
+    # project. Changes take effect with the next AIPlayer.
+    engineCommand = None
+    
+    # Optional file of a PositionCache shared by all engine processes,
+    # so the searched positions are kept between sessions.
+    positionCachePath = None
+    
+    def __init__ (self, name, pieceType, difficulty, algorithm=None):
         # PieceType will be either black or white
         self.pieceType = pieceType
         self.name = name
-        self.lookAhead = self.lookAheadDifficulty[difficulty]
+        self.lookAhead, self.nodeBudget = self.difficultyProfiles[difficulty]
+        self.iterations = self.mctsIterationsDifficulty[difficulty]
+        if algorithm != None:
+            self.algorithm = algorithm
+        
+        command = self.engineCommand
+        if command == None:
+            command = defaultEngineCommand()
+        if self.positionCachePath != None:
+            command = command + ["--cache", self.positionCachePath]
+        if self.algorithm == "mcts":
+            command = command + ["--algorithm", "mcts", "--workers", str(self.mctsWorkers)]
+        self.engine = EngineClient(command)
         
     def usesMouse (self):
         return False
@@ -104,14 +168,24 @@ class AIPlayer (object):
     
     def doTurn (self):  
         '''
-        Returns False, if the turn was aborted, otherwise True
+        Returns False, if the turn was aborted, otherwise True.
+        Raises a RuntimeError, if the engine process died (see EngineClient).
         '''
-        self.progressChangedReciever("0.00% Done")
+        self.moveCalcProgressChanged({"progress": 0.0, "depth": 0, "nodes": 0, "nps": 0, "best": None})
         startTime = time.time()
         
-        bestMove = bestNextMove(self.board, self.pieceType, self.lookAhead, self.moveCalcProgressChanged)
+        try:
+            if self.algorithm == "mcts":
+                bestMove = self.engine.search(self.board, iterations=self.iterations,
+                                              infoReceiver=self.engineInfoReceived)
+            else:
+                bestMove = self.engine.search(self.board, self.lookAhead, infoReceiver=self.engineInfoReceived,
+                                              iterations=self.nodeBudget)
+        except RuntimeError:
+            self.aborted = False
+            raise
         
-        if self.aborted:
+        if self.aborted or bestMove == None:
             self.aborted = False
             return False
         
@@ -121,14 +195,36 @@ class AIPlayer (object):
         if toSleep > 0:
             sleep(toSleep)
         
-        self.board.executeOpCode(bestMove)
+        self.board.executeMove(bestMove)
         return True
 
     def abort (self):
         self.aborted = True
+        self.engine.stop()
         
-    def moveCalcProgressChanged (self, percentageComplete):
+    def close (self):
+        '''
+        Ends the engine process, called when the game is dropped
+        '''
+        self.engine.close()
+        
+    def engineInfoReceived (self, info):
+        if "progress" in info:
+            info.setdefault("best", None)
+            self.moveCalcProgressChanged(info)
+        elif "score" in info:
+            # A depth was completed
+            best = info["pv"][0] if len(info.get("pv", [])) > 0 else None
+            self.moveCalcProgressChanged({"progress": 100.0, "depth": info["depth"], "nodes": info["nodes"],
+                                          "nps": info["nps"], "best": best})
+        
+    def moveCalcProgressChanged (self, progress):
+        '''
+        progress is a dict with the keys progress (percentage of the
+        current depth), depth, nodes, nps (nodes per second) and best
+        (best move so far or None)
+        '''
         if self.progressChangedReciever != None:
-            self.progressChangedReciever(str(percentageComplete) + "% done")
+            self.progressChangedReciever(progress)
         
         
@@ -0,0 +1,219 @@
+import os
+
+from GameBoard import Board
+
+
+# Version of the database, changes with searchKey or the columns
+formatVersion = 1
+
+# Share of the entries dropped at once, when the memory cache is full
+evictedShare = 0.125
+
+class PositionCache (object):
+    '''
+    Caches the results of already searched positions
+    (key, depth, score, bound, best move).
+    Without a path, the cache only lives in memory. With a path, the cache
+    is backed by a SQLite database, which is shared by all processes using
+    the same file. Any number of processes may read the database at the same
+    time, while only one at a time can write to it (see flush()).
+    On opening, the deepest entries of the database are loaded into memory,
+    so the first search of a new process already profits from the positions
+    searched before.
+    The scores depend on the evaluation weights. The database keeps the
+    fingerprint of the weights it was written with (see
+    MinMax.evaluationFingerprint, by default the weights of this process)
+    and formatVersion. Opening a database of other weights or another
+    version clears it, read only it can't be opened (ValueError).
+    '''
+
+    # bounds
+    Exact, LowerBound, UpperBound = range(3)
+
+    def __init__ (self, path=None, maxEntries=1000000, readOnly=False, warmStart=True, fingerprint=None):
+        self.path = path
+        self.maxEntries = maxEntries
+        self.readOnly = readOnly
+        self.fingerprint = fingerprint
+
+        # key -> (depth, score, bound, move)
+        self.entries = {}
+
+        # keys of entries, which changed since the last flush
+        self.dirtyKeys = set()
+
+        self.connection = None
+        if path != None:
+            self.openDatabase()
+            if warmStart:
+                self.load()
+
+    def openDatabase (self):
+        # Imported here, so processes without a database don't pay for it
+        import sqlite3
+        
+        if self.fingerprint == None:
+            # Imported here, MinMax imports this module
+            import MinMax
+            self.fingerprint = MinMax.evaluationFingerprint()
+
+        if self.readOnly:
+            self.connection = sqlite3.connect("file:" + os.path.abspath(self.path) + "?mode=ro", uri=True, timeout=30,
+                                              check_same_thread=False)
+            if self.storedFingerprint() != (formatVersion, self.fingerprint):
+                self.connection.close()
+                self.connection = None
+                raise ValueError(self.path + " was written with other evaluation weights or by another version")
+            return
+
+        # The engine flushes from its search thread, but only one
+        # thread at a time uses the cache
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        # Write ahead logging lets readers continue, while a writer is active
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            stored = self.storedFingerprint()
+            if stored != (formatVersion, self.fingerprint):
+                if self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'positions'").fetchone() != None:
+                    print("Cleared " + self.path + ", it was written with other evaluation weights or by another version")
+                self.connection.execute("DROP TABLE IF EXISTS positions")
+                self.connection.execute("DROP TABLE IF EXISTS info")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS positions ("
+                "key INTEGER PRIMARY KEY, depth INTEGER, score INTEGER, "
+                "bound INTEGER, move INTEGER)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS positions_depth ON positions (depth)")
+            if stored != (formatVersion, self.fingerprint):
+                self.connection.execute("CREATE TABLE info (version INTEGER, fingerprint INTEGER)")
+                self.connection.execute("INSERT INTO info VALUES (?, ?)", (formatVersion, self.fingerprint))
+
+    def storedFingerprint (self):
+        '''
+        Returns (formatVersion, fingerprint) of the database or None,
+        if it has none (it's new or older than the fingerprints)
+        '''
+        import sqlite3
+        try:
+            row = self.connection.execute("SELECT version, fingerprint FROM info").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        if row == None:
+            return None
+        return tuple(row)
+
+    def load (self):
+        '''
+        Warm start: Fills the memory cache with the deepest entries of
+        the database.
+        '''
+        rows = self.connection.execute(
+            "SELECT key, depth, score, bound, move FROM positions ORDER BY depth DESC LIMIT ?",
+            (self.maxEntries,))
+        for key, depth, score, bound, move in rows:
+            self.entries[key] = (depth, score, bound, move)
+
+    def probe (self, key):
+        '''
+        Returns (depth, score, bound, move) or None, if the position
+        is unknown
+        '''
+        return self.entries.get(key)
+
+    def store (self, key, depth, score, bound, move):
+        '''
+        Entries searched to a lower depth, than the already cached
+        one, are discarded.
+        '''
+        entry = self.entries.get(key)
+        if entry != None and entry[0] > depth:
+            return
+
+        if entry == None and len(self.entries) >= self.maxEntries:
+            self.evict()
+
+        self.entries[key] = (depth, score, bound, move)
+        if self.connection != None and not self.readOnly:
+            self.dirtyKeys.add(key)
+
+    def evict (self):
+        '''
+        Makes room by dropping the most shallow entries (evictedShare of
+        them), like flush does in the database. Changed entries are
+        written to the database first, so they aren't lost.
+        '''
+        self.flush()
+        count = max(1, int(len(self.entries) * evictedShare))
+        keysByDepth = {}
+        for key, entry in self.entries.items():
+            keysByDepth.setdefault(entry[0], []).append(key)
+        for depth in sorted(keysByDepth):
+            for key in keysByDepth[depth]:
+                del self.entries[key]
+                count -= 1
+                if count == 0:
+                    return
+
+    def flush (self):
+        '''
+        Writes all changed entries to the database. Only one process
+        at a time can hold the write lock, others wait for it.
+        Afterwards the database is shrunk back to maxEntries, by evicting
+        the most shallow entries.
+        '''
+        if self.connection == None or self.readOnly or len(self.dirtyKeys) == 0:
+            return
+
+        rows = []
+        for key in self.dirtyKeys:
+            depth, score, bound, move = self.entries[key]
+            rows.append((key, depth, score, bound, move))
+        self.dirtyKeys.clear()
+
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            if self.storedFingerprint() != (formatVersion, self.fingerprint):
+                # Another process with other weights cleared the database
+                return
+            self.connection.executemany(
+                "INSERT INTO positions (key, depth, score, bound, move) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET depth=excluded.depth, score=excluded.score, "
+                "bound=excluded.bound, move=excluded.move WHERE excluded.depth >= positions.depth",
+                rows)
+            count = self.connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+            if count > self.maxEntries:
+                self.connection.execute(
+                    "DELETE FROM positions WHERE key IN "
+                    "(SELECT key FROM positions ORDER BY depth ASC LIMIT ?)",
+                    (count - self.maxEntries,))
+
+    def close (self):
+        if self.connection == None:
+            return
+        self.flush()
+        self.connection.close()
+        self.connection = None
+
+    def __len__ (self):
+        return len(self.entries)
+
+def searchKey (board, pieceType, currentPlayerPieceType):
+    '''
+    Extends the position key with everything else the search result
+    depends on: the player to move, the perspective of the evaluation and
+    if the last turn closed a muehle.
+    '''
+    key = board.positionKey() << 1
+    if currentPlayerPieceType == Board.Black:
+        key |= 1
+    key <<= 1
+    if pieceType == Board.Black:
+        key |= 1
+    key <<= 1
+    if len(board.opCodeHistory) != 0:
+        lastOpCode = board.opCodeHistory[len(board.opCodeHistory) - 1]
+        if (lastOpCode == Board.InternalChangePhaseFromRemoveToMove or
+            lastOpCode == Board.InternalChangePhaseFromRemoveToSet):
+            key |= 1
+    return key
@@ -0,0 +1,175 @@
+'''
+Proof number search for forced wins (depth first variant, df-pn).
+Instead of scoring positions with the evaluation, it only asks whether the
+attacker can force a win: a position is proven, if the attacker wins in
+it whatever the defender does, and disproven, if he can't. The search
+always continues at the position, which is cheapest to prove or disprove
+(the fewest positions left to decide), so forced sequences of muehles are
+found far beyond the depth of the alpha beta search.
+Remis and repeated positions count as not won. Proven wins are cached
+between the searches (see provenWins), so the following moves of a won
+game are found without searching. A proof depends on the turns left until
+the no progress remis (see Board.noProgressLimit), so they are part of the
+key. It also depends on the positions a repetition is compared with, those
+since the last removal, so a hash of them is part of the key, too.
+'''
+from GameBoard import Board
+from MCTS import playMove
+import MinMax
+
+
+# proof and disproof number of decided positions
+proofInfinity = 10 ** 9
+
+# longest line searched, deeper positions count as not won
+maxPlies = 150
+
+# proven positions (see solverKey) -> winning move, None if the defender
+# is to move (all his moves lose)
+provenWins = {}
+maxProvenWins = 200000
+
+wordMask = (1 << 64) - 1
+
+def noProgressTurns (board):
+    '''
+    Turns since the last removal, as counted for Board.noProgressLimit
+    '''
+    if len(board.positionHistory) == 0:
+        return 0
+    return board.positionHistory[-1][2]
+
+def historyHash (board):
+    '''
+    Hash of the positions since the last removal, the ones repetitions
+    are compared with (see Board.recordPosition)
+    '''
+    window = board.positionHistory[-noProgressTurns(board) - 1:]
+    return hash(tuple(entry[0] for entry in window)) & wordMask
+
+def solverKey (board, attacker, currentPlayerPieceType):
+    # The position key and the hash have less than 64 bits each
+    key = (((noProgressTurns(board) << 64) | historyHash(board)) << 64) | board.positionKey()
+    return (key << 2) | (attacker << 1) | currentPlayerPieceType
+
+class ProofSearch (object):
+    '''
+    A single proof of the position for attacker. The proof and disproof
+    numbers of the positions, which aren't decided yet, are only kept
+    during the search.
+    '''
+
+    def __init__ (self, attacker, nodeBudget, search=None):
+        self.attacker = attacker
+        self.nodeBudget = nodeBudget
+        self.search = search
+        self.nodes = 0
+        # key -> (proof number, disproof number)
+        self.numbers = {}
+
+    def stopped (self):
+        return self.nodes >= self.nodeBudget or (self.search != None and self.search.stopped)
+
+    def expand (self, board, currentPlayerPieceType):
+        '''
+        Returns [move, key, next player, numbers of decided positions or None]
+        for every move of the player
+        '''
+        children = []
+        for move in list(MinMax.nextPossibleMoves(board, currentPlayerPieceType)):
+            nextPlayer = playMove(board, move, currentPlayerPieceType)
+            self.nodes += 1
+            if self.search != None:
+                self.search.visitNode()
+
+            numbers = None
+            if board.gamePhase == Board.WhiteWins or board.gamePhase == Board.BlackWins:
+                won = (board.gamePhase == Board.WhiteWins) == (self.attacker == Board.White)
+                numbers = (0, proofInfinity) if won else (proofInfinity, 0)
+            elif board.gamePhase == Board.Remis or board.currentRepetitions() > 0:
+                numbers = (proofInfinity, 0)
+            key = solverKey(board, self.attacker, nextPlayer)
+            if key in provenWins:
+                numbers = (0, proofInfinity)
+            children.append([move, key, nextPlayer, numbers])
+            board.revertMove()
+        return children
+
+    def collect (self, children, attacking):
+        '''
+        Returns the proof and disproof number of the position, the index of
+        the child to search next and the number the child has to beat
+        '''
+        sumNumber = 0
+        best = None
+        bestNumber = proofInfinity + 1
+        secondNumber = proofInfinity
+        for index in range(len(children)):
+            numbers = children[index][3]
+            if numbers == None:
+                numbers = self.numbers.get(children[index][1], (1, 1))
+            # The attacker needs one proven child, the defender all of them
+            minNumber, addedNumber = numbers if attacking else (numbers[1], numbers[0])
+            sumNumber = min(proofInfinity, sumNumber + addedNumber)
+            if minNumber < bestNumber:
+                secondNumber = bestNumber
+                bestNumber = minNumber
+                best = index
+            elif minNumber < secondNumber:
+                secondNumber = minNumber
+        secondNumber = min(secondNumber, proofInfinity)
+        if attacking:
+            return bestNumber, sumNumber, best, secondNumber
+        return sumNumber, bestNumber, best, secondNumber
+
+    def mid (self, board, currentPlayerPieceType, plies, proofThreshold, disproofThreshold):
+        '''
+        Searches the position, until its proof number reaches proofThreshold
+        or its disproof number disproofThreshold. Returns both numbers.
+        '''
+        attacking = currentPlayerPieceType == self.attacker
+        key = solverKey(board, self.attacker, currentPlayerPieceType)
+        if plies >= maxPlies:
+            return proofInfinity, 0
+        children = self.expand(board, currentPlayerPieceType)
+        if len(children) == 0:
+            # Can't move, which loses
+            return (proofInfinity, 0) if attacking else (0, proofInfinity)
+
+        while True:
+            proof, disproof, best, secondNumber = self.collect(children, attacking)
+            if proof >= proofThreshold or disproof >= disproofThreshold or self.stopped():
+                break
+
+            move, childKey, nextPlayer, numbers = children[best]
+            childProof, childDisproof = self.numbers.get(childKey, (1, 1))
+            if attacking:
+                childProofThreshold = min(proofThreshold, secondNumber + 1)
+                childDisproofThreshold = min(proofInfinity, disproofThreshold - disproof + childDisproof)
+            else:
+                childProofThreshold = min(proofInfinity, proofThreshold - proof + childProof)
+                childDisproofThreshold = min(disproofThreshold, secondNumber + 1)
+
+            playMove(board, move, currentPlayerPieceType)
+            self.numbers[childKey] = self.mid(board, nextPlayer, plies + 1,
+                                              childProofThreshold, childDisproofThreshold)
+            board.revertMove()
+
+        self.numbers[key] = (proof, disproof)
+        if proof == 0:
+            if len(provenWins) >= maxProvenWins:
+                provenWins.clear()
+            provenWins[key] = children[best][0] if attacking else None
+        return proof, disproof
+
+def winningMove (board, pieceType, nodeBudget, search=None):
+    '''
+    Returns a move, which wins by force for pieceType (the player to move),
+    or None, if there is none or it wasn't found within nodeBudget positions.
+    '''
+    key = solverKey(board, pieceType, pieceType)
+    if key not in provenWins:
+        proofSearch = ProofSearch(pieceType, nodeBudget, search)
+        # The moves are applied and reverted in place
+        proofSearch.mid(Board(board), pieceType, 0, proofInfinity, proofInfinity)
+    return provenWins.get(key)
@@ -0,0 +1,112 @@
+'''
+Loads the images, GIFs and forms of the UI only once and keeps them in
+memory, so opening a dialog or finishing a turn doesn't touch the disk.
+The forms in ui/ can be compiled ahead of time with
+    python Resources.py
+which writes a python module next to every .ui file. Compiled forms are
+used as long as they are newer than their .ui file, otherwise the .ui file
+is parsed once on first use.
+'''
+import importlib.util
+import os
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+from PyQt5.QtGui import QMovie, QPixmap
+
+
+# path pointing to project folder in which Resources.py is located
+path = os.path.dirname(os.path.abspath(__file__))
+
+# forms, which are compiled by running this file
+formPaths = ["ui/mainwindow.ui", "ui/newgame.ui", "ui/win.ui"]
+
+# (relPath, width) -> QPixmap
+pixmaps = {}
+
+# relPath -> QByteArray
+movieData = {}
+
+# relPath -> form class
+formClasses = {}
+
+def relPathToAbs (relPath):
+    '''
+    Converts a path relative to the project folder into an absolute one
+    '''
+    return os.path.join(path, relPath)
+
+def pixmap (relPath, width=None):
+    '''
+    Returns the image, scaled to width if given. Needs a QApplication.
+    '''
+    key = (relPath, width)
+    if key not in pixmaps:
+        image = QPixmap(relPathToAbs(relPath))
+        if width != None:
+            image = image.scaledToWidth(width)
+        pixmaps[key] = image
+    return pixmaps[key]
+
+def movie (relPath):
+    '''
+    Returns a new QMovie playing the GIF from memory. The file is read once,
+    every movie gets its own buffer on the shared data, so multiple movies
+    can play at the same time.
+    '''
+    if relPath not in movieData:
+        with open(relPathToAbs(relPath), "rb") as gifFile:
+            movieData[relPath] = QByteArray(gifFile.read())
+
+    buffer = QBuffer()
+    buffer.setData(movieData[relPath])
+    buffer.open(QIODevice.ReadOnly)
+    # With the format given, the buffer isn't mistaken for the parent
+    newMovie = QMovie(buffer, QByteArray(b"gif"))
+    # The movie doesn't own the buffer, keep it alive as long as the movie
+    newMovie.buffer = buffer
+    newMovie.setCacheMode(QMovie.CacheAll)
+    return newMovie
+
+def compiledFormPath (relPath):
+    return relPathToAbs(relPath[:-len(".ui")] + "_ui.py")
+
+def formClass (relPath):
+    '''
+    Returns the class generated from the form, which sets up the
+    widgets with setupUi(widget).
+    '''
+    if relPath in formClasses:
+        return formClasses[relPath]
+
+    compiledPath = compiledFormPath(relPath)
+    if (os.path.exists(compiledPath)
+        and os.path.getmtime(compiledPath) >= os.path.getmtime(relPathToAbs(relPath))):
+        spec = importlib.util.spec_from_file_location(os.path.basename(compiledPath)[:-3], compiledPath)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        generatedClass = [getattr(module, name) for name in dir(module) if name.startswith("Ui_")][0]
+    else:
+        # Parsing the xml is slow, only done if the form isn't compiled
+        from PyQt5 import uic
+        generatedClass = uic.loadUiType(relPathToAbs(relPath))[0]
+
+    formClasses[relPath] = generatedClass
+    return generatedClass
+
+def setupForm (widget, relPath):
+    '''
+    Populates the widget with the form, like uic.loadUi does
+    '''
+    form = formClass(relPath)()
+    form.setupUi(widget)
+    return form
+
+def compileForms ():
+    from PyQt5 import uic
+    for relPath in formPaths:
+        with open(compiledFormPath(relPath), "w") as compiledFile:
+            uic.compileUi(relPathToAbs(relPath), compiledFile)
+        print("Compiled " + relPath)
+
+if __name__ == "__main__":
+    compileForms()
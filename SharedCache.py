@@ -0,0 +1,195 @@
+'''
+A cache of searched positions in shared memory, so searches in different
+processes (see MinMax.ParallelSearch) profit from each other's results.
+It has the same probe and store as PositionCache.
+Every entry consists of two 64 bit words: the packed data and the key
+XORed with the data. Writers don't take any lock. If two processes write
+the same entry at the same time, the words of the entry don't fit together
+anymore, and the entry is read as missing instead of returning a wrong one.
+The entries are grouped in buckets of two: the first entry keeps the
+deepest search, the second one always takes the newest entry.
+The header holds formatVersion and the fingerprint of the evaluation
+weights (see MinMax.evaluationFingerprint), the scores were searched with.
+'''
+from multiprocessing import shared_memory
+import os
+
+
+# words in front of the entries: the number of buckets, formatVersion
+# and the fingerprint of the evaluation weights
+headerWords = 8
+
+# Version of the table, changes with searchKey or the layout of the entries
+formatVersion = 1
+
+# Layout of the packed data (from the lowest bit):
+# used (1), bound (2), depth (8), move + 1 (17, 0 for no move), score + scoreOffset (36)
+scoreOffset = 1 << 35
+wordMask = (1 << 64) - 1
+
+def packEntry (depth, score, bound, move):
+    score = max(-scoreOffset, min(scoreOffset - 1, score))
+    if move == None:
+        move = -1
+    return (1 | (bound << 1) | (min(depth, 255) << 3) | ((move + 1) << 11)
+            | ((score + scoreOffset) << 28))
+
+def unpackEntry (data):
+    '''
+    Returns (depth, score, bound, move) like PositionCache.probe
+    '''
+    move = ((data >> 11) & 0x1ffff) - 1
+    if move < 0:
+        move = None
+    return ((data >> 3) & 255, (data >> 28) - scoreOffset, (data >> 1) & 3, move)
+
+def bucketIndex (key, buckets):
+    # The lowest bits of the keys are flags, mix all bits into the index
+    return (((key * 0x9E3779B97F4A7C15) & wordMask) >> 16) % buckets
+
+class SharedPositionCache (object):
+    '''
+    Without a name, a new table with room for maxEntries entries is
+    created. With a name and create=False, the existing table of that name
+    is used. The process, which created the table, removes it on close().
+    Pickling the cache (e.g. to pass it to a worker process) passes
+    the name, the worker uses the same table (see attachSharedCache).
+    A new table gets the fingerprint (by default the one of the weights
+    of this process). An existing table of another formatVersion or another
+    fingerprint (if one is given) raises ValueError.
+    '''
+
+    def __init__ (self, name=None, maxEntries=1 << 20, create=True, fingerprint=None):
+        if create and fingerprint == None:
+            # Imported here, MinMax imports the caches
+            import MinMax
+            fingerprint = MinMax.evaluationFingerprint()
+        if create:
+            buckets = max(1, maxEntries // 2)
+            self.memory = shared_memory.SharedMemory(name, True, (headerWords + 4 * buckets) * 8)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            if os.name == "posix":
+                # Otherwise the table would be removed, when this process ends
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.owner = create
+        self.words = self.memory.buf.cast("Q")
+        if create:
+            self.words[0] = buckets
+            self.words[1] = formatVersion
+            self.words[2] = fingerprint
+        elif self.words[1] != formatVersion or (fingerprint != None and self.words[2] != fingerprint):
+            self.words.release()
+            self.memory.close()
+            raise ValueError("The shared cache " + str(name) + " was created with other evaluation weights"
+                             " or by another version")
+        self.buckets = self.words[0]
+
+    @property
+    def name (self):
+        return self.memory.name
+
+    def __reduce__ (self):
+        return (attachSharedCache, (self.name,))
+
+    def probe (self, key):
+        '''
+        Returns (depth, score, bound, move) or None, if the position
+        is unknown
+        '''
+        key &= wordMask
+        words = self.words
+        index = headerWords + 4 * bucketIndex(key, self.buckets)
+        for i in (index, index + 2):
+            data = words[i + 1]
+            if data & 1 and words[i] ^ data == key:
+                return unpackEntry(data)
+        return None
+
+    def store (self, key, depth, score, bound, move):
+        '''
+        Entries searched to a lower depth, than the already cached
+        one, are discarded.
+        '''
+        key &= wordMask
+        words = self.words
+        index = headerWords + 4 * bucketIndex(key, self.buckets)
+        data = words[index + 1]
+        deepestDepth = (data >> 3) & 255
+        if data & 1 and words[index] ^ data == key:
+            if deepestDepth > depth:
+                return
+        elif data & 1 and deepestDepth > depth:
+            # Keep the deeper entry, replace the newest one
+            index += 2
+            data = words[index + 1]
+            if data & 1 and words[index] ^ data == key and ((data >> 3) & 255) > depth:
+                return
+
+        data = packEntry(depth, score, bound, move)
+        words[index + 1] = data
+        words[index] = key ^ data
+
+    def flush (self):
+        '''
+        Nothing to write, the entries are visible to all processes at once
+        '''
+        pass
+
+    def clear (self):
+        words = self.words
+        for i in range(headerWords, len(words)):
+            words[i] = 0
+
+    def close (self):
+        if self.memory == None:
+            return
+        self.words.release()
+        self.memory.close()
+        if self.owner:
+            if os.name == "posix":
+                # Workers attached to the table unregistered it,
+                # register it again, so it can be unregistered by unlink()
+                from multiprocessing import resource_tracker
+                resource_tracker.register(self.memory._name, "shared_memory")
+            self.memory.unlink()
+        self.memory = None
+
+    def __len__ (self):
+        words = self.words
+        return sum(1 for i in range(headerWords + 1, len(words), 2) if words[i] & 1)
+
+# name -> tables used by this process, but created by another one
+attachedCaches = {}
+
+def attachSharedCache (name):
+    '''
+    Returns the existing table of that name. Every process attaches
+    to a table only once, no matter how often it's unpickled.
+    '''
+    if name not in attachedCaches:
+        import atexit
+        attachedCaches[name] = SharedPositionCache(name, create=False)
+        # The view on the memory has to be released, before it's closed
+        atexit.register(attachedCaches[name].close)
+    return attachedCaches[name]
+
+def openSharedCache (name, maxEntries=1 << 20, fingerprint=None):
+    '''
+    Uses the table of that name, if it exists, otherwise it is created.
+    This way all engines on a host can share one table. A table of other
+    evaluation weights (see SharedPositionCache) raises ValueError.
+    '''
+    if fingerprint == None:
+        import MinMax
+        fingerprint = MinMax.evaluationFingerprint()
+    try:
+        return SharedPositionCache(name, create=False, fingerprint=fingerprint)
+    except FileNotFoundError:
+        pass
+    try:
+        return SharedPositionCache(name, maxEntries, fingerprint=fingerprint)
+    except FileExistsError:
+        # Another process was faster
+        return SharedPositionCache(name, create=False, fingerprint=fingerprint)
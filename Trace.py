@@ -0,0 +1,144 @@
+'''
+Opt-in timeline of games and searches. While it's enabled, spans (turns,
+search iterations, root moves, proof searches, MCTS rollouts, UI handlers)
+are recorded and write() saves them as Chrome trace events (JSON), which
+Perfetto (ui.perfetto.dev) and chrome://tracing open.
+    python Main.pyw --trace trace.json
+        Traces the game and the UI. The engines of the AI players trace
+        their searches into files of their own (trace.json.engine1.json, ...)
+    python Engine.py --trace trace.json
+    python Trace.py merged.json trace.json trace.json.engine1.json ...
+        Merges the files of several processes into one timeline
+While it's disabled, span() only returns a shared object doing nothing.
+Every thread gets its own track. The times are those of time.perf_counter,
+which all processes of a machine share.
+'''
+import json
+import os
+import sys
+import threading
+import time
+
+
+enabled = False
+
+# file written by write() and number of the last file handed out by childPath
+path = None
+childFiles = 0
+
+# complete events (see span) and thread names by thread id,
+# list.append is atomic, so the threads don't need a lock
+events = []
+threadNames = {}
+
+class Span (object):
+    '''
+    Records the time between entering and leaving it
+    '''
+
+    def __init__ (self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__ (self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__ (self, excType, excValue, traceback):
+        complete(self.name, self.category, self.start, self.args)
+        return False
+
+class NoSpan (object):
+    '''
+    Returned by span, while tracing is disabled
+    '''
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, excType, excValue, traceback):
+        return False
+
+noSpan = NoSpan()
+
+def start (tracePath):
+    '''
+    Enables tracing into the file tracePath, drops the events recorded before
+    '''
+    global enabled, path
+    del events[:]
+    threadNames.clear()
+    path = tracePath
+    enabled = True
+
+def childPath ():
+    '''
+    Returns a file for the trace of a process started by this one
+    '''
+    global childFiles
+    childFiles += 1
+    return "%s.engine%d.json" % (path, childFiles)
+
+def span (name, category, args=None):
+    '''
+    Use as "with Trace.span(...):". args (a dict) are shown with the span.
+    '''
+    if not enabled:
+        return noSpan
+    return Span(name, category, args)
+
+def complete (name, category, start, args=None):
+    '''
+    Records a span from start (see time.perf_counter) until now
+    '''
+    end = time.perf_counter()
+    thread = threading.get_ident()
+    if thread not in threadNames:
+        threadNames[thread] = threading.current_thread().name
+    event = {"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": thread,
+             "ts": start * 1e6, "dur": (end - start) * 1e6}
+    if args != None:
+        event["args"] = args
+    events.append(event)
+
+def nameThread (name):
+    '''
+    Names the track of the current thread, e.g. for QThreads, which
+    Python only knows as dummy threads
+    '''
+    if enabled:
+        threadNames[threading.get_ident()] = name
+
+def write ():
+    '''
+    Writes the recorded events as Chrome trace event JSON and stops tracing
+    '''
+    global enabled
+    enabled = False
+    pid = os.getpid()
+    names = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": name}}
+             for thread, name in list(threadNames.items())]
+    names.append({"name": "process_name", "ph": "M", "pid": pid,
+                  "args": {"name": os.path.basename(sys.argv[0]) or "python"}})
+    with open(path, "w") as traceFile:
+        json.dump({"traceEvents": names + list(events), "displayTimeUnit": "ms"}, traceFile)
+    print("%d trace events written to %s" % (len(events), path))
+
+def merge (outPath, paths):
+    '''
+    Writes the events of several trace files into one
+    '''
+    merged = []
+    for tracePath in paths:
+        with open(tracePath) as traceFile:
+            merged.extend(json.load(traceFile)["traceEvents"])
+    with open(outPath, "w") as traceFile:
+        json.dump({"traceEvents": merged, "displayTimeUnit": "ms"}, traceFile)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("python Trace.py merged.json trace.json [trace.json ...]")
+    else:
+        merge(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,274 @@
+'''
+Tunes the weights of the evaluation (see MinMax.evaluateBoardState) on
+games the engine played against itself. Requires NumPy.
+    python Tuning.py selfplay games.txt [--games 1000] [--depth 2] [--randomMoves 6]
+        Appends self-play games to the records file, one game per line:
+            <result> <move> <move> ...
+        with the result being 1-0 (white won), 0-1 (black won) or 1/2-1/2
+        and the moves written like in Engine.py. The first moves of every
+        game are random, so the games differ.
+    python Tuning.py fit games.txt [--out weights.json]
+        Extracts the features of all positions of the games in one
+        vectorised pass and fits the weights of every phase against the
+        results of the games (logistic regression, like Texel tuning).
+        The engine loads the written file at startup (see Engine.py).
+'''
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import random
+
+import numpy as np
+
+from Engine import moveToText, textToMove
+from GameBoard import Board, invertPieceType, convRingNotationToIndex
+import MinMax
+
+
+results = {Board.WhiteWins: "1-0", Board.BlackWins: "0-1", Board.Remis: "1/2-1/2"}
+
+# result -> score of white
+resultScores = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+phaseNames = ["set", "move", "flying"]
+
+def playGame (seed, depth, randomMoves, maxTurns=200):
+    '''
+    Plays one game of the engine against itself. Returns the record line.
+    Games without a result after maxTurns are counted as remis.
+    '''
+    rng = random.Random(seed)
+    board = Board()
+    pieceType = Board.White
+    turns = 0
+    moves = []
+    while (board.gamePhase in (Board.PieceSetPhase, Board.PieceMovePhase,
+                               Board.PieceSetRemovePhase, Board.PieceMoveRemovePhase)
+           and turns < maxTurns):
+        if turns < randomMoves:
+            move = rng.choice(list(MinMax.nextPossibleMoves(board, pieceType)))
+        else:
+            move = MinMax.bestNextMove(board, pieceType, depth)
+        board.executeMove(move)
+        moves.append(move)
+        if (board.gamePhase != Board.PieceSetRemovePhase
+            and board.gamePhase != Board.PieceMoveRemovePhase):
+            board.checkBoardState(invertPieceType(pieceType), False)
+            pieceType = invertPieceType(pieceType)
+            turns += 1
+    result = results.get(board.gamePhase, "1/2-1/2")
+    return result + " " + " ".join(moveToText(move) for move in moves)
+
+def selfPlay (path, games, depth, randomMoves, workers=None, firstSeed=0):
+    with ProcessPoolExecutor(workers) as executor:
+        lines = executor.map(playGame, range(firstSeed, firstSeed + games),
+                             [depth] * games, [randomMoves] * games)
+        with open(path, "a") as recordsFile:
+            for line in lines:
+                recordsFile.write(line + "\n")
+
+def readPositions (path):
+    '''
+    Replays the recorded games. Returns the positions at the end of every
+    turn as arrays: values (n, 24), counters (n, 4: unplaced white and black,
+    never placed white and black), game phases, players to move, whether the
+    last turn closed a muehle, and the score of white in the game.
+    '''
+    values = []
+    counters = []
+    gamePhases = []
+    players = []
+    muehleClosed = []
+    scores = []
+    with open(path) as recordsFile:
+        for line in recordsFile:
+            tokens = line.split()
+            if len(tokens) == 0:
+                continue
+            score = resultScores[tokens[0]]
+
+            board = Board()
+            pieceType = Board.White
+            for text in tokens[1:]:
+                board.executeMove(textToMove(text))
+                if (board.gamePhase == Board.PieceSetRemovePhase
+                    or board.gamePhase == Board.PieceMoveRemovePhase):
+                    continue
+                board.checkBoardState(invertPieceType(pieceType), False)
+                pieceType = invertPieceType(pieceType)
+                if MinMax.evaluationPhase(board, pieceType) == None:
+                    break
+
+                lastOpCode = board.opCodeHistory[len(board.opCodeHistory) - 1]
+                values.append(list(board.values))
+                counters.append((board.unplacedWhitePieces, board.unplacedBlackPieces,
+                                 board.neverPlacedWhitePieces, board.neverPlacedBlackPieces))
+                gamePhases.append(board.gamePhase)
+                players.append(pieceType)
+                muehleClosed.append(lastOpCode == Board.InternalChangePhaseFromRemoveToMove
+                                    or lastOpCode == Board.InternalChangePhaseFromRemoveToSet)
+                scores.append(score)
+
+    return (np.array(values, dtype=np.int8).reshape(-1, 24), np.array(counters, dtype=np.int8).reshape(-1, 4),
+            np.array(gamePhases, dtype=np.int8), np.array(players, dtype=np.int8),
+            np.array(muehleClosed, dtype=bool), np.array(scores))
+
+def neighbours (index):
+    '''
+    Points, which decide if the piece at index is blocked
+    (see Board.isPieceBlocked)
+    '''
+    iRing, iNode = index // 8, index % 8
+    points = [convRingNotationToIndex(iRing, iNode + 1), convRingNotationToIndex(iRing, iNode - 1)]
+    if iNode % 2 == 0:
+        if iRing <= 1:
+            points.append(convRingNotationToIndex(iRing + 1, iNode))
+        if iRing >= 1:
+            points.append(convRingNotationToIndex(iRing - 1, iNode))
+    return points
+
+def lineIndices (values, points):
+    index = np.zeros(len(values), dtype=np.int32)
+    for point in points:
+        index = index * 3 + values[:, point]
+    return index
+
+def extractFeatures (values, counters, players, muehleClosed, pieceType):
+    '''
+    Vectorised MinMax.evaluationFeatures for all positions at once,
+    from the view of pieceType. Returns an array (n, len(featureNames)).
+    '''
+    sign = MinMax.pieceTypeSign(pieceType)
+    muehleTable = np.array(MinMax.muehleTable)
+    twoPiecesTable = np.array(MinMax.twoPiecesTable)
+    cornerTable = np.array(MinMax.cornerTable)
+
+    threePieces = sum(cornerTable[lineIndices(values, points)] for points in MinMax.cornerPatterns) * sign
+
+    own, other = (0, 1) if pieceType == Board.White else (1, 0)
+    pieces = counters[:, other].astype(int) + counters[:, other + 2] - counters[:, own] - counters[:, own + 2]
+
+    blocked = np.zeros(len(values), dtype=int)
+    for index in range(24):
+        isBlocked = values[:, index] != Board.Empty
+        for point in neighbours(index):
+            isBlocked &= values[:, point] != Board.Empty
+        blocked += np.where(values[:, index] == pieceType, -1, 1) * isBlocked
+
+    twoPieces = sum(twoPiecesTable[lineIndices(values, points)] for points in MinMax.twoPiecesLines) * sign
+
+    # Same order and carried flags as in MinMax.evaluateMuehles
+    vRowMuehles = [muehleTable[lineIndices(values, points)] * sign for points in MinMax.vRows]
+    muehles = np.zeros(len(values), dtype=int)
+    doubleMuehles = np.zeros(len(values), dtype=int)
+    prevRowWasMuehle = np.zeros(len(values), dtype=bool)
+    firstRowWasMuehle = np.zeros(len(values), dtype=bool)
+    for rows in MinMax.muehleRows:
+        for iRow in range(4):
+            muehle = muehleTable[lineIndices(values, rows[iRow])]
+            isMuehle = muehle != 0
+            muehles += muehle
+            doubleMuehles += (prevRowWasMuehle & isMuehle) + vRowMuehles[iRow] * isMuehle
+            if iRow == 0:
+                firstRowWasMuehle |= isMuehle
+            prevRowWasMuehle = isMuehle
+        doubleMuehles += prevRowWasMuehle & firstRowWasMuehle
+    muehles *= sign
+
+    closed = np.where(players == pieceType, -1, 1) * muehleClosed
+
+    return np.stack([closed, muehles, blocked, pieces, twoPieces, threePieces, doubleMuehles], axis=1).astype(float)
+
+def positionPhases (gamePhases, counters, players):
+    '''
+    Index into phaseNames for every position (see MinMax.evaluationPhase)
+    '''
+    unplaced = np.where(players == Board.White, counters[:, 0], counters[:, 1])
+    isSet = (gamePhases == Board.PieceSetPhase) | (gamePhases == Board.PieceSetRemovePhase)
+    return np.where(isSet, 0, np.where(unplaced >= 9 - 3, 2, 1))
+
+def sigmoid (x):
+    return 1 / (1 + np.exp(-np.clip(x, -500, 500)))
+
+def fitScale (evaluations, scores):
+    '''
+    Scale of the evaluation, which predicts the scores best with the
+    current weights (mean squared error, searched on a log grid)
+    '''
+    bestScale, bestError = None, None
+    for scale in np.logspace(-4, 0, 200):
+        error = np.mean((scores - sigmoid(scale * evaluations)) ** 2)
+        if bestError == None or error < bestError:
+            bestScale, bestError = scale, error
+    return bestScale
+
+def fitWeights (features, scores, start, regularization=1.0, iterations=25):
+    '''
+    Logistic regression of the scores on the features (Newton's method,
+    with a small ridge term for features, which are rare in a phase)
+    '''
+    weights = np.array(start, dtype=float)
+    for i in range(iterations):
+        predictions = sigmoid(features @ weights)
+        gradient = features.T @ (predictions - scores) + regularization * weights
+        hessian = (features.T * (predictions * (1 - predictions))) @ features
+        hessian += regularization * np.eye(len(weights))
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.max(np.abs(step)) < 1e-9:
+            break
+    return weights
+
+def fit (path, outPath):
+    values, counters, gamePhases, players, muehleClosed, scores = readPositions(path)
+
+    # Every position is learned from the view of both players
+    features = np.concatenate([extractFeatures(values, counters, players, muehleClosed, Board.White),
+                               extractFeatures(values, counters, players, muehleClosed, Board.Black)])
+    scores = np.concatenate([scores, 1 - scores])
+    phases = np.concatenate([positionPhases(gamePhases, counters, players)] * 2)
+
+    currentWeights = np.array([MinMax.evaluationWeights[name] for name in phaseNames], dtype=float)
+    evaluations = np.sum(features * currentWeights[phases], axis=1)
+    scale = fitScale(evaluations, scores)
+
+    weights = {"features": MinMax.featureNames, "scale": scale}
+    for phase in range(len(phaseNames)):
+        selected = phases == phase
+        name = phaseNames[phase]
+        if np.count_nonzero(selected) == 0:
+            weights[name] = MinMax.evaluationWeights[name]
+            continue
+        fitted = fitWeights(features[selected], scores[selected], currentWeights[phase] * scale)
+        # The search works with integer scores
+        weights[name] = [int(round(weight)) for weight in fitted / scale]
+        print("%s: %d positions, %s -> %s" % (name, np.count_nonzero(selected),
+                                              MinMax.evaluationWeights[name], weights[name]))
+
+    with open(outPath, "w") as weightsFile:
+        json.dump(weights, weightsFile, indent=4)
+
+def main ():
+    parser = argparse.ArgumentParser(description="Tuning of the evaluation weights")
+    subparsers = parser.add_subparsers(dest="command")
+    selfPlayParser = subparsers.add_parser("selfplay", help="record self-play games")
+    selfPlayParser.add_argument("records")
+    selfPlayParser.add_argument("--games", type=int, default=1000)
+    selfPlayParser.add_argument("--depth", type=int, default=2)
+    selfPlayParser.add_argument("--randomMoves", type=int, default=6, help="random turns at the start of a game")
+    selfPlayParser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    selfPlayParser.add_argument("--workers", type=int, default=None, help="number of processes")
+    fitParser = subparsers.add_parser("fit", help="fit the weights to recorded games")
+    fitParser.add_argument("records")
+    fitParser.add_argument("--out", default=MinMax.defaultWeightsPath)
+    args = parser.parse_args()
+
+    if args.command == "selfplay":
+        selfPlay(args.records, args.games, args.depth, args.randomMoves, args.workers, args.seed)
+    elif args.command == "fit":
+        fit(args.records, args.out)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
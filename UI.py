@@ -1,28 +1,20 @@
 import os
 import sys
-import webbrowser
 
-from PyQt5 import uic
 from PyQt5.Qt import pyqtSignal
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
+from Engine import moveToText
 from Game import Game
 from GameBoard import Board, convIndexToRingNotation
-import MinMax
 from Player import HumanPlayer, AIPlayer
+import Resources
+from Resources import relPathToAbs
+import Trace
 
 
-# path pointing to project folder in which Main.py is located
-path = os.path.dirname(os.path.abspath(__file__))
-
-def relPathToAbs (relPath):
-    '''
-    Converts a path relative to the project folder into an absolute one
-    '''
-    return os.path.join(path, relPath)
-
 class QMainMuehleUI (QMainWindow):
     
     # diameter of inner most ring
@@ -50,10 +42,16 @@ class QMainMuehleUI (QMainWindow):
     # currently highlighted Piece
     focusedPiece = None 
     
+    # slides the pieces to their new location, instead of just placing them there
+    animatePieces = True
+    
+    # duration of a piece animation in ms
+    animationDuration = 200
+    
     def __init__ (self):
         self.app = QApplication(sys.argv)
         QMainWindow.__init__(self)
-        uic.loadUi(relPathToAbs("ui/mainwindow.ui"), self)
+        Resources.setupForm(self, "ui/mainwindow.ui")
         
         boardView = self.findChild(QWidget, "boardWidget")
         self.scene = QGraphicsScene(boardView)
@@ -71,10 +69,21 @@ class QMainMuehleUI (QMainWindow):
         self.findChild(QPushButton, 'new_game').clicked.connect(self.showNewGameDialog)
         self.findChild(QPushButton, 'undo_button').clicked.connect(self.undo)
         self.findChild(QPushButton, 'help').clicked.connect(self.showHelp)
+        self.findChild(QPushButton, 'hint').clicked.connect(self.showHints)
+        
+        # analyses the position for a human player (see showHints)
+        self.hintThread = None
         
         self.pieceItemsWhite = []
         self.pieceItemsBlack = []
         
+        # board index -> piece item shown there or None
+        self.boardPieceItems = [None] * 24
+        
+        # piece type -> piece items next to the board, bottom one first
+        self.unplacedStacks = {Board.White: [], Board.Black: []}
+        self.neverPlacedStacks = {Board.White: [], Board.Black: []}
+        
         # populate board with all items necessary for visualization
         self.initBoardLines()
         self.initBoardPosClickHandler()
@@ -89,21 +98,16 @@ class QMainMuehleUI (QMainWindow):
         self.app.exec_()
         
     def startNewGame (self, game):
-        # abort old game, if still running
-        if self.game != None and self.game.isRunning():
-            self.game.abort()
-            self.game.wait()
-            
-        # event handling, so the AI can display its turn calculation completion
-        # mainly to let a human player now, the AI didn't crash
-        if game.player1.hasProgressSignal():
-            game.player1.progressChangedReciever = self.overrideInstructionLabel
-        if game.player2.hasProgressSignal():
-            game.player2.progressChangedReciever = self.overrideInstructionLabel
+        self.closeGame()
             
         self.game = game
         self.game.playerFinishedTurn.connect(self.playerFinishedTurn)
         self.game.gameEnded.connect(self.showVictoryWindow)
+        self.game.gameFailed.connect(self.overrideInstructionLabel)
+        
+        # event handling, so the AI can display its turn calculation completion
+        # mainly to let a human player now, the AI didn't crash
+        self.game.progressChanged.connect(self.showProgress)
         
         # Starts the games own thread
         self.game.start()
@@ -111,69 +115,127 @@ class QMainMuehleUI (QMainWindow):
         # to update the UI representation of the new game
         self.playerFinishedTurn()
         
-    def updatePiecePositions (self):
+    def closeGame (self):
         '''
-        Will move the black and white pieces around,
-        to fit the new board state
+        Aborts the current game, if it's still running, and ends the
+        engine processes of its players
         '''
-        offset = self.pieceDiameter / 2       
-        index = -1
+        if self.game == None:
+            return
+        if self.game.isRunning():
+            self.game.abort()
+            with Trace.span("wait for game thread", "ui"):
+                self.game.wait()
+        # The hints use the engine of the human player
+        if self.hintThread != None:
+            self.hintThread.wait()
+        self.game.close()
         
-        # Counts how many pieces of that kind are currently on the board
-        usedCounterWhite = 0
-        usedCounterBlack = 0
+    def closeEvent (self, event):
+        self.closeGame()
+        QMainWindow.closeEvent(self, event)
         
-        # Handle pieces set on the board
-        for val in self.game.board.values:
-            index += 1
-            
-            # If there is now piece at that location, skip it
-            if val == Board.Empty:
+    def updatePiecePositions (self):
+        '''
+        Will move the black and white pieces around,
+        to fit the new board state. Only the pieces, whose location
+        changed since the last update, are moved.
+        '''
+        board = self.game.board
+        self.updatePieceStacks(Board.White, board.unplacedWhitePieces, board.neverPlacedWhitePieces)
+        self.updatePieceStacks(Board.Black, board.unplacedBlackPieces, board.neverPlacedBlackPieces)
+        
+    def updatePieceStacks (self, pieceType, unplacedPieces, neverPlacedPieces):
+        values = self.game.board.values
+        unplacedStack = self.unplacedStacks[pieceType]
+        neverPlacedStack = self.neverPlacedStacks[pieceType]
+        
+        # Take the pieces off, whose location isn't theirs anymore
+        freedPieces = []
+        for index in range(len(values)):
+            piece = self.boardPieceItems[index]
+            if piece != None and piece.pieceType == pieceType and values[index] != pieceType:
+                freedPieces.append(piece)
+                self.boardPieceItems[index] = None
+                
+        # Fill the new locations: moved pieces first, then set pieces from
+        # the stack of never placed ones, then pieces given back by undo 
+        for index in range(len(values)):
+            if values[index] != pieceType or self.boardPieceItems[index] != None:
                 continue
             
-            x, y = self.pieceIndexToScreenCoors(index)    
-            x -= offset
-            y -= offset
-            if val == Board.White:
-                self.pieceItemsWhite[usedCounterWhite].setPos(x, y)
-                self.pieceItemsWhite[usedCounterWhite].boardIndex = index
-                usedCounterWhite += 1
+            if len(freedPieces) > 0:
+                piece = freedPieces.pop(0)
+            elif len(neverPlacedStack) > 0:
+                piece = neverPlacedStack.pop()
+            elif len(unplacedStack) > 0:
+                piece = unplacedStack.pop()
             else:
-                self.pieceItemsBlack[usedCounterBlack].setPos(x, y)
-                self.pieceItemsBlack[usedCounterBlack].boardIndex = index
-                usedCounterBlack += 1
+                break
+            self.boardPieceItems[index] = piece
+            piece.boardIndex = index
+            x, y = self.pieceIndexToScreenCoors(index)
+            self.movePieceItem(piece, x - self.pieceDiameter / 2, y - self.pieceDiameter / 2)
             
-        # Handle pieces not set on the board
-        for i in range(self.game.board.unplacedWhitePieces):
-            index = i + usedCounterWhite
-            self.pieceItemsWhite[index].setPos(self.pieceStackOriginWhite.x() - offset,
-                                self.pieceStackOriginWhite.y() - i * (self.pieceDiameter + 3) - offset)
-            self.pieceItemsWhite[index].boardIndex = -1
-             
-        for i in range(self.game.board.unplacedBlackPieces):
-            index = i + usedCounterBlack
-            self.pieceItemsBlack[index].setPos(self.pieceStackOriginBlack.x() - offset,
-                                self.pieceStackOriginBlack.y() - i * (self.pieceDiameter + 3) - offset)
-            self.pieceItemsBlack[index].boardIndex = -1
-        
-        for i in range(self.game.board.neverPlacedWhitePieces):
-            index = i + usedCounterWhite + self.game.board.unplacedWhitePieces
+        # Remaining pieces were removed or their set was undone
+        for piece in freedPieces:
+            piece.boardIndex = -1
+            if len(neverPlacedStack) < neverPlacedPieces:
+                neverPlacedStack.append(piece)
+            else:
+                unplacedStack.append(piece)
+                
+        # A new game or undo may require pieces to change the stack
+        while len(unplacedStack) > unplacedPieces and len(neverPlacedStack) < neverPlacedPieces:
+            neverPlacedStack.append(unplacedStack.pop())
+        while len(neverPlacedStack) > neverPlacedPieces and len(unplacedStack) < unplacedPieces:
+            unplacedStack.append(neverPlacedStack.pop())
+                
+        if pieceType == Board.White:
+            self.layoutPieceStack(unplacedStack, self.pieceStackOriginWhite)
+            self.layoutPieceStack(neverPlacedStack, self.pieceStackOriginNeverWhite)
+        else:
+            self.layoutPieceStack(unplacedStack, self.pieceStackOriginBlack)
+            self.layoutPieceStack(neverPlacedStack, self.pieceStackOriginNeverBlack)
             
-            self.pieceItemsWhite[index].setPos(self.pieceStackOriginNeverWhite.x() - offset,
-                                self.pieceStackOriginNeverWhite.y() - i * (self.pieceDiameter + 3) - offset)
-            self.pieceItemsWhite[index].boardIndex = -1
-             
-        for i in range(self.game.board.neverPlacedBlackPieces):
-            index = i + usedCounterBlack + self.game.board.unplacedBlackPieces
-            self.pieceItemsBlack[index].setPos(self.pieceStackOriginNeverBlack.x() - offset,
-                                self.pieceStackOriginNeverBlack.y() - i * (self.pieceDiameter + 3) - offset)
-            self.pieceItemsBlack[index].boardIndex = -1
+    def layoutPieceStack (self, stack, origin):
+        offset = self.pieceDiameter / 2
+        for i in range(len(stack)):
+            self.movePieceItem(stack[i], origin.x() - offset, origin.y() - i * (self.pieceDiameter + 3) - offset)
+            
+    def movePieceItem (self, piece, x, y):
+        '''
+        Moves the piece, if it isn't already there. Animated,
+        if animatePieces is set.
+        '''
+        target = QPointF(x, y)
+        if piece.target == target:
+            return
+        piece.target = target
+        
+        if piece.animation != None:
+            piece.animation.stop()
+            piece.animation = None
+            
+        if not self.animatePieces or not self.isVisible():
+            piece.setPos(target)
+            return
+        
+        animation = QVariantAnimation()
+        animation.setStartValue(piece.pos())
+        animation.setEndValue(target)
+        animation.setDuration(self.animationDuration)
+        animation.setEasingCurve(QEasingCurve.OutCubic)
+        animation.valueChanged.connect(piece.setPos)
+        animation.start()
+        piece.animation = animation
              
     def updateFocusIndicator (self):
         if self.focusedPiece == None:
             self.focusIndicator.setVisible(False)
         else:
-            point = self.focusedPiece.pos()
+            # The piece may still be on it's way
+            point = QPointF(self.focusedPiece.target)
             offset = self.focusIndicatorDiameter / 2 - self.pieceDiameter / 2
             point.setX(point.x() - offset)
             point.setY(point.y() - offset)
@@ -208,21 +270,19 @@ class QMainMuehleUI (QMainWindow):
         '''
         
         # black
-        blackPieceImg = QPixmap()
-        blackPieceImg.load("assets/muehle_piece_black.png")
-        blackPieceImg = blackPieceImg.scaledToWidth(self.pieceDiameter)
+        blackPieceImg = Resources.pixmap("assets/muehle_piece_black.png", self.pieceDiameter)
         for i in range(9):  # Black pieces
             piece = PieceGraphicsItem(blackPieceImg, Board.Black, self.pieceItemClicked)
             self.pieceItemsBlack.append(piece)
+            self.neverPlacedStacks[Board.Black].append(piece)
             self.scene.addItem(piece)
         
         # white
-        whitePieceImg = QPixmap()
-        whitePieceImg.load("assets/muehle_piece_white.png")
-        whitePieceImg = whitePieceImg.scaledToWidth(self.pieceDiameter)
+        whitePieceImg = Resources.pixmap("assets/muehle_piece_white.png", self.pieceDiameter)
         for i in range(9):  # White pieces
             piece = PieceGraphicsItem(whitePieceImg, Board.White, self.pieceItemClicked)
             self.pieceItemsWhite.append(piece)
+            self.neverPlacedStacks[Board.White].append(piece)
             self.scene.addItem(piece)
             
         # focus-indicator
@@ -326,16 +386,17 @@ class QMainMuehleUI (QMainWindow):
             self.instructionLabel.setText("White Wins")
         
         if player.pieceType == Board.White:
-            self.pieceTypeIndicator.setPixmap(QPixmap("assets/white_turn_indicator.png"))
+            self.pieceTypeIndicator.setPixmap(Resources.pixmap("assets/white_turn_indicator.png"))
         else:
-            self.pieceTypeIndicator.setPixmap(QPixmap("assets/black_turn_indicator.png"))
+            self.pieceTypeIndicator.setPixmap(Resources.pixmap("assets/black_turn_indicator.png"))
             
     @pyqtSlot()
     def playerFinishedTurn (self):
-        self.focusedPiece = None              
-        self.updatePiecePositions()
-        self.updateFocusIndicator()
-        self.updateInfoLabels()
+        with Trace.span("playerFinishedTurn", "ui"):
+            self.focusedPiece = None              
+            self.updatePiecePositions()
+            self.updateFocusIndicator()
+            self.updateInfoLabels()
         
     def pieceItemClicked (self, pieceItem):
         '''
@@ -360,6 +421,18 @@ class QMainMuehleUI (QMainWindow):
         '''
         self.instructionLabel.setText(text)
     
+    def showProgress (self, progress):
+        '''
+        Displays the progress of an AI player's search
+        (see AIPlayer.moveCalcProgressChanged)
+        '''
+        with Trace.span("showProgress", "ui"):
+            text = "%.0f%% done, depth %d, %d positions (%d/s)" % (progress["progress"], progress["depth"],
+                                                                  progress["nodes"], progress["nps"])
+            if progress["best"] != None:
+                text += ", best: " + moveToText(progress["best"])
+            self.overrideInstructionLabel(text)
+    
     @pyqtSlot()
     def showNewGameDialog (self):
         dialog = NewGameDialog(self.startNewGame)
@@ -367,7 +440,36 @@ class QMainMuehleUI (QMainWindow):
         
     @pyqtSlot()
     def showHelp (self):
-        webbrowser.open("file://" + os.path.realpath("assets/muehle_tutorial.pdf"))
+        # Only needed, when the help is opened
+        import webbrowser
+        webbrowser.open("file://" + relPathToAbs("assets/muehle_tutorial.pdf"))
+    
+    @pyqtSlot()
+    def showHints (self):
+        '''
+        Shows the best moves for the human player to move
+        (see HumanPlayer.findHints)
+        '''
+        player = self.game.getCurrentPlayer()
+        if not self.game.doesCurrentPlayerUseMouse() or player.isTurnFinished:
+            return
+        if self.hintThread != None and self.hintThread.isRunning():
+            return
+        self.overrideInstructionLabel("Looking for hints...")
+        self.hintThread = HintThread(player, Board(self.game.board), self.game.turnCounter)
+        self.hintThread.hintsFound.connect(self.hintsFound)
+        self.hintThread.hintsFailed.connect(self.overrideInstructionLabel)
+        self.hintThread.start()
+        
+    def hintsFound (self, turnCounter, hints):
+        # The turn is already over
+        if turnCounter != self.game.turnCounter:
+            return
+        if len(hints) == 0:
+            self.overrideInstructionLabel("No hints found")
+            return
+        self.overrideInstructionLabel("Hints: " + ", ".join("%s (%d)" % (moveToText(hint["move"]), hint["score"])
+                                                            for hint in hints))
     
     @pyqtSlot()
     def showVictoryWindow(self):
@@ -377,25 +479,52 @@ class QMainMuehleUI (QMainWindow):
         
     @pyqtSlot()
     def undo (self):
-        # Have to abort the game thread first, to prevent a change in 
-        # game state, while performing the undo operation
-        self.game.abort()
-        self.game.wait()
+        with Trace.span("undo", "ui"):
+            # Have to abort the game thread first, to prevent a change in 
+            # game state, while performing the undo operation
+            self.game.abort()
+            with Trace.span("wait for game thread", "ui"):
+                self.game.wait()
 
-        self.game.undo()
-        
-        # Update UI
-        self.playerFinishedTurn()
+            self.game.undo()
+            
+            # Update UI
+            self.playerFinishedTurn()
+            
+            # Restart game again
+            self.game.start(True)
         
-        # Restart game again
-        self.game.start(True)
+class HintThread (QThread):
+    '''
+    Analyses the board for a human player, without blocking the UI
+    '''
+    
+    # turn counter of the analysed position, list of hints
+    hintsFound = pyqtSignal(int, object)
+    # the engine of the player failed, with the error
+    hintsFailed = pyqtSignal(str)
+    
+    def __init__ (self, player, board, turnCounter):
+        QThread.__init__(self)
+        self.player = player
+        self.board = board
+        self.turnCounter = turnCounter
+        
+    def run (self):
+        Trace.nameThread("hints")
+        try:
+            hints = self.player.findHints(self.board)
+        except RuntimeError as e:
+            self.hintsFailed.emit(str(e))
+            return
+        self.hintsFound.emit(self.turnCounter, hints)
         
 class BoardGraphicsView (QGraphicsView):
     
     def __init__(self, parent=None):
         super(BoardGraphicsView, self).__init__(parent)
         self.setRenderHint(QPainter.HighQualityAntialiasing)
-        self.setStyleSheet("background-image: url(assets/game_table.jpg)")
+        self.setStyleSheet("background-image: url(" + relPathToAbs("assets/game_table.jpg").replace(os.sep, "/") + ")")
     
 class PieceGraphicsItem (QGraphicsPixmapItem):   
     '''
@@ -408,6 +537,10 @@ class PieceGraphicsItem (QGraphicsPixmapItem):
         self.boardIndex = -1
         self.clickHandler = clickHandler
         
+        # position the piece is at, or is animated to
+        self.target = None
+        self.animation = None
+        
     def mousePressEvent(self, mouseClickEvent):
         if self.boardIndex != -1:
             self.clickHandler(self)
@@ -438,7 +571,7 @@ class NewGameDialog (QDialog):
     
     def __init__ (self, newGameCallback):        
         QDialog.__init__(self)
-        uic.loadUi(relPathToAbs("ui/newgame.ui"), self)
+        Resources.setupForm(self, "ui/newgame.ui")
         self.show()
         
         # setup name editing for player 1
@@ -454,7 +587,8 @@ class NewGameDialog (QDialog):
         self.okButton = self.findChild(QDialogButtonBox, 'buttonBox')
         
         # setup player types
-        playerTypes = [" Human", " AI - Easy", " AI - Medium", " AI - Hard"]
+        playerTypes = [" Human", " AI - Easy", " AI - Medium", " AI - Hard",
+                       " AI (MCTS) - Easy", " AI (MCTS) - Medium", " AI (MCTS) - Hard"]
         
         self.comboBox1 = self.findChild(QComboBox, 'player1_types')
         self.comboBox1.addItems(playerTypes)
@@ -484,19 +618,19 @@ class NewGameDialog (QDialog):
             
     def accept(self):
         # Create player1 and player2 from the choosen configuration
-        if self.comboBox1.currentIndex() == 0:
-            player1 = HumanPlayer(self.player1Name, Board.White)
-        else:
-            player1 = AIPlayer(self.player1Name, Board.White, self.comboBox1.currentIndex() - 1)
-            
-        if self.comboBox2.currentIndex() == 0:
-            player2 = HumanPlayer(self.player2Name, Board.Black)
-        else:
-            player2 = AIPlayer(self.player2Name, Board.Black, self.comboBox2.currentIndex() - 1)
+        player1 = self.createPlayer(self.player1Name, Board.White, self.comboBox1.currentIndex())
+        player2 = self.createPlayer(self.player2Name, Board.Black, self.comboBox2.currentIndex())
             
         self.newGameCallback(Game(player1, player2))
         QDialog.accept(self)
         
+    def createPlayer (self, name, pieceType, playerTypeIndex):
+        if playerTypeIndex == 0:
+            return HumanPlayer(name, pieceType)
+        # Three difficulties for each algorithm
+        algorithm = "mcts" if playerTypeIndex > 3 else "alphabeta"
+        return AIPlayer(name, pieceType, (playerTypeIndex - 1) % 3, algorithm)
+        
 class GameEndDialog (QDialog):
     '''
     A Window with a Gif as background, displaying which color won the game
@@ -504,7 +638,7 @@ class GameEndDialog (QDialog):
     
     def __init__(self, gamePhase):
         QDialog.__init__(self)
-        uic.loadUi(relPathToAbs("ui/win.ui"), self)
+        Resources.setupForm(self, "ui/win.ui")
         
         label = self.findChild(QLabel, 'winner_label')
         if gamePhase == Board.WhiteWins:
@@ -522,7 +656,7 @@ class GameEndDialog (QDialog):
             label.setText("Remis")
             label.setStyleSheet("QLabel{color: gray;}")
             
-        self.findChild(QGifLabel, "widget").startMov(relPathToAbs("assets/congrats2.gif"))
+        self.findChild(QGifLabel, "widget").startMov("assets/congrats2.gif")
         self.show()
         
 class QGifLabel (QWidget):
@@ -534,7 +668,7 @@ class QGifLabel (QWidget):
         QWidget.__init__(self)
         
     def startMov (self, gifPath):
-        self.movie = QMovie(gifPath)
+        self.movie = Resources.movie(gifPath)
         self.movie.frameChanged.connect(self.repaint)
         self.movie.start() 
 
@@ -0,0 +1,315 @@
+'''
+Many games at once, held in NumPy arrays, for generating self-play
+positions in bulk. Requires NumPy.
+Every call works on all games together: legalMoves returns the legal
+actions of all games as a mask, step applies one action per game and
+ends the turns and games following the rules of Board.executeMove and
+Board.checkBoardState (including the remis by repetition and by turns
+without removal, see Board.recordPosition).
+A player, who can't do anything (a muehle closed, while the opponent
+has no piece on the board) loses, like in ProofSearch.py.
+Actions are indices into the moves of all positions:
+    from * 24 + to            move a piece (0 - 575)
+    setAction + index         set a piece (576 - 599)
+    removeAction + index      remove a piece of the opponent (600 - 623)
+actionToMove and moveToAction convert them into moves of GameBoard.py.
+'''
+import numpy as np
+
+from GameBoard import Board, BoardSnapshot, encodeMove, convRingNotationToIndex
+
+
+setAction = 24 * 24
+removeAction = setAction + 24
+actionCount = removeAction + 24
+
+def buildMuehleLines ():
+    '''
+    The points of the 16 lines and for every point the indices of the
+    two lines it's part of (the ones Board.checkForMuehle checks)
+    '''
+    lines = []
+    pointLines = [[] for index in range(24)]
+    for iRing in range(3):
+        for iNode in range(1, 8, 2):
+            lines.append([convRingNotationToIndex(iRing, iNode + offset) for offset in range(3)])
+    for iNode in range(0, 8, 2):
+        lines.append([convRingNotationToIndex(iRing, iNode) for iRing in range(3)])
+    for iLine in range(len(lines)):
+        for index in lines[iLine]:
+            pointLines[index].append(iLine)
+    return np.array(lines, dtype=np.intp), np.array(pointLines, dtype=np.intp)
+
+def buildAdjacency ():
+    '''
+    Connected points, like Board.isPieceBlocked and Board.movePiece: (24, 24)
+    '''
+    adjacency = np.zeros((24, 24), dtype=bool)
+    for index in range(24):
+        iRing, iNode = index // 8, index % 8
+        adjacency[index, convRingNotationToIndex(iRing, iNode + 1)] = True
+        adjacency[index, convRingNotationToIndex(iRing, iNode - 1)] = True
+        if iNode % 2 == 0:
+            if iRing <= 1:
+                adjacency[index, convRingNotationToIndex(iRing + 1, iNode)] = True
+            if iRing >= 1:
+                adjacency[index, convRingNotationToIndex(iRing - 1, iNode)] = True
+    return adjacency
+
+muehleLines, pointLines = buildMuehleLines()
+adjacency = buildAdjacency()
+# as matrix of floats, the product with it is done by BLAS
+adjacencyMatrix = adjacency.astype(np.float32)
+
+# the origin and destination of every move action
+moveFrom = np.repeat(np.arange(24), 24)
+moveTo = np.tile(np.arange(24), 24)
+
+# powers of 3 for the position keys of the remis rules
+keyPowers = 3 ** np.arange(24, dtype=np.int64)
+# and for the keys of Board.positionKey, which start with the first point
+snapshotPowers = keyPowers[::-1].copy()
+
+def inMuehle (values):
+    '''
+    For every point of every game, if it's part of a muehle like
+    Board.checkForMuehle (empty points count as well): (n, 24)
+    '''
+    lineValues = values[:, muehleLines]
+    full = (lineValues[:, :, 0] == lineValues[:, :, 1]) & (lineValues[:, :, 1] == lineValues[:, :, 2])
+    return full[:, pointLines[:, 0]] | full[:, pointLines[:, 1]]
+
+def actionToMove (action, pieceType):
+    '''
+    Converts an action into a move packed by encodeMove
+    '''
+    if action >= removeAction:
+        return encodeMove(Board.OpRemove, pieceType, action - removeAction)
+    if action >= setAction:
+        return encodeMove(Board.OpSet, pieceType, action - setAction)
+    return encodeMove(Board.OpMove, pieceType, action // 24, action % 24)
+
+def moveToAction (move):
+    op = move & 15
+    if op == Board.OpRemove:
+        return removeAction + ((move >> 6) & 31)
+    if op == Board.OpSet:
+        return setAction + ((move >> 6) & 31)
+    return ((move >> 6) & 31) * 24 + ((move >> 11) & 31)
+
+class VectorGame (object):
+    '''
+    count games, all starting from the start position. The arrays are
+    indexed by the game first:
+        values          occupation of the points (Board.values), (n, 24)
+        unplaced        removed pieces of white and black
+                        (Board.unplacedWhitePieces ...), (n, 2)
+        neverPlaced     pieces not set yet of white and black, (n, 2)
+        gamePhase       (n)
+        player          player to move, (n)
+    '''
+
+    def __init__ (self, count):
+        if Board.noProgressLimit == None:
+            raise ValueError("VectorGame needs Board.noProgressLimit")
+        self.count = count
+        self.values = np.full((count, 24), Board.Empty, dtype=np.int8)
+        self.unplaced = np.zeros((count, 2), dtype=np.int8)
+        self.neverPlaced = np.full((count, 2), 9, dtype=np.int8)
+        self.gamePhase = np.full(count, Board.PieceSetPhase, dtype=np.int8)
+        self.player = np.full(count, Board.White, dtype=np.int8)
+        # Positions since the last removal (see checkForRemis): the
+        # position recorded with the counter c is kept in column c
+        self.positionKeys = np.zeros((count, Board.noProgressLimit + 1), dtype=np.int64)
+        self.noProgressCounter = np.full(count, -1, dtype=np.int32)
+        self.removedPieces = np.zeros(count, dtype=np.int8)
+
+    def reset (self, games=None):
+        '''
+        Starts the games (indices or a mask, all by default) again
+        '''
+        if games is None:
+            games = slice(None)
+        self.values[games] = Board.Empty
+        self.unplaced[games] = 0
+        self.neverPlaced[games] = 9
+        self.gamePhase[games] = Board.PieceSetPhase
+        self.player[games] = Board.White
+        self.noProgressCounter[games] = -1
+        self.removedPieces[games] = 0
+
+    def running (self):
+        return self.gamePhase <= Board.PieceSetRemovePhase
+
+    def snapshots (self, games=None):
+        '''
+        The positions of the games (all or those of the mask) as
+        BoardSnapshot, e.g. to collect the positions of the self-play
+        games without duplicates, or to hand them to other processes
+        '''
+        indices = np.arange(self.count) if games is None else np.flatnonzero(games)
+        # The same key as Board.positionKey, it has less than 63 bits
+        keys = self.values[indices].astype(np.int64) @ snapshotPowers
+        for counters, column in ((self.unplaced, 0), (self.unplaced, 1),
+                                 (self.neverPlaced, 0), (self.neverPlaced, 1)):
+            keys = (keys << 4) | counters[indices, column].astype(np.int64)
+        keys = (keys << 3) | self.gamePhase[indices].astype(np.int64)
+        return [BoardSnapshot(int(key)) for key in keys]
+
+    def board (self, game):
+        '''
+        The position of one game as Board, without its history
+        '''
+        games = np.zeros(self.count, dtype=bool)
+        games[game] = True
+        return self.snapshots(games)[0].board()
+
+    def legalMoves (self):
+        '''
+        Mask of the legal actions of the player to move in every game,
+        like MinMax.nextPossibleMoves: (n, actionCount)
+        '''
+        games = np.arange(self.count)
+        values = self.values
+        player = self.player[:, None]
+        empty = values == Board.Empty
+        legal = np.zeros((self.count, actionCount), dtype=bool)
+
+        setting = (self.gamePhase == Board.PieceSetPhase) & (self.neverPlaced[games, self.player] > 0)
+        legal[:, setAction:removeAction] = empty & setting[:, None]
+
+        flying = self.unplaced[games, self.player] >= 9 - 3
+        own = (values == player) & (self.gamePhase == Board.PieceMovePhase)[:, None]
+        reachable = adjacency[None, :, :] | flying[:, None, None]
+        legal[:, :setAction] = (own[:, :, None] & empty[:, None, :] & reachable).reshape(self.count, -1)
+
+        removing = ((self.gamePhase == Board.PieceSetRemovePhase)
+                    | (self.gamePhase == Board.PieceMoveRemovePhase))
+        opponent = values == 1 - player
+        protected = inMuehle(values) & opponent
+        # Pieces of a muehle can only be removed, if there is no other one
+        anyUnsafe = (opponent & ~protected).any(axis=1)
+        legal[:, removeAction:] = opponent & (~protected | ~anyUnsafe[:, None]) & removing[:, None]
+        return legal
+
+    def randomActions (self, rng, legal=None):
+        '''
+        A random legal action for every game, -1 for games without one
+        '''
+        if legal is None:
+            legal = self.legalMoves()
+        # The legal actions of all games one after the other,
+        # pick a random one from the range of each game
+        actions = np.flatnonzero(legal) % actionCount
+        if len(actions) == 0:
+            return np.full(self.count, -1, dtype=np.int64)
+        counts = legal.sum(axis=1)
+        starts = np.cumsum(counts) - counts
+        chosen = starts + (rng.random(self.count) * counts).astype(np.int64)
+        return np.where(counts > 0, actions[np.minimum(chosen, len(actions) - 1)], -1)
+
+    def step (self, actions, legal=None):
+        '''
+        Applies one action to every game, which is still running
+        (the actions of the other games are ignored), and ends the turns
+        without a pending removal. Raises ValueError for illegal actions.
+        Returns the mask of the games, which ended with this step.
+        '''
+        actions = np.asarray(actions)
+        games = np.arange(self.count)
+        running = self.running()
+        if legal is None:
+            legal = self.legalMoves()
+
+        # Nothing to do loses the game
+        stuck = running & ~legal.any(axis=1)
+        self.gamePhase[stuck & (self.player == Board.White)] = Board.BlackWins
+        self.gamePhase[stuck & (self.player == Board.Black)] = Board.WhiteWins
+        running &= ~stuck
+
+        safeActions = np.where(running & (actions >= 0) & (actions < actionCount), actions, 0)
+        illegal = running & ((safeActions != actions) | ~legal[games, safeActions])
+        if illegal.any():
+            raise ValueError("Illegal action in game " + str(np.flatnonzero(illegal)[0]))
+
+        player = self.player
+        setting = running & (safeActions >= setAction) & (safeActions < removeAction)
+        moving = running & (safeActions < setAction)
+        removing = running & (safeActions >= removeAction)
+
+        # Sets and moves, which may close a muehle
+        target = np.where(setting, safeActions - setAction, moveTo[np.minimum(safeActions, setAction - 1)])
+        placing = setting | moving
+        self.values[moving, moveFrom[safeActions[moving]]] = Board.Empty
+        self.values[placing, target[placing]] = player[placing]
+        self.neverPlaced[setting, player[setting]] -= 1
+        closed = placing & inMuehle(self.values)[games, target]
+        self.gamePhase[closed & setting] = Board.PieceSetRemovePhase
+        self.gamePhase[closed & moving] = Board.PieceMoveRemovePhase
+
+        # Removals
+        removed = safeActions - removeAction
+        self.values[removing, removed[removing]] = Board.Empty
+        self.unplaced[removing, 1 - player[removing]] += 1
+        self.gamePhase[removing & (self.gamePhase == Board.PieceMoveRemovePhase)] = Board.PieceMovePhase
+        self.gamePhase[removing & (self.gamePhase == Board.PieceSetRemovePhase)] = Board.PieceSetPhase
+
+        turnEnded = running & ~closed
+        self.player[turnEnded] = 1 - player[turnEnded]
+        self.checkBoardStates(turnEnded)
+        return (running | stuck) & ~self.running()
+
+    def anyUnblockedPieceLeft (self):
+        '''
+        Board.anyUnblockedPieceLeft for the player to move of every game
+        '''
+        emptyNeighbour = ((self.values == Board.Empty).astype(np.float32) @ adjacencyMatrix) > 0
+        return ((self.values == self.player[:, None]) & emptyNeighbour).any(axis=1)
+
+    def checkBoardStates (self, games):
+        '''
+        Board.checkBoardState for the games of the mask, whose turns ended
+        '''
+        unblocked = self.anyUnblockedPieceLeft()
+        # The player to move loses, if all of his pieces are blocked
+        winner = np.where(self.player == Board.White, Board.BlackWins, Board.WhiteWins).astype(np.int8)
+
+        setting = games & (self.gamePhase == Board.PieceSetPhase)
+        allSet = setting & (self.neverPlaced == 0).all(axis=1)
+        self.gamePhase[allSet & ~unblocked] = winner[allSet & ~unblocked]
+        self.gamePhase[allSet & unblocked] = Board.PieceMovePhase
+        remisChecked = allSet & unblocked
+
+        moving = games & ~setting
+        self.gamePhase[moving & ~unblocked] = winner[moving & ~unblocked]
+        blackLost = moving & (self.unplaced[:, Board.Black] >= 9 - 2)
+        whiteLost = moving & ~blackLost & (self.unplaced[:, Board.White] >= 9 - 2)
+        self.gamePhase[blackLost] = Board.WhiteWins
+        self.gamePhase[whiteLost] = Board.BlackWins
+        remisChecked |= moving & (self.gamePhase == Board.PieceMovePhase)
+
+        self.checkForRemis(remisChecked)
+
+    def checkForRemis (self, games):
+        '''
+        Board.checkForRemis for the games of the mask
+        '''
+        if not games.any():
+            return
+        indices = np.flatnonzero(games)
+        # Within the positions compared (no removal in between) only the
+        # occupation and the player, who just finished his turn, can differ
+        keys = (self.values[indices].astype(np.int64) @ keyPowers) * 2 + (1 - self.player[indices])
+        removedPieces = self.unplaced[indices].sum(axis=1)
+        previous = self.noProgressCounter[indices]
+        counter = np.where((previous >= 0) & (self.removedPieces[indices] == removedPieces), previous + 1, 0)
+
+        columns = np.arange(self.positionKeys.shape[1])
+        earlier = columns[None, :] < counter[:, None]
+        repetitions = ((self.positionKeys[indices] == keys[:, None]) & earlier).sum(axis=1)
+        self.positionKeys[indices, counter] = keys
+        self.noProgressCounter[indices] = counter
+        self.removedPieces[indices] = removedPieces
+
+        remis = (repetitions + 1 >= Board.repetitionLimit) | (counter >= Board.noProgressLimit)
+        self.gamePhase[indices[remis]] = Board.Remis